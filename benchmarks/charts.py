@@ -0,0 +1,212 @@
+"""Benchmarks the "Asset value over time" chart's query, payload and rendering.
+
+A database is built by portfolio.build from a ledger (by default, the demo
+ledger), in a copy of the main function's directory. The chart's query, which
+downsamples the value of each asset with lttb() (see
+cdk/function/plugins/lttb.py), is compared with a raw query of every day's value
+of each asset, as sent to vega-lite without downsampling.
+
+For each query, this reports
+
+- median query time, through Datasette's JSON API,
+- rows returned, and size of the response body, as sent and gzip compressed, and
+- median time vega-lite takes to compile and render the chart to SVG with Node.js
+  (see render.js), as datasette-dashboards renders it in the browser.
+
+Long histories show the difference best, such as a ledger with years of daily
+balances:
+
+    python -m benchmarks.charts --ledger ~/portfolio-ledger/portfolio.beancount
+"""
+
+import argparse
+import asyncio
+import gzip
+import importlib.util
+import json
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+FUNCTION = ROOT / "cdk" / "function"
+DEMO = ROOT / "cdk" / "demo-function"
+
+# Every day's value of each asset, as the chart would need without downsampling.
+RAW = """select
+  date,
+  asset as Asset,
+  value,
+  rank
+from
+  asset_value_daily
+order by
+  date desc
+"""
+
+
+def chart(metadata: dict) -> dict:
+    """Returns the "Asset value over time" chart of metadata."""
+    return metadata["plugins"]["datasette-dashboards"]["portfolio"]["charts"]["value"]
+
+
+def spec(chart: dict, rows: list[dict]) -> dict:
+    """Returns vega-lite specification of chart, as datasette-dashboards builds it.
+
+    The chart is given a fixed size, as there's no container to fit.
+    """
+    return {
+        "$schema": "https://vega.github.io/schema/vega-lite/v5.json",
+        "description": chart["title"],
+        "width": 800,
+        "height": 400,
+        "view": {"stroke": None},
+        "config": {
+            "background": "#00000000",
+            "arc": {"innerRadius": 50},
+            "line": {"point": True},
+        },
+        "data": {"values": rows, "format": {"type": "json"}},
+        **chart["display"],
+    }
+
+
+def render(spec: dict, renders: int) -> float | None:
+    """Returns median seconds taken to render spec, or None without Node.js or
+    datasette-dashboards."""
+    module = importlib.util.find_spec("datasette_dashboards")
+    if not shutil.which("node") or module is None:
+        return None
+    process = subprocess.run(
+        [
+            "node",
+            Path(__file__).parent / "render.js",
+            Path(module.origin).parent / "static",
+            str(renders),
+        ],
+        input=json.dumps(spec),
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    return json.loads(process.stdout)["ms"] / 1000
+
+
+async def query(datasette, sql: str, requests: int) -> tuple[float, bytes]:
+    """Returns median seconds taken to answer query, and the response body."""
+    times = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = await datasette.client.get(
+            "/portfolio.json", params={"sql": sql, "_shape": "objects"}
+        )
+        times.append(time.perf_counter() - start)
+        response.raise_for_status()
+    return statistics.median(times), response.content
+
+
+def benchmark(
+    ledger=DEMO / "demo-portfolio.beancount",
+    target_allocation=DEMO / "target_allocation.sql",
+    requests=20,
+    renders=5,
+) -> dict[str, dict]:
+    """Benchmarks the raw and downsampled queries.
+
+    :param ledger: Beancount ledger.
+    :param target_allocation: SQL script creating target_allocation table.
+    :param requests: Requests of each query.
+    :param renders: Renders of each query's chart.
+
+    :return: Results of each query.
+    """
+    from datasette.app import Datasette
+
+    from portfolio import build
+
+    results = {}
+    with tempfile.TemporaryDirectory() as temporary:
+        directory = Path(temporary)
+        shutil.copy(FUNCTION / "metadata.yaml", directory)
+        shutil.copytree(FUNCTION / "plugins", directory / "plugins")
+        build.build(ledger, target_allocation, directory)
+        metadata = json.loads((directory / "metadata.json").read_text())
+        datasette = Datasette(
+            immutables=[str(directory / "portfolio.db")],
+            inspect_data=json.loads((directory / "inspect_data.json").read_text()),
+            plugins_dir=str(directory / "plugins"),
+            # Return every row of the raw query.
+            settings={"max_returned_rows": 10_000_000, "sql_time_limit_ms": 60_000},
+        )
+        # Datasette binds parameters of dashboard filters that aren't set as empty.
+        for name, sql in [("raw", RAW), ("lttb", chart(metadata)["query"])]:
+            seconds, body = asyncio.run(query(datasette, sql, requests))
+            rows = json.loads(body)["rows"]
+            results[name] = {
+                "query": seconds,
+                "rows": len(rows),
+                "size": len(body),
+                "gzip_size": len(gzip.compress(body, mtime=0)),
+                "render": render(spec(chart(metadata), rows), renders),
+            }
+    return results
+
+
+def report(results: dict[str, dict]) -> None:
+    """Prints results, and the change from the raw query."""
+    raw = results["raw"]
+
+    def change(value: float | None, base: float | None) -> str:
+        if value is None or not base or value == base:
+            return ""
+        return f" ({(value - base) / base:+.0%})"
+
+    for name, result in results.items():
+        render = (
+            f"{result['render'] * 1000:.0f} ms{change(result['render'], raw['render'])}"
+            if result["render"] is not None
+            else "skipped (needs node and datasette-dashboards)"
+        )
+        print(
+            f"{name}: {result['rows']} rows, "
+            f"query {result['query'] * 1000:.1f} ms"
+            f"{change(result['query'], raw['query'])}, "
+            f"{result['size']} bytes{change(result['size'], raw['size'])}, "
+            f"{result['gzip_size']} bytes gzipped"
+            f"{change(result['gzip_size'], raw['gzip_size'])}, "
+            f"render {render}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=benchmark.__doc__.splitlines()[0])
+    parser.add_argument(
+        "--ledger",
+        type=Path,
+        default=DEMO / "demo-portfolio.beancount",
+        help="Beancount ledger (default: demo ledger)",
+    )
+    parser.add_argument(
+        "--target-allocation",
+        type=Path,
+        default=DEMO / "target_allocation.sql",
+        help="SQL script creating target_allocation table (default: demo's)",
+    )
+    parser.add_argument(
+        "--requests", type=int, default=20, help="requests of each query"
+    )
+    parser.add_argument(
+        "--renders", type=int, default=5, help="renders of each query's chart"
+    )
+    parser.add_argument("--output", type=Path, help="file to save results to")
+    args = parser.parse_args()
+    results = benchmark(
+        args.ledger, args.target_allocation, args.requests, args.renders
+    )
+    report(results)
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(results, indent=4))
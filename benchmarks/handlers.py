@@ -0,0 +1,404 @@
+"""Benchmarks cold starts and requests of the Lambda functions' handlers.
+
+Each function directory is copied to a temporary directory, along with a database
+built from the demo ledger by portfolio.build. Each run imports the function's
+index.py in a new Python process, as a new Lambda sandbox would, against a local
+SSM stand-in. Synthetic Lambda@Edge (or API Gateway) events for the index page,
+the dashboard, each dashboard chart's query and table pages are then sent through
+the Mangum handler.
+
+For each function, this reports
+
+- import time, and time from import to the first response (cold start),
+- median and 99th percentile latency, and median CPU time, of warm requests to
+  each page,
+- size of each page's response body, as sent to CloudFront, and
+- peak memory (maximum resident set size).
+
+Requests accept Brotli and gzip compressed responses, as normalised by
+CloudFront. To measure the bytes saved by compression, and its CPU cost, compare
+with a run that doesn't accept them:
+
+    python -m benchmarks.handlers --accept-encoding identity \
+        --output benchmarks/results/identity.json
+    python -m benchmarks.handlers --baseline benchmarks/results/identity.json
+
+Results are saved as JSON, and can be compared with a baseline run:
+
+    python -m benchmarks.handlers --output benchmarks/results/baseline.json
+    # Make changes.
+    python -m benchmarks.handlers --baseline benchmarks/results/baseline.json
+"""
+
+import argparse
+import base64
+import datetime
+import http.server
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+DEMO = ROOT / "cdk" / "demo-function"
+FUNCTIONS = {
+    "function": ROOT / "cdk" / "function",
+    "demo-function": DEMO,
+}
+RESULTS = Path(__file__).parent / "results"
+
+# Values served by the SSM stand-in.
+PARAMETERS = {
+    "/portfolio/github-client-id": "client-id",
+    "/portfolio/github-client-secret": "client-secret",
+    "/portfolio/datasette-secret": "datasette-secret",
+}
+# Actor allowed by the main function's metadata.
+ACTOR = {"gh_id": "1782750"}
+
+
+class SSMHandler(http.server.BaseHTTPRequestHandler):
+    """Answers SSM GetParameter and GetParameters requests after a delay."""
+
+    protocol_version = "HTTP/1.1"
+    # Seconds to wait before answering, like a round trip to us-east-1.
+    delay = 0.0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(self.delay)
+        if self.headers["X-Amz-Target"].endswith("GetParameters"):
+            response = {
+                "Parameters": [
+                    {"Name": name, "Value": PARAMETERS[name]} for name in body["Names"]
+                ],
+                "InvalidParameters": [],
+            }
+        else:
+            response = {
+                "Parameter": {"Name": body["Name"], "Value": PARAMETERS[body["Name"]]}
+            }
+        content = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-amz-json-1.1")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+def paths(metadata: dict) -> list[str]:
+    """Returns paths of pages requested in each run."""
+    result = ["/", "/-/dashboards/portfolio"]
+    for chart in metadata["plugins"]["datasette-dashboards"]["portfolio"][
+        "charts"
+    ].values():
+        # As requested by datasette-dashboards, without filters.
+        result.append(
+            f"/{chart['db']}.json?sql={urllib.parse.quote(chart['query'], safe='')}"
+            "&&_shape=objects"
+        )
+    for table in ["normalised_balance_aud", "latest_balance", "change"]:
+        result.append(f"/portfolio/{table}")
+    return result
+
+
+def event(path: str, kind: str, cookie: str | None, accept_encoding="br,gzip") -> dict:
+    """Returns synthetic Lambda@Edge origin request or API Gateway event."""
+    path, _, query = path.partition("?")
+    headers = {"host": "portfolio.example.com", "accept-encoding": accept_encoding}
+    if cookie:
+        headers["cookie"] = cookie
+    if kind == "edge":
+        return {
+            "Records": [
+                {
+                    "cf": {
+                        "config": {"distributionDomainName": "example.cloudfront.net"},
+                        "request": {
+                            "clientIp": "192.0.2.1",
+                            "headers": {
+                                name: [{"key": name, "value": value}]
+                                for name, value in headers.items()
+                            },
+                            "method": "GET",
+                            "querystring": query,
+                            "uri": path,
+                        },
+                    }
+                }
+            ]
+        }
+    return {
+        "resource": "/{proxy+}",
+        "path": path,
+        "httpMethod": "GET",
+        "headers": headers,
+        "multiValueHeaders": {name: [value] for name, value in headers.items()},
+        "queryStringParameters": dict(urllib.parse.parse_qsl(query)) or None,
+        "multiValueQueryStringParameters": {
+            name: [value] for name, value in urllib.parse.parse_qsl(query)
+        }
+        or None,
+        "requestContext": {
+            "resourcePath": "/{proxy+}",
+            "httpMethod": "GET",
+            "path": path,
+            "identity": {"sourceIp": "192.0.2.1"},
+        },
+        "body": None,
+        "isBase64Encoded": False,
+    }
+
+
+def body_size(response: dict) -> int:
+    """Returns size in bytes of Lambda@Edge or API Gateway response's body."""
+    body = response.get("body") or ""
+    if response.get("bodyEncoding") == "base64" or response.get("isBase64Encoded"):
+        return len(base64.b64decode(body))
+    return len(body.encode())
+
+
+def run(kind: str, requests: int, accept_encoding: str) -> dict:
+    """Imports index.py from the current directory and sends it requests.
+
+    Runs in a new process for each cold start.
+    """
+    start = time.perf_counter()
+    sys.path.insert(0, os.getcwd())
+    import index
+
+    imported = time.perf_counter()
+    metadata = json.loads(Path("metadata.json").read_text())
+    response = index.handler(event("/", kind, None, accept_encoding), None)
+    first = time.perf_counter()
+
+    # Sign in, as the main function only serves its pages to me.
+    from datasette.app import Datasette
+
+    secret = PARAMETERS["/portfolio/datasette-secret"]
+    cookie = "ds_actor=" + Datasette(secret=secret).sign({"a": ACTOR}, "actor")
+    latencies = {}
+    cpu_times = {}
+    statuses = {}
+    sizes = {}
+    for path in paths(metadata):
+        latencies[path] = []
+        cpu_times[path] = []
+        for _ in range(requests):
+            request_start = time.perf_counter()
+            cpu_start = time.process_time()
+            response = index.handler(event(path, kind, cookie, accept_encoding), None)
+            latencies[path].append(time.perf_counter() - request_start)
+            cpu_times[path].append(time.process_time() - cpu_start)
+        statuses[path] = response.get("status", response.get("statusCode"))
+        sizes[path] = body_size(response)
+    return {
+        "import": imported - start,
+        "first_request": first - imported,
+        "latencies": latencies,
+        "cpu_times": cpu_times,
+        "statuses": statuses,
+        "sizes": sizes,
+        # ru_maxrss is in kilobytes on Linux.
+        "max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+
+
+def percentile(values: list[float], percent: int) -> float:
+    """Returns percentile of values."""
+    return statistics.quantiles(values, n=100, method="inclusive")[percent - 1]
+
+
+def benchmark(
+    kind="edge", runs=5, requests=20, ssm_delay=0.1, accept_encoding="br,gzip"
+) -> dict[str, dict]:
+    """Benchmarks both functions.
+
+    :param kind: Event type: "edge" (Lambda@Edge) or "api-gateway".
+    :param runs: Cold starts of each function.
+    :param requests: Warm requests to each page in each run.
+    :param ssm_delay: Seconds the SSM stand-in waits before answering.
+    :param accept_encoding: Accept-Encoding header of requests.
+
+    :return: Summary of each function's results.
+    """
+    from portfolio import build
+
+    SSMHandler.delay = ssm_delay
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), SSMHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    environment = dict(
+        os.environ,
+        AWS_ENDPOINT_URL_SSM=f"http://127.0.0.1:{server.server_port}",
+        AWS_ACCESS_KEY_ID="benchmark",
+        AWS_SECRET_ACCESS_KEY="benchmark",
+        PYTHONPATH=str(ROOT),
+    )
+
+    summary = {}
+    with tempfile.TemporaryDirectory() as temporary:
+        for name, source in FUNCTIONS.items():
+            directory = Path(temporary) / name
+            shutil.copytree(source, directory)
+            # As the deploy workflow does for the demo function.
+            shutil.copytree(
+                FUNCTIONS["function"] / "plugins",
+                directory / "plugins",
+                dirs_exist_ok=True,
+            )
+            build.build(
+                DEMO / "demo-portfolio.beancount",
+                DEMO / "target_allocation.sql",
+                directory,
+            )
+            results = []
+            for _ in range(runs):
+                # Parameters cached by a previous run would hide the SSM round trip.
+                Path("/tmp/portfolio-parameters.json").unlink(missing_ok=True)
+                process = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.handlers", "--run", kind],
+                    cwd=directory,
+                    env=dict(
+                        environment,
+                        BENCHMARK_REQUESTS=str(requests),
+                        BENCHMARK_ACCEPT_ENCODING=accept_encoding,
+                    ),
+                    capture_output=True,
+                    check=True,
+                    text=True,
+                )
+                results.append(json.loads(process.stdout.splitlines()[-1]))
+            summary[name] = {
+                "import": statistics.median(result["import"] for result in results),
+                "first_request": statistics.median(
+                    result["first_request"] for result in results
+                ),
+                "max_rss": max(result["max_rss"] for result in results),
+                "requests": {
+                    path: {
+                        "status": results[-1]["statuses"][path],
+                        "size": results[-1]["sizes"][path],
+                        "p50": percentile(latencies, 50),
+                        "p99": percentile(latencies, 99),
+                        "cpu": statistics.median(
+                            cpu_time
+                            for result in results
+                            for cpu_time in result["cpu_times"][path]
+                        ),
+                    }
+                    for path in results[0]["latencies"]
+                    for latencies in [
+                        [
+                            latency
+                            for result in results
+                            for latency in result["latencies"][path]
+                        ]
+                    ]
+                },
+            }
+    server.shutdown()
+    return summary
+
+
+def report(summary: dict, baseline: dict | None = None) -> None:
+    """Prints summary, and the change from baseline if given."""
+
+    def change(value: float, base: float | None) -> str:
+        if not base:
+            return ""
+        return f" ({(value - base) / base:+.0%})"
+
+    for name, result in summary.items():
+        base = (baseline or {}).get(name, {})
+        print(f"{name}:")
+        for key, label in [("import", "Import"), ("first_request", "First request")]:
+            print(
+                f"  {label}: {result[key] * 1000:.0f} ms{change(result[key], base.get(key))}"
+            )
+        print(
+            f"  Peak memory: {result['max_rss'] / 2**20:.0f} MiB"
+            f"{change(result['max_rss'], base.get('max_rss'))}"
+        )
+        for path, request in result["requests"].items():
+            base_request = base.get("requests", {}).get(path, {})
+            # Shorten chart queries.
+            label = path if len(path) <= 60 else path[:57] + "..."
+            print(
+                f"  {request['status']} {label}: "
+                f"p50 {request['p50'] * 1000:.1f} ms"
+                f"{change(request['p50'], base_request.get('p50'))}, "
+                f"p99 {request['p99'] * 1000:.1f} ms"
+                f"{change(request['p99'], base_request.get('p99'))}, "
+                f"CPU {request['cpu'] * 1000:.1f} ms"
+                f"{change(request['cpu'], base_request.get('cpu'))}, "
+                f"{request['size']} bytes"
+                f"{change(request['size'], base_request.get('size'))}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=benchmark.__doc__.splitlines()[0])
+    parser.add_argument(
+        "--event",
+        choices=["edge", "api-gateway"],
+        default="edge",
+        help="type of events to send (default: Lambda@Edge)",
+    )
+    parser.add_argument(
+        "--runs", type=int, default=5, help="cold starts of each function"
+    )
+    parser.add_argument(
+        "--requests",
+        type=int,
+        default=20,
+        help="warm requests to each page in each run",
+    )
+    parser.add_argument(
+        "--ssm-delay",
+        type=float,
+        default=0.1,
+        help="seconds the SSM stand-in waits before answering",
+    )
+    parser.add_argument(
+        "--accept-encoding",
+        default="br,gzip",
+        help="Accept-Encoding header of requests (default: br,gzip)",
+    )
+    parser.add_argument("--output", type=Path, help="file to save results to")
+    parser.add_argument("--baseline", type=Path, help="results to compare with")
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        print(
+            json.dumps(
+                run(
+                    args.run,
+                    int(os.environ["BENCHMARK_REQUESTS"]),
+                    os.environ["BENCHMARK_ACCEPT_ENCODING"],
+                )
+            )
+        )
+        sys.exit()
+
+    summary = benchmark(
+        args.event, args.runs, args.requests, args.ssm_delay, args.accept_encoding
+    )
+    baseline = json.loads(args.baseline.read_text()) if args.baseline else None
+    report(summary, baseline)
+    output = args.output or RESULTS / (
+        datetime.datetime.now().strftime("%Y%m%dT%H%M%S") + ".json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(summary, indent=2))
+    print(f"Saved results to {output}.")
@@ -0,0 +1,35 @@
+// Renders a vega-lite chart to SVG without a browser, as datasette-dashboards
+// renders it, and prints the median time taken in milliseconds.
+//
+//     node benchmarks/render.js <static directory> <runs> < spec.json
+//
+// The static directory is datasette-dashboards', containing vega.min.js and
+// vega-lite.min.js. spec.json is the vega-lite specification, with data.
+const fs = require('fs')
+const path = require('path')
+const vm = require('vm')
+
+const [directory, runs] = process.argv.slice(2)
+for (const filename of ['vega.min.js', 'vega-lite.min.js']) {
+  vm.runInThisContext(fs.readFileSync(path.join(directory, filename), 'utf8'))
+}
+vega.setRandom(vega.randomLCG(0))
+
+async function main () {
+  const spec = JSON.parse(fs.readFileSync(0, 'utf8'))
+  const times = []
+  let svg
+  for (let run = 0; run < Number(runs); run++) {
+    const start = performance.now()
+    const view = new vega.View(vega.parse(vegaLite.compile(spec).spec), {
+      renderer: 'none'
+    })
+    svg = await view.toSVG()
+    times.push(performance.now() - start)
+    view.finalize()
+  }
+  times.sort((a, b) => a - b)
+  console.log(JSON.stringify({ ms: times[Math.floor(times.length / 2)], svg: svg.length }))
+}
+
+main()
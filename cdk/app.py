@@ -13,6 +13,7 @@ import aws_cdk.aws_logs as logs
 import aws_cdk.aws_route53 as route53
 import aws_cdk.aws_route53_targets as route53_targets
 import aws_cdk.aws_ssm as ssm
+import jsii
 
 
 class App(cdk.App):
@@ -22,6 +23,21 @@ class App(cdk.App):
         cdk.Tags.of(self).add("project", "portfolio")
 
 
+@jsii.implements(python.ICommandHooks)
+class PrecompressHooks:
+    """Compresses static assets of Datasette and its plugins once they're installed
+    in a bundled Lambda function (see function/plugins/compression.py)."""
+
+    def before_bundling(self, input_dir: str, output_dir: str) -> list[str]:
+        return []
+
+    def after_bundling(self, input_dir: str, output_dir: str) -> list[str]:
+        return [
+            f"PYTHONPATH={output_dir} python {input_dir}/plugins/compression.py"
+            f" {output_dir}"
+        ]
+
+
 class PortfolioStack(cdk.Stack):
     def __init__(
         self,
@@ -45,7 +61,10 @@ class PortfolioStack(cdk.Stack):
             entry=str(Path(__file__).parent / "function"),
             runtime=lambda_.Runtime.PYTHON_3_12,
             # Specify Poetry version in bundler container.
-            bundling=python.BundlingOptions(build_args={"POETRY_VERSION": "1.8"}),
+            bundling=python.BundlingOptions(
+                build_args={"POETRY_VERSION": "1.8"},
+                command_hooks=PrecompressHooks(),
+            ),
             handler="handler",
             index="index.py",
             log_retention=logs.RetentionDays.ONE_MONTH,
@@ -60,7 +79,10 @@ class PortfolioStack(cdk.Stack):
             entry=str(Path(__file__).parent / "demo-function"),
             runtime=lambda_.Runtime.PYTHON_3_12,
             # Specify Poetry version in bundler container.
-            bundling=python.BundlingOptions(build_args={"POETRY_VERSION": "1.8"}),
+            bundling=python.BundlingOptions(
+                build_args={"POETRY_VERSION": "1.8"},
+                command_hooks=PrecompressHooks(),
+            ),
             handler="handler",
             index="index.py",
             log_retention=logs.RetentionDays.ONE_MONTH,
@@ -110,14 +132,24 @@ class PortfolioStack(cdk.Stack):
             self,
             "Distribution",
             default_behavior=cloudfront.BehaviorOptions(
-                # Include all query strings and cookies (auth) in cache key; default
-                # cache settings otherwise.
+                # Include all query strings and the cookies responses depend on (see
+                # cdk/function/plugins/cache_headers.py) in cache key. Other cookies
+                # would only split the cache. Responses set their own TTLs, and those
+                # that don't aren't cached.
                 cache_policy=cloudfront.CachePolicy(
                     scope=self,
                     id="CachePolicy",
-                    cookie_behavior=cloudfront.CacheCookieBehavior.all(),
+                    cookie_behavior=cloudfront.CacheCookieBehavior.allow_list(
+                        "ds_actor", "ds_csrftoken"
+                    ),
                     header_behavior=cloudfront.CacheHeaderBehavior.allow_list("Host"),
                     query_string_behavior=cloudfront.CacheQueryStringBehavior.all(),
+                    default_ttl=cdk.Duration.seconds(0),
+                    max_ttl=cdk.Duration.days(365),
+                    # Responses are compressed by the function, as negotiated by
+                    # the normalised Accept-Encoding header.
+                    enable_accept_encoding_brotli=True,
+                    enable_accept_encoding_gzip=True,
                 ),
                 edge_lambdas=[
                     cloudfront.EdgeLambda(
@@ -140,8 +172,20 @@ class PortfolioStack(cdk.Stack):
             self,
             "DemoDistribution",
             default_behavior=cloudfront.BehaviorOptions(
-                # Based cache policy includes query strings in cache key.
-                cache_policy=cloudfront.CachePolicy(scope=self, id="DemoCachePolicy"),
+                # Include all query strings, but no cookies, in cache key. The demo
+                # has no authentication, so responses don't depend on cookies.
+                cache_policy=cloudfront.CachePolicy(
+                    scope=self,
+                    id="DemoCachePolicy",
+                    cookie_behavior=cloudfront.CacheCookieBehavior.none(),
+                    query_string_behavior=cloudfront.CacheQueryStringBehavior.all(),
+                    default_ttl=cdk.Duration.seconds(0),
+                    max_ttl=cdk.Duration.days(365),
+                    # Responses are compressed by the function, as negotiated by
+                    # the normalised Accept-Encoding header.
+                    enable_accept_encoding_brotli=True,
+                    enable_accept_encoding_gzip=True,
+                ),
                 edge_lambdas=[
                     cloudfront.EdgeLambda(
                         event_type=cloudfront.LambdaEdgeEventType.ORIGIN_REQUEST,
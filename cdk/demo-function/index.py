@@ -1,23 +1,51 @@
+import concurrent.futures
 import json
 from pathlib import Path
 
-import yaml
-from datasette.app import Datasette
-from mangum import Mangum
-
-
-# Load base metadata from file.
-metadata = yaml.safe_load((Path(__file__).parent / "metadata.yaml").open())
-
-# Use Mangum to serve demo Datasette application.
-handler = Mangum(
-    Datasette(
-        # Open database in immutable mode for improved performance.
-        immutables=["portfolio.db"],
-        # Load precalculated counts from file.
-        inspect_data=json.load((Path(__file__).parent / "inspect_data.json").open()),
-        metadata=metadata,
-    ).app(),
-    # Content-Length header is not allowed in Lambda@Edge responses.
-    exclude_headers=["Content-Length"],
-)
+
+def create_handler():
+    """Returns Mangum handler serving demo Datasette application."""
+    from datasette.app import Datasette
+    from mangum import Mangum
+
+    # Load base metadata, compiled from metadata.yaml by portfolio.build.
+    metadata = json.loads((Path(__file__).parent / "metadata.json").read_text())
+
+    # Use Mangum to serve demo Datasette application.
+    return Mangum(
+        Datasette(
+            # Open database in immutable mode for improved performance.
+            immutables=["portfolio.db"],
+            # Load precalculated counts from file.
+            inspect_data=json.loads(
+                (Path(__file__).parent / "inspect_data.json").read_text()
+            ),
+            metadata=metadata,
+            # Serve precomputed dashboard chart query results.
+            plugins_dir=str(Path(__file__).parent / "plugins"),
+        ).app(),
+        # Content-Length header is not allowed in Lambda@Edge responses.
+        exclude_headers=["Content-Length"],
+    )
+
+
+# Construct Datasette application as soon as the sandbox starts, rather than on the
+# first request.
+executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+handler_future = executor.submit(create_handler)
+
+
+def handler(event, context):
+    global handler_future
+    # If constructing the application failed, start again, as Lambda retries a
+    # failed init. Otherwise every request would fail until the sandbox is recycled.
+    if handler_future.done() and handler_future.exception():
+        handler_future = executor.submit(create_handler)
+    response = handler_future.result()(event, context)
+    # Mangum marks base64 encoded bodies, such as compressed responses, as API
+    # Gateway expects. Lambda@Edge expects bodyEncoding instead.
+    if "Records" in event:
+        response["bodyEncoding"] = (
+            "base64" if response.pop("isBase64Encoded", False) else "text"
+        )
+    return response
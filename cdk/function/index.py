@@ -1,63 +1,132 @@
+import concurrent.futures
 import json
 import os
+import time
 from pathlib import Path
 
-import boto3
-import yaml
-from datasette.app import Datasette
-from mangum import Mangum
+# Parameters read from SSM, by environment variable they're stored in.
+PARAMETERS = {
+    "GITHUB_CLIENT_ID": "/portfolio/github-client-id",
+    "GITHUB_CLIENT_SECRET": "/portfolio/github-client-secret",
+    "DATASETTE_SECRET": "/portfolio/datasette-secret",
+}
 
+# Parameters are cached in /tmp, which lasts as long as the Lambda sandbox. Cached
+# parameters are fetched again after this many seconds, so rotated secrets are
+# picked up.
+PARAMETERS_CACHE = Path("/tmp/portfolio-parameters.json")
+PARAMETERS_TTL = 15 * 60
 
-# Load base metadata from file. This is enough to run locally without authentication
-# and authorization. Additional production metadata is added below.
-metadata = yaml.safe_load((Path(__file__).parent / "metadata.yaml").open())
 
-# Restrict access to me.
-metadata["allow"] = {
-    "gh_id": "1782750",
-}
+def get_parameters() -> dict[str, str]:
+    """Returns parameters from the cache in /tmp, or SSM if they have expired."""
+    try:
+        if time.time() - PARAMETERS_CACHE.stat().st_mtime < PARAMETERS_TTL:
+            return json.loads(PARAMETERS_CACHE.read_text())
+    except (FileNotFoundError, ValueError):
+        pass
+
+    # boto3 is slow to import, so only import it when needed.
+    import boto3
+
+    # Configure SSM client to use region us-east-1. The parameters are in us-east-1,
+    # but Lambda@Edge functions may execute in any region. Get all parameters in
+    # one round trip.
+    response = boto3.client("ssm", region_name="us-east-1").get_parameters(
+        Names=list(PARAMETERS.values()), WithDecryption=True
+    )
+    if response["InvalidParameters"]:
+        raise KeyError(f"Parameters not found: {response['InvalidParameters']}")
+    values = {
+        parameter["Name"]: parameter["Value"] for parameter in response["Parameters"]
+    }
+    parameters = {name: values[parameter] for name, parameter in PARAMETERS.items()}
+
+    # Only the function's user may read the secrets.
+    temporary = PARAMETERS_CACHE.with_suffix(f".{os.getpid()}.tmp")
+    with open(
+        os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w"
+    ) as file:
+        json.dump(parameters, file)
+    temporary.replace(PARAMETERS_CACHE)
+    return parameters
+
+
+def create_handler():
+    """Returns Mangum handler serving Datasette application."""
+    from datasette.app import Datasette
+    from mangum import Mangum
 
-# Configure GitHub authentication and redirect plugins.
-metadata["plugins"].update(
-    {
-        "datasette-auth-github": {
-            # Read secret configuration values from environment variables. This
-            # prevents values being exposed on the `/-/metadata` page.
-            "client_id": {"$env": "GITHUB_CLIENT_ID"},
-            "client_secret": {"$env": "GITHUB_CLIENT_SECRET"},
-        },
-        "datasette-redirect-forbidden": {
-            "redirect_to": "/-/github-auth-start",
-        },
+    # Load base metadata, compiled from metadata.yaml by portfolio.build. This is
+    # enough to run locally without authentication and authorization. Additional
+    # production metadata is added below.
+    metadata = json.loads((Path(__file__).parent / "metadata.json").read_text())
+
+    # Restrict access to me.
+    metadata["allow"] = {
+        "gh_id": "1782750",
     }
-)
-
-# Configure SSM client to use region us-east-1. The parameters are in us-east-1,
-# but Lambda@Edge functions may execute in any region.
-ssm = boto3.client("ssm", region_name="us-east-1")
-
-# Store GitHub client ID and secret in environment variables. These environment
-# variables are referenced in Datasette metadata above.
-os.environ["GITHUB_CLIENT_ID"] = ssm.get_parameter(Name="/portfolio/github-client-id")[
-    "Parameter"
-]["Value"]
-os.environ["GITHUB_CLIENT_SECRET"] = ssm.get_parameter(
-    Name="/portfolio/github-client-secret", WithDecryption=True
-)["Parameter"]["Value"]
-
-# Use Mangum to serve Datasette application.
-handler = Mangum(
-    Datasette(
-        # Open database in immutable mode for improved performance.
-        immutables=["portfolio.db"],
-        # Load precalculated counts from file.
-        inspect_data=json.load((Path(__file__).parent / "inspect_data.json").open()),
-        metadata=metadata,
-        # Import Datasette secret from SSM parameter.
-        secret=ssm.get_parameter(
-            Name="/portfolio/datasette-secret", WithDecryption=True
-        )["Parameter"]["Value"],
-    ).app(),
-    # Content-Length header is not allowed in Lambda@Edge responses.
-    exclude_headers=["Content-Length"],
-)
+
+    # Configure GitHub authentication and redirect plugins.
+    metadata["plugins"].update(
+        {
+            "datasette-auth-github": {
+                # Read secret configuration values from environment variables. This
+                # prevents values being exposed on the `/-/metadata` page.
+                "client_id": {"$env": "GITHUB_CLIENT_ID"},
+                "client_secret": {"$env": "GITHUB_CLIENT_SECRET"},
+            },
+            "datasette-redirect-forbidden": {
+                "redirect_to": "/-/github-auth-start",
+            },
+        }
+    )
+
+    # Store GitHub client ID and secret in environment variables. These environment
+    # variables are referenced in Datasette metadata above.
+    parameters = parameters_future.result()
+    os.environ["GITHUB_CLIENT_ID"] = parameters["GITHUB_CLIENT_ID"]
+    os.environ["GITHUB_CLIENT_SECRET"] = parameters["GITHUB_CLIENT_SECRET"]
+
+    # Use Mangum to serve Datasette application.
+    return Mangum(
+        Datasette(
+            # Open database in immutable mode for improved performance.
+            immutables=["portfolio.db"],
+            # Load precalculated counts from file.
+            inspect_data=json.loads(
+                (Path(__file__).parent / "inspect_data.json").read_text()
+            ),
+            metadata=metadata,
+            # Serve precomputed dashboard chart query results.
+            plugins_dir=str(Path(__file__).parent / "plugins"),
+            secret=parameters["DATASETTE_SECRET"],
+        ).app(),
+        # Content-Length header is not allowed in Lambda@Edge responses.
+        exclude_headers=["Content-Length"],
+    )
+
+
+# Fetch parameters while Datasette is imported and its application is constructed.
+# Both start as soon as the sandbox starts, rather than on the first request.
+executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+parameters_future = executor.submit(get_parameters)
+handler_future = executor.submit(create_handler)
+
+
+def handler(event, context):
+    global parameters_future, handler_future
+    # If fetching parameters or constructing the application failed (e.g., SSM
+    # throttled the request), start again, as Lambda retries a failed init.
+    # Otherwise every request would fail until the sandbox is recycled.
+    if handler_future.done() and handler_future.exception():
+        parameters_future = executor.submit(get_parameters)
+        handler_future = executor.submit(create_handler)
+    response = handler_future.result()(event, context)
+    # Mangum marks base64 encoded bodies, such as compressed responses, as API
+    # Gateway expects. Lambda@Edge expects bodyEncoding instead.
+    if "Records" in event:
+        response["bodyEncoding"] = (
+            "base64" if response.pop("isBase64Encoded", False) else "text"
+        )
+    return response
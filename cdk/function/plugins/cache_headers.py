@@ -0,0 +1,160 @@
+"""Sets caching headers, so that CloudFront serves most requests from its cache.
+
+Databases are immutable, and served content only changes when the functions are
+deployed, which invalidates CloudFront's caches. So successful responses are
+cached at the edge until the next deploy, or for a day when requested by a
+signed-in actor. CloudFront's cache key only includes the cookies responses depend
+on (see cdk/app.py).
+
+Successful responses also get a strong ETag, derived from the database hashes,
+metadata, plugins and the parts of the request the response depends on. Requests
+with a matching If-None-Match header are answered with 304 without running
+Datasette's view, so revalidating an expired response is cheap.
+"""
+
+import hashlib
+import json
+from functools import wraps
+from pathlib import Path
+
+from datasette import hookimpl
+from datasette.plugins import get_plugins
+from datasette.utils.asgi import Request
+
+# Cache-Control of static assets. Plugin assets' URLs don't change when plugins are
+# upgraded, so browsers check for new versions every hour.
+STATIC = "public, max-age=3600, s-maxage=31536000"
+# Cache-Control of pages anyone may view, such as the demo's.
+PUBLIC = "public, max-age=300, s-maxage=31536000"
+# Cache-Control of pages viewed by a signed-in actor. Browsers revalidate every
+# request, which CloudFront answers from its cache.
+AUTHENTICATED = "max-age=0, s-maxage=86400, must-revalidate"
+# Cache-Control of errors, redirects and responses setting cookies.
+UNCACHED = "no-store"
+# Cache-Control set by datasette-hashed-urls (and precomputed_charts) for hashed
+# database URLs, which change with the database. This is kept.
+HASHED = "max-age=31536000, public"
+
+# Cookies that responses depend on: the signed actor, and the CSRF token in the
+# actor menu's log out form.
+COOKIES = ["ds_actor", "ds_csrftoken"]
+
+
+def _fingerprint(datasette) -> str | None:
+    """Returns hash of everything responses depend on other than the request, or
+    None if a database is mutable."""
+    if not hasattr(datasette, "_cache_headers_fingerprint"):
+        digest = hashlib.sha256()
+        for name, database in sorted(datasette.databases.items()):
+            if name == "_internal":
+                continue
+            if database.is_mutable:
+                datasette._cache_headers_fingerprint = None
+                return None
+            digest.update(f"{name}\0{database.hash}\0".encode())
+        digest.update(json.dumps(datasette.metadata(), sort_keys=True).encode())
+        digest.update(json.dumps(get_plugins(), sort_keys=True).encode())
+        if datasette.plugins_dir:
+            for path in sorted(Path(datasette.plugins_dir).glob("*.py")):
+                digest.update(path.read_bytes())
+        datasette._cache_headers_fingerprint = digest.hexdigest()
+    return datasette._cache_headers_fingerprint
+
+
+def etag(datasette, request: Request) -> str | None:
+    """Returns ETag of a successful response to request, or None if responses may
+    change."""
+    fingerprint = _fingerprint(datasette)
+    if fingerprint is None:
+        return None
+    digest = hashlib.sha256()
+    for value in [
+        request.host,
+        request.path,
+        request.query_string,
+        # Responses are compressed as negotiated by Accept-Encoding (see
+        # compression.py), and each encoding needs its own strong ETag.
+        request.headers.get("accept-encoding", ""),
+        *(request.cookies.get(cookie, "") for cookie in COOKIES),
+    ]:
+        digest.update(f"{value}\0".encode())
+    return f'"{fingerprint[:16]}-{digest.hexdigest()[:16]}"'
+
+
+def cache_control(request: Request) -> str:
+    """Returns Cache-Control of a successful response to request."""
+    if request.path.startswith(("/-/static/", "/-/static-plugins/")):
+        return STATIC
+    if "ds_actor" in request.cookies:
+        return AUTHENTICATED
+    return PUBLIC
+
+
+# Wrap other plugins' ASGI wrappers, such as precomputed_charts and compression,
+# so their responses get caching headers too.
+@hookimpl(trylast=True)
+def asgi_wrapper(datasette):
+    def wrap_with_cache_headers(app):
+        @wraps(app)
+        async def cache_headers(scope, receive, send):
+            if scope.get("type") != "http" or scope.get("method") not in (
+                "GET",
+                "HEAD",
+            ):
+                return await app(scope, receive, send)
+            request = Request(scope, receive)
+            request_etag = etag(datasette, request)
+            control = cache_control(request)
+
+            if_none_match = request.headers.get("if-none-match", "")
+            if request_etag and request_etag in (
+                value.strip() for value in if_none_match.split(",")
+            ):
+                await send(
+                    {
+                        "type": "http.response.start",
+                        "status": 304,
+                        "headers": [
+                            [b"etag", request_etag.encode()],
+                            [b"cache-control", control.encode()],
+                        ],
+                    }
+                )
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+            async def wrapped_send(event):
+                if event["type"] == "http.response.start":
+                    headers = {
+                        name.lower(): value for name, value in event.get("headers", [])
+                    }
+                    cacheable = (
+                        event["status"] in (200, 304) and b"set-cookie" not in headers
+                    )
+                    if not cacheable:
+                        value = UNCACHED
+                    elif headers.get(b"cache-control") == HASHED.encode():
+                        value = HASHED
+                    else:
+                        value = control
+                    event_headers = [
+                        [name, header]
+                        for name, header in event.get("headers", [])
+                        if name.lower() != b"cache-control"
+                    ]
+                    event_headers.append([b"cache-control", value.encode()])
+                    if (
+                        cacheable
+                        and event["status"] == 200
+                        and request_etag
+                        and b"etag" not in headers
+                    ):
+                        event_headers.append([b"etag", request_etag.encode()])
+                    event = dict(event, headers=event_headers)
+                await send(event)
+
+            await app(scope, receive, wrapped_send)
+
+        return cache_headers
+
+    return wrap_with_cache_headers
@@ -0,0 +1,200 @@
+"""Compresses responses, as negotiated by the request's Accept-Encoding header.
+
+Lambda@Edge limits the size of generated responses, and responses are mostly
+text: the index page inlines the dashboard HTML, and table pages and chart query
+results are HTML and JSON. These are compressed with gzip, or with Brotli if the
+brotli package is installed. Responses smaller than MINIMUM_SIZE are sent as they
+are, as compressing them saves little.
+
+Datasette's and plugins' static assets, such as vega.min.js, don't change between
+deploys. They're compressed at the highest level when the Lambda function is
+bundled (see cdk/app.py), by running this module:
+
+    python plugins/compression.py /asset-output
+
+Precompressed assets are then served instead of compressing them on each request.
+"""
+
+import functools
+import gzip
+import sys
+from pathlib import Path
+
+import datasette
+from datasette import hookimpl
+from datasette.plugins import get_plugins
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Responses smaller than this many bytes aren't compressed.
+MINIMUM_SIZE = 1024
+
+# Content types of compressible responses.
+COMPRESSIBLE = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+
+# Compression levels used for responses, trading size for CPU time, and for static
+# assets, which are compressed once.
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+PRECOMPRESSED_GZIP_LEVEL = 9
+PRECOMPRESSED_BROTLI_QUALITY = 11
+
+# File name suffix of precompressed static assets, by content coding.
+SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+def encoding(accept_encoding: str) -> str | None:
+    """Returns content coding to compress response with, or None to not compress.
+
+    :param accept_encoding: Request's Accept-Encoding header.
+    """
+    accepted = set()
+    for value in accept_encoding.split(","):
+        coding, _, parameters = value.strip().partition(";")
+        quality = parameters.strip().removeprefix("q=")
+        try:
+            if parameters and float(quality) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding.strip().lower())
+    if brotli and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, coding: str) -> bytes:
+    """Returns body compressed with content coding."""
+    if coding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+@functools.cache
+def static_roots() -> dict[str, Path]:
+    """Returns directory of static assets served under each URL path prefix."""
+    roots = {"/-/static/": Path(datasette.__file__).parent / "static"}
+    for plugin in get_plugins():
+        if plugin["static_path"]:
+            for name in {plugin["name"], plugin["name"].replace("-", "_")}:
+                roots[f"/-/static-plugins/{name}/"] = Path(plugin["static_path"])
+    return roots
+
+
+def precompressed(path: str, coding: str) -> bytes | None:
+    """Returns static asset at URL path, precompressed with content coding, if any."""
+    for prefix, root in static_roots().items():
+        if path.startswith(prefix):
+            filename = (root / path.removeprefix(prefix)).resolve()
+            # Only serve files within the static directory.
+            if not filename.is_relative_to(root.resolve()):
+                return None
+            filename = filename.with_name(filename.name + SUFFIXES[coding])
+            return filename.read_bytes() if filename.is_file() else None
+    return None
+
+
+def precompress(directory: Path) -> None:
+    """Compresses static assets of Datasette and plugins installed in directory.
+
+    Each asset is saved alongside the original, with a .gz (and, if brotli is
+    installed, a .br) suffix.
+    """
+    for root in directory.glob("*/static"):
+        for filename in root.rglob("*"):
+            if (
+                not filename.is_file()
+                or filename.suffix in SUFFIXES.values()
+                or filename.stat().st_size < MINIMUM_SIZE
+            ):
+                continue
+            body = filename.read_bytes()
+            (filename.with_name(filename.name + ".gz")).write_bytes(
+                gzip.compress(body, compresslevel=PRECOMPRESSED_GZIP_LEVEL, mtime=0)
+            )
+            if brotli:
+                (filename.with_name(filename.name + ".br")).write_bytes(
+                    brotli.compress(body, quality=PRECOMPRESSED_BROTLI_QUALITY)
+                )
+
+
+@hookimpl
+def asgi_wrapper(datasette):
+    def wrap_with_compression(app):
+        @functools.wraps(app)
+        async def compression(scope, receive, send):
+            if scope.get("type") != "http" or scope.get("method") != "GET":
+                return await app(scope, receive, send)
+            headers = dict(scope.get("headers", []))
+            coding = encoding(headers.get(b"accept-encoding", b"").decode("latin1"))
+
+            start = None
+            chunks = []
+
+            async def wrapped_send(event):
+                nonlocal start
+                if start is None and event["type"] == "http.response.start":
+                    response_headers = {
+                        name.lower(): value for name, value in event.get("headers", [])
+                    }
+                    content_type = response_headers.get(b"content-type", b"").decode()
+                    if (
+                        b"content-encoding" in response_headers
+                        or not content_type.startswith(COMPRESSIBLE)
+                    ):
+                        # Send as is, and don't buffer the body.
+                        start = False
+                        return await send(event)
+                    start = event
+                    return
+                if not start or event["type"] != "http.response.body":
+                    return await send(event)
+
+                # Buffer the whole body, as Mangum does.
+                chunks.append(event.get("body", b""))
+                if event.get("more_body"):
+                    return
+                body = b"".join(chunks)
+                response_headers = [
+                    [name, value]
+                    for name, value in start.get("headers", [])
+                    if name.lower() not in (b"content-length", b"vary")
+                ]
+                # Mangum keeps one value of each header in Lambda@Edge responses.
+                vary = [
+                    value
+                    for name, value in start.get("headers", [])
+                    if name.lower() == b"vary"
+                ]
+                response_headers.append(
+                    [b"vary", b", ".join([*vary, b"Accept-Encoding"])]
+                )
+                if coding and start["status"] == 200 and len(body) >= MINIMUM_SIZE:
+                    body = precompressed(scope["path"], coding) or compress(
+                        body, coding
+                    )
+                    response_headers.append([b"content-encoding", coding.encode()])
+                response_headers.append([b"content-length", str(len(body)).encode()])
+                await send(dict(start, headers=response_headers))
+                await send({"type": "http.response.body", "body": body})
+
+            await app(scope, receive, wrapped_send)
+
+        return compression
+
+    return wrap_with_compression
+
+
+if __name__ == "__main__":
+    precompress(Path(sys.argv[1]))
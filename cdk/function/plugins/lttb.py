@@ -0,0 +1,93 @@
+"""Registers lttb(), an SQL aggregate function downsampling time series.
+
+Charts of long histories send every point to the browser, although a chart a few
+hundred pixels wide can't show them all. Largest-Triangle-Three-Buckets (Sveinn
+Steinarsson, "Downsampling Time Series for Visual Representation", 2013) keeps
+the first and last points, and from each bucket of points in between, the point
+forming the largest triangle with the point kept from the previous bucket and
+the average of the next bucket. This keeps peaks and troughs, so the downsampled
+series looks like the original.
+
+    select lttb(date, value, 300) from asset_value_daily where asset = 'VDHG'
+
+returns the kept points as a JSON array of [x, y] arrays, in order of x. x may be
+a number or an ISO 8601 date. Expand the result with json_each() to select rows.
+"""
+
+import datetime
+import json
+
+from datasette import hookimpl
+
+
+def downsample(points: list[tuple[float, float]], threshold: int) -> list[int]:
+    """Returns indexes of points kept by Largest-Triangle-Three-Buckets.
+
+    :param points: (x, y) points, in order of x.
+    :param threshold: Number of points to keep, at least 3. All points are kept if
+        there are no more than this.
+    """
+    if threshold < 3:
+        raise ValueError(f"threshold must be at least 3, not {threshold}")
+    if len(points) <= threshold:
+        return list(range(len(points)))
+
+    # Points between the first and last are split into threshold - 2 buckets.
+    size = (len(points) - 2) / (threshold - 2)
+    kept = [0]
+    for bucket in range(threshold - 2):
+        start = int(bucket * size) + 1
+        end = int((bucket + 1) * size) + 1
+        # Average of the next bucket, which is the last point for the last bucket.
+        following = points[end : min(int((bucket + 2) * size) + 1, len(points))]
+        average_x = sum(x for x, _ in following) / len(following)
+        average_y = sum(y for _, y in following) / len(following)
+        previous_x, previous_y = points[kept[-1]]
+        # Twice the area of the triangle formed with each point in the bucket.
+        kept.append(
+            max(
+                range(start, end),
+                key=lambda index: abs(
+                    (previous_x - average_x) * (points[index][1] - previous_y)
+                    - (previous_x - points[index][0]) * (average_y - previous_y)
+                ),
+            )
+        )
+    kept.append(len(points) - 1)
+    return kept
+
+
+def _number(x: float | str) -> float:
+    """Returns x, or days since 0001-01-01 if x is an ISO 8601 date."""
+    if isinstance(x, str):
+        value = datetime.datetime.fromisoformat(x)
+        return value.toordinal() + (
+            value - datetime.datetime.combine(value.date(), datetime.time())
+        ) / datetime.timedelta(days=1)
+    return x
+
+
+class LTTB:
+    """lttb(x, y, threshold) aggregate function."""
+
+    def __init__(self):
+        self.points = []
+        self.threshold = None
+
+    def step(self, x, y, threshold):
+        if x is None or y is None:
+            return
+        self.points.append((x, y))
+        self.threshold = threshold
+
+    def finalize(self) -> str:
+        points = sorted(self.points, key=lambda point: _number(point[0]))
+        if not points:
+            return "[]"
+        kept = downsample([(_number(x), y) for x, y in points], self.threshold)
+        return json.dumps([points[index] for index in kept])
+
+
+@hookimpl
+def prepare_connection(conn):
+    conn.create_aggregate("lttb", 3, LTTB)
@@ -0,0 +1,125 @@
+"""Serves dashboard chart query results precomputed by portfolio.build.
+
+Databases are immutable, so the results of the dashboard chart queries in
+metadata.yaml never change between deploys. portfolio.build runs each query ahead
+of time and saves Datasette's JSON response in charts.json, next to the database.
+Requests for these queries, as sent by datasette-dashboards, are answered from
+that file instead of running SQL, once the actor is allowed to run the query.
+
+Requests to hashed database URLs (see datasette-hashed-urls) are cached for a
+year, as the URL changes with the database.
+"""
+
+import hashlib
+import json
+from functools import wraps
+from pathlib import Path
+from urllib.parse import parse_qsl
+
+from datasette import Forbidden, hookimpl
+from datasette.plugins import pm
+from datasette.utils import await_me_maybe
+from datasette.utils.asgi import Request
+
+# Query string parameters sent by datasette-dashboards, other than sql.
+PARAMETERS = {"_shape": "objects"}
+
+
+def key(sql: str) -> str:
+    """Returns key of query's result in charts.json."""
+    return hashlib.sha256(sql.encode()).hexdigest()
+
+
+def _charts(datasette) -> dict[str, dict[str, str]]:
+    """Returns precomputed responses of each database, by query key."""
+    if not hasattr(datasette, "_precomputed_charts"):
+        datasette._precomputed_charts = {}
+        for name, database in datasette.databases.items():
+            if not database.path or database.is_mutable:
+                continue
+            path = Path(database.path).parent / "charts.json"
+            if path.exists():
+                datasette._precomputed_charts[name] = json.loads(path.read_text()).get(
+                    name, {}
+                )
+    return datasette._precomputed_charts
+
+
+async def _allowed(datasette, scope, receive, database: str) -> bool:
+    """Returns True if request's actor may run SQL queries against database.
+
+    Resolves the actor as Datasette's router does, and checks the permissions
+    Datasette's query view checks.
+    """
+    request = Request(scope, receive)
+    actor = None
+    for actor in pm.hook.actor_from_request(datasette=datasette, request=request):
+        actor = await await_me_maybe(actor)
+        if actor:
+            break
+    try:
+        await datasette.ensure_permissions(
+            actor or None,
+            [
+                ("execute-sql", database),
+                ("view-database", database),
+                "view-instance",
+            ],
+        )
+    except Forbidden:
+        return False
+    return True
+
+
+# Answer requests after other plugins' ASGI wrappers, such as cache_headers and
+# compression, so they apply to precomputed results too.
+@hookimpl(tryfirst=True)
+def asgi_wrapper(datasette):
+    def wrap_with_precomputed_charts(app):
+        @wraps(app)
+        async def precomputed_charts(scope, receive, send):
+            if scope.get("type") != "http" or scope.get("method") != "GET":
+                return await app(scope, receive, send)
+            # Match /<database route>.json?sql=...&_shape=objects. datasette-dashboards
+            # may add empty parameters.
+            route = scope["path"].lstrip("/").removesuffix(".json")
+            parameters = dict(
+                (name, value)
+                for name, value in parse_qsl(scope.get("query_string", b"").decode())
+                if name
+            )
+            sql = parameters.pop("sql", None)
+            database = next(
+                (
+                    database
+                    for database in datasette.databases.values()
+                    if database.route == route
+                ),
+                None,
+            )
+            if (
+                not scope["path"].endswith(".json")
+                or sql is None
+                or parameters != PARAMETERS
+                or database is None
+            ):
+                return await app(scope, receive, send)
+            body = _charts(datasette).get(database.name, {}).get(key(sql))
+            if body is None or not await _allowed(
+                datasette, scope, receive, database.name
+            ):
+                return await app(scope, receive, send)
+
+            headers = [[b"content-type", b"application/json; charset=utf-8"]]
+            if database.route != database.name:
+                headers.append([b"cache-control", b"max-age=31536000, public"])
+            if datasette.cors:
+                headers.append([b"access-control-allow-origin", b"*"])
+            await send(
+                {"type": "http.response.start", "status": 200, "headers": headers}
+            )
+            await send({"type": "http.response.body", "body": body.encode()})
+
+        return precomputed_charts
+
+    return wrap_with_precomputed_charts
@@ -0,0 +1,200 @@
+"""Serves /-/rebalance.json, answering what-if questions about rebalancing.
+
+The change table in summary_tables.sql says how to rebalance the latest balances to the
+target allocation. This endpoint answers the same question for other targets, or
+after contributing or withdrawing an amount, without rebuilding the database:
+
+    /-/rebalance.json?contribution=5000&target=VDHG:0.7,BTC:0.14
+
+Each contribution parameter is an amount in AUD, negative for a withdrawal, and
+each target parameter overrides the target weights of the listed assets. Every
+combination of the given contributions and targets is a scenario, and a batch of
+scenarios is evaluated in one request, as one NumPy array of scenarios × assets.
+The response has the buy and sell actions of each scenario, with amounts rounded
+as the rebalance chart in metadata.yaml rounds them.
+
+Holdings and targets are read from the immutable database once per Datasette
+instance (once per warm Lambda function), so a request is only array arithmetic.
+"""
+
+import math
+
+import numpy as np
+from datasette import Forbidden, hookimpl
+from datasette.utils.asgi import Response
+
+DATABASE = "portfolio"
+
+# Latest value and price of each asset, and its target weight, as in the change
+# table.
+HOLDINGS_SQL = """
+select
+  latest_balance.asset,
+  price_aud,
+  sum(value_number) as value,
+  target
+from
+  latest_balance
+  join target_allocation on latest_balance.asset = target_allocation.asset
+where
+  -- Don't treat debt as cash.
+  account not like 'Liabilities:StateCustodians:%'
+group by
+  latest_balance.asset
+order by
+  target_allocation.rowid
+"""
+
+# Decimal places of amounts bought or sold, by asset. Other assets are bought and
+# sold in whole units.
+DECIMALS = {"BTC": 4}
+
+# Assets that are never bought or sold.
+NO_ACTION = {"Cash"}
+
+# Scenarios evaluated in one request, at most. Each adds about 1.3 KB to the
+# response, and Lambda@Edge limits generated responses to 1 MB.
+MAX_SCENARIOS = 100
+
+
+def parse_target(value: str) -> dict[str, float]:
+    """Returns target weights of a target parameter, such as "VDHG:0.7,BTC:0.14".
+
+    :raises ValueError: If value isn't a comma-separated list of asset:weight.
+    """
+    target = {}
+    for item in value.split(","):
+        asset, separator, weight = item.partition(":")
+        if not separator or not asset.strip():
+            raise ValueError(f"Expected asset:weight, not {item!r}")
+        target[asset.strip()] = float(weight)
+    return target
+
+
+def scenarios(
+    holdings: list[dict],
+    contributions: list[float] = (0,),
+    targets: list[dict[str, float]] = ({},),
+) -> list[dict]:
+    """Returns actions required to rebalance holdings in each scenario.
+
+    There is a scenario for each combination of target and contribution, in order
+    of targets, then contributions. Scenarios are rows of a scenarios × assets array,
+    so all are evaluated at once.
+
+    :param holdings: Asset, price_aud, value and target of each asset.
+    :param contributions: Amounts in AUD contributed, or withdrawn if negative.
+    :param targets: Target weights overriding those of holdings. Assets that are
+        never bought or sold (Cash) have no action, but their change is given.
+    :raises ValueError: If a target names unknown assets, or weights don't sum to 1.
+    """
+    assets = [holding["asset"] for holding in holdings]
+    unknown = set().union(*targets) - set(assets)
+    if unknown:
+        raise ValueError(f"Unknown assets: {', '.join(sorted(unknown))}")
+    # Target weights of each scenario.
+    weights = np.repeat(
+        [
+            [target.get(holding["asset"], holding["target"]) for holding in holdings]
+            for target in targets
+        ],
+        len(contributions),
+        axis=0,
+    )
+    for total_weight in weights.sum(axis=1):
+        if not math.isclose(total_weight, 1, abs_tol=1e-6):
+            raise ValueError(f"Target weights sum to {total_weight:g}, not 1")
+    values = np.array([holding["value"] for holding in holdings], dtype=float)
+    prices = np.array([holding["price_aud"] for holding in holdings], dtype=float)
+    # Contribution of each scenario.
+    contributions = np.tile(np.asarray(contributions, float), len(targets))
+    totals = values.sum() + contributions
+    if (totals <= 0).any():
+        raise ValueError("Withdrawal exceeds total value")
+
+    change_values = weights * totals[:, np.newaxis] - values
+    # Round half away from zero, as SQLite's round() does.
+    scale = 10.0 ** np.array([DECIMALS.get(asset, 0) for asset in assets])
+    amounts = np.copysign(
+        np.floor(np.abs(change_values / prices) * scale + 0.5) / scale, change_values
+    )
+    actuals = values / totals[:, np.newaxis]
+    changes = weights - actuals
+    no_action = np.isin(assets, list(NO_ACTION)) | (amounts == 0)
+    action_values = np.round(np.abs(amounts) * prices, 2)
+    # Order actions by change in weight, largest first.
+    orders = np.argsort(-np.abs(changes), axis=1, kind="stable")
+
+    results = []
+    for i, order in enumerate(orders):
+        actions = [
+            {
+                "asset": assets[j],
+                "action": (
+                    None if no_action[i, j] else "buy" if amounts[i, j] > 0 else "sell"
+                ),
+                "amount": abs(amounts[i, j].item()),
+                "value": action_values[i, j].item(),
+                "target": weights[i, j].item(),
+                "actual": actuals[i, j].item(),
+                "change": changes[i, j].item(),
+                "change_value": change_values[i, j].item(),
+            }
+            for j in order
+        ]
+        results.append(
+            {
+                "contribution": contributions[i].item(),
+                "target": dict(zip(assets, weights[i].tolist())),
+                "total": totals[i].item(),
+                "actions": actions,
+            }
+        )
+    return results
+
+
+def rebalance(
+    holdings: list[dict], contribution: float = 0, target: dict[str, float] = None
+) -> dict:
+    """Returns actions required to rebalance holdings to a target allocation.
+
+    :param holdings: Asset, price_aud, value and target of each asset.
+    :param contribution: Amount in AUD contributed, or withdrawn if negative.
+    :param target: Target weights overriding those of holdings.
+    :raises ValueError: If target names unknown assets, or weights don't sum to 1.
+    """
+    return scenarios(holdings, [contribution], [target or {}])[0]
+
+
+async def _holdings(datasette) -> list[dict]:
+    """Returns holdings, read from the database on first use."""
+    if not hasattr(datasette, "_rebalance_holdings"):
+        results = await datasette.get_database(DATABASE).execute(HOLDINGS_SQL)
+        datasette._rebalance_holdings = [dict(row) for row in results.rows]
+    return datasette._rebalance_holdings
+
+
+async def rebalance_view(datasette, request):
+    try:
+        await datasette.ensure_permissions(
+            request.actor, [("view-database", DATABASE), "view-instance"]
+        )
+    except Forbidden:
+        return Response.json({"ok": False, "error": "Permission denied"}, status=403)
+    try:
+        # Without parameters, the scenario is the change table's.
+        contributions = list(map(float, request.args.getlist("contribution"))) or [0]
+        targets = list(map(parse_target, request.args.getlist("target"))) or [{}]
+        if not all(map(math.isfinite, contributions)):
+            raise ValueError("Contributions must be finite")
+        if len(contributions) * len(targets) > MAX_SCENARIOS:
+            raise ValueError(f"At most {MAX_SCENARIOS} scenarios may be evaluated")
+        results = scenarios(await _holdings(datasette), contributions, targets)
+    except ValueError as e:
+        return Response.json({"ok": False, "error": str(e)}, status=400)
+    return Response.json({"ok": True, "scenarios": results})
+
+
+@hookimpl
+def register_routes():
+    return [(r"^/-/rebalance\.json$", rebalance_view)]
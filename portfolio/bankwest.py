@@ -5,77 +5,113 @@ Run development notebook with
     uvx --with httpx jupyter lab notebooks/bankwest.ipynb
 """
 
-import re
 import typing
 
 import httpx
 from beancount.core.data import Amount, Balance, D
 
+from . import common
 from .common import queensland_now
+from .sessions import SessionCache
 
+# Hosts contacted during login, for opening connections ahead of time.
+URLS = ("https://ibs.bankwest.com.au", "https://api.ibs.bankwest.com.au")
+
+SUMMARY_URL = "https://api.ibs.bankwest.com.au/user/summary"
 
-def get_balance(
-    pan: str, password: str, account_prefix="Liabilities:Bankwest:"
-) -> typing.NamedTuple:
-    """Returns Bankwest balance as Beancount Balance.
 
+def _login(client: httpx.Client, pan: str, password: str) -> None:
+    """Authenticates client's session with Bankwest.
+
+    :param client: Client that receives session cookies.
     :param pan: Bankwest personal access number.
     :param password: Bankwest password.
-    :param account_prefix: Prefix account names with this string.
-
-    :return: Balance directive.
     """
-    now = queensland_now()
-
-    client = httpx.Client(follow_redirects=True)
-
     # Extract verification token from login page.
-    response = client.get("https://ibs.bankwest.com.au/Session/PersonalLogin")
-    match = re.search(
-        '<input name="__RequestVerificationToken" type="hidden" value="(.+?)" />',
-        response.text,
-    )
-    assert match
-    request_verification_token = match.group(1)
+    with client.stream(
+        "GET", "https://ibs.bankwest.com.au/Session/PersonalLogin"
+    ) as response:
+        fields = common.extract_fields(
+            response,
+            {
+                "__RequestVerificationToken": '<input name="__RequestVerificationToken" type="hidden" value="(.+?)" />'
+            },
+        )
 
     # Initiate authentication.
-    response = client.post(
+    with client.stream(
+        "POST",
         response.url,
         data={
             "PAN": pan,
             "Password": password,
             "button": "login",
             "targetMedia": "desktop",
-            "__RequestVerificationToken": request_verification_token,
+            "__RequestVerificationToken": fields["__RequestVerificationToken"],
             "RememberPan": "false",
         },
-    )
-    match = re.search("action='(.+?)'", response.text)
-    assert match
-    action = match.group(1)
-    match = re.search("name='code' value='(.+?)'", response.text)
-    assert match
-    code = match.group(1)
-    match = re.search("name='scope' value='(.+?)'", response.text)
-    assert match
-    scope = match.group(1)
-    match = re.search("name='state' value='(.+?)'", response.text)
-    assert match
-    state = match.group(1)
-    match = re.search("name='session_state' value='(.+?)'", response.text)
-    assert match
-    session_state = match.group(1)
+    ) as response:
+        fields = common.extract_fields(
+            response,
+            {
+                "action": "action='(.+?)'",
+                "code": "name='code' value='(.+?)'",
+                "scope": "name='scope' value='(.+?)'",
+                "state": "name='state' value='(.+?)'",
+                "session_state": "name='session_state' value='(.+?)'",
+            },
+        )
 
     # Complete authentication.
-    response = client.post(
-        action,
-        data=dict(code=code, scope=scope, state=state, session_state=session_state),
-    )
-
-    # Get banking summary.
-    response = client.get(
-        "https://api.ibs.bankwest.com.au/user/summary",
-    )
+    action = fields.pop("action")
+    client.post(action, data=fields)
+
+
+def _is_authenticated(response: httpx.Response) -> bool:
+    """Returns True if banking summary response came from an authenticated session.
+
+    Unauthenticated requests are redirected to an HTML page.
+    """
+    return response.is_success and response.headers.get(
+        "Content-Type", ""
+    ).startswith("application/json")
+
+
+def get_balance(
+    pan: str,
+    password: str,
+    account_prefix="Liabilities:Bankwest:",
+    session_cache: SessionCache | None = None,
+) -> typing.NamedTuple:
+    """Returns Bankwest balance as Beancount Balance.
+
+    If a session cache is given, the session saved by a previous run is tried first.
+    The full login is performed only if there is no saved session or it is no longer
+    valid.
+
+    :param pan: Bankwest personal access number.
+    :param password: Bankwest password.
+    :param account_prefix: Prefix account names with this string.
+    :param session_cache: Cache for keeping sessions between runs.
+
+    :return: Balance directive.
+    """
+    now = queensland_now()
+
+    client = common.client(follow_redirects=True)
+
+    # Try cheap banking summary request with saved session.
+    session = session_cache.load("bankwest") if session_cache else None
+    if session:
+        client.cookies = session.cookies
+        response = client.get(SUMMARY_URL)
+    if not session or not _is_authenticated(response):
+        client.cookies.clear()
+        _login(client, pan, password)
+        # Get banking summary.
+        response = client.get(SUMMARY_URL)
+    if session_cache:
+        session_cache.save("bankwest", client.cookies)
     client.close()
 
     account = response.json()["Accounts"][0]
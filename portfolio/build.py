@@ -0,0 +1,361 @@
+"""Builds the SQLite databases served by the Lambda functions.
+
+Each database is converted from its ledger, given its target allocation and
+valuation tables (including the rollups read by dashboard charts), then laid out
+for Datasette's immutable mode (see cdk/function/index.py): it's never written
+again, so it gets query planner statistics and a compact file with large pages.
+Table counts are written to inspect_data.json, as `datasette inspect` does.
+
+All databases are built at the same time, each in its own process.
+
+Built files are cached under a key of everything that goes into them: the files
+of the ledger's include tree, the target allocation script, tables.sql and
+summary_tables.sql, the build code and the versions of Python, SQLite and
+Beancount. If nothing has changed since a database was last built, the cached
+files are copied instead.
+
+Each function's metadata.yaml is also compiled to metadata.json, so the function
+needn't import PyYAML and parse YAML on a cold start. The results of its dashboard
+chart queries are saved in charts.json, so the function needn't run them (see
+cdk/function/plugins/precomputed_charts.py).
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import time
+import typing
+from pathlib import Path
+
+import beancount
+import datasette
+import yaml
+from datasette.app import Datasette
+
+from . import convert, fx, loader, tables
+
+# Ledger, target allocation SQL script and Lambda function directory of each
+# database built by the deploy workflow.
+DATABASES = [
+    (
+        "portfolio-ledger/portfolio.beancount",
+        "portfolio-ledger/target_allocation.sql",
+        "cdk/function",
+    ),
+    (
+        "cdk/demo-function/demo-portfolio.beancount",
+        "cdk/demo-function/target_allocation.sql",
+        "cdk/demo-function",
+    ),
+]
+
+# Larger pages mean fewer reads when scanning tables from Lambda's file system.
+PAGE_SIZE = 16384
+
+# Tables only used to update databases incrementally. Served databases are
+# immutable, so these are dropped.
+BUILD_TABLES = ["convert_file", "normalised_balance_aud_fingerprint"]
+
+# Files written to each Lambda function directory.
+OUTPUTS = ["portfolio.db", "inspect_data.json", "charts.json"]
+
+# Number of builds kept in the cache.
+CACHE_SIZE = 8
+
+
+def cache_dir() -> Path:
+    """Returns directory in which built databases are cached.
+
+    This is not in the state directory, which is saved to GitHub Actions caches
+    that are not private.
+    """
+    return Path(
+        os.environ.get(
+            "PORTFOLIO_BUILDS_DIR", Path.home() / ".cache" / "portfolio-builds"
+        )
+    )
+
+
+def _include_tree(filename: str) -> list[Path]:
+    """Returns ledger file and the files it includes, recursively.
+
+    Include directives are found without parsing the ledger, so this is quick
+    enough to run before deciding whether to build.
+    """
+    filenames = [Path(filename)]
+    seen = []
+    while filenames:
+        filename = filenames.pop(0)
+        if filename in seen:
+            continue
+        seen.append(filename)
+        for include in re.findall(
+            r'^include\s+"([^"]*)"', filename.read_text(), flags=re.MULTILINE
+        ):
+            filenames.extend(
+                sorted(
+                    Path(match)
+                    for match in glob.glob(
+                        os.path.join(filename.parent, include), recursive=True
+                    )
+                )
+            )
+    return seen
+
+
+def key(ledger: str, target_allocation: str, directory: str) -> str:
+    """Returns cache key of database built from ledger and target allocation, and
+    charts of the function in directory."""
+    digest = hashlib.sha256()
+    for version in [
+        sys.version,
+        sqlite3.sqlite_version,
+        beancount.__version__,
+        datasette.__version__,
+    ]:
+        digest.update(f"{version}\0".encode())
+    # Name ledger files relative to the main ledger file, so keys don't depend on
+    # where the ledger is checked out.
+    root = Path(ledger).parent
+    files = [
+        (os.path.relpath(filename, root), filename)
+        for filename in _include_tree(ledger)
+    ]
+    files += [
+        ("target_allocation.sql", Path(target_allocation)),
+        ("tables.sql", tables.TABLES_SQL),
+        ("summary_tables.sql", tables.SUMMARY_TABLES_SQL),
+    ]
+    if (Path(directory) / "metadata.yaml").exists():
+        files.append(("metadata.yaml", Path(directory) / "metadata.yaml"))
+    # Chart queries may call SQL functions registered by plugins.
+    files += [
+        (f"plugins/{path.name}", path)
+        for path in sorted((Path(directory) / "plugins").glob("*.py"))
+    ]
+    files += [
+        (path.name, path)
+        for path in map(
+            Path,
+            [__file__, convert.__file__, fx.__file__, loader.__file__, tables.__file__],
+        )
+    ]
+    for name, filename in files:
+        content = filename.read_bytes()
+        digest.update(f"{name}\0{len(content)}\0".encode())
+        digest.update(content)
+    return digest.hexdigest()
+
+
+def optimise(connection: sqlite3.Connection) -> None:
+    """Prepares database to be served in immutable mode.
+
+    :param connection: Database connection.
+    """
+    for table in BUILD_TABLES:
+        connection.execute(f"drop table if exists {table}")
+    connection.execute("analyze")
+    connection.commit()
+    # The new page size takes effect when the database is vacuumed.
+    connection.execute(f"pragma page_size = {PAGE_SIZE}")
+    connection.execute("vacuum")
+
+
+def table_counts(connection: sqlite3.Connection) -> dict[str, dict[str, int]]:
+    """Returns row count of each table, in inspect_data.json's format."""
+    return {
+        table: {
+            "count": connection.execute(f"select count(*) from [{table}]").fetchone()[0]
+        }
+        for (table,) in connection.execute(
+            "select name from sqlite_master where type = 'table'"
+        )
+    }
+
+
+def compile_metadata(directory: str) -> None:
+    """Compiles metadata.yaml in directory to metadata.json."""
+    metadata = yaml.safe_load((Path(directory) / "metadata.yaml").read_text())
+    (Path(directory) / "metadata.json").write_text(json.dumps(metadata))
+
+
+def chart_queries(metadata: dict, database: str) -> list[str]:
+    """Returns queries of dashboard charts against database, as requested when no
+    dashboard filters are set.
+
+    Optional [[ ]] clauses are removed and the filters' parameters are empty, as
+    datasette-dashboards does without filters. Dashboards with default filter
+    values always set filters, so are left out.
+    """
+    return [
+        re.sub(r"\[\[[^\]]*\]\]", "", chart["query"])
+        for dashboard in metadata.get("plugins", {})
+        .get("datasette-dashboards", {})
+        .values()
+        if not any(
+            value.get("default") for value in dashboard.get("filters", {}).values()
+        )
+        for chart in dashboard.get("charts", {}).values()
+        if chart.get("db") == database and "query" in chart
+    ]
+
+
+async def _render_charts(
+    database: Path, inspect_data: dict, queries: list[str]
+) -> dict[str, str]:
+    """Returns Datasette's JSON response to each query, by query key.
+
+    Plugins in the plugins directory next to the database are loaded, as the
+    function loads them.
+    """
+    plugins_dir = database.parent / "plugins"
+    instance = Datasette(
+        immutables=[str(database)],
+        inspect_data=inspect_data,
+        plugins_dir=str(plugins_dir) if plugins_dir.is_dir() else None,
+    )
+    await instance.invoke_startup()
+    responses = {}
+    for sql in queries:
+        # Request the query as datasette-dashboards does.
+        response = await instance.client.get(
+            f"/{database.stem}.json",
+            params={"sql": sql, "_shape": "objects"},
+            follow_redirects=True,
+        )
+        if response.status_code == 200:
+            # Keys must match those of precomputed_charts.key().
+            responses[hashlib.sha256(sql.encode()).hexdigest()] = response.text
+    return responses
+
+
+def _build(ledger: str, target_allocation: str, directory: str) -> None:
+    """Builds portfolio.db, inspect_data.json and charts.json in directory."""
+    database = Path(directory) / "portfolio.db"
+    temporary = database.with_suffix(f".{os.getpid()}.tmp")
+    convert.rebuild(ledger, temporary)
+    connection = sqlite3.connect(temporary)
+    connection.executescript(Path(target_allocation).read_text())
+    tables.materialise(connection, full=True)
+    optimise(connection)
+    counts = table_counts(connection)
+    connection.close()
+    temporary.replace(database)
+
+    # Datasette keys inspect data by database name, and takes the hash and size
+    # of the file as given on the command line in index.py's directory.
+    content = database.read_bytes()
+    inspect_data = {
+        database.stem: {
+            "hash": hashlib.sha256(content).hexdigest(),
+            "size": len(content),
+            "file": database.name,
+            "tables": counts,
+        }
+    }
+    (Path(directory) / "inspect_data.json").write_text(
+        json.dumps(inspect_data, indent=4)
+    )
+
+    # Compiled by compile_metadata().
+    metadata_json = Path(directory) / "metadata.json"
+    queries = (
+        chart_queries(json.loads(metadata_json.read_text()), database.stem)
+        if metadata_json.exists()
+        else []
+    )
+    charts = {
+        database.stem: asyncio.run(_render_charts(database, inspect_data, queries))
+    }
+    (Path(directory) / "charts.json").write_text(json.dumps(charts))
+
+
+def build(
+    ledger: str, target_allocation: str, directory: str, force=False
+) -> tuple[float, bool]:
+    """Builds portfolio.db, inspect_data.json and charts.json in directory, or
+    copies them from the cache. metadata.yaml, if any, is compiled too.
+
+    The database is built under a temporary name and only replaces the existing
+    database once complete.
+
+    :param ledger: Beancount ledger.
+    :param target_allocation: SQL script creating target_allocation table.
+    :param directory: Lambda function directory.
+    :param force: Build even if the cache has a build with the same key.
+
+    :return: Seconds taken, and whether files were copied from the cache.
+    """
+    start = time.monotonic()
+    if (Path(directory) / "metadata.yaml").exists():
+        compile_metadata(directory)
+    cached = cache_dir() / key(ledger, target_allocation, directory)
+    if not force and all((cached / output).exists() for output in OUTPUTS):
+        for output in OUTPUTS:
+            shutil.copyfile(cached / output, Path(directory) / output)
+        # Mark the build as recently used.
+        cached.touch()
+        return time.monotonic() - start, True
+
+    _build(ledger, target_allocation, directory)
+    # Copy to a temporary directory first, so a partial build is never used.
+    temporary = cached.with_suffix(f".{os.getpid()}.tmp")
+    temporary.mkdir(parents=True, exist_ok=True)
+    for output in OUTPUTS:
+        shutil.copyfile(Path(directory) / output, temporary / output)
+    shutil.rmtree(cached, ignore_errors=True)
+    temporary.rename(cached)
+    # Remove least recently used builds.
+    builds = sorted(
+        (path for path in cache_dir().iterdir() if path.suffix != ".tmp"),
+        key=lambda path: path.stat().st_mtime,
+        reverse=True,
+    )
+    for path in builds[CACHE_SIZE:]:
+        shutil.rmtree(path, ignore_errors=True)
+    return time.monotonic() - start, False
+
+
+def build_all(
+    databases: typing.Iterable[tuple[str, str, str]] = DATABASES, force=False
+) -> None:
+    """Builds databases at the same time, each in its own process.
+
+    :param databases: (ledger, target_allocation, directory) tuples (see `build`).
+    :param force: Build even if the cache has builds with the same keys.
+    """
+    databases = list(databases)
+    with concurrent.futures.ProcessPoolExecutor(len(databases)) as executor:
+        futures = [
+            executor.submit(build, *database, force=force) for database in databases
+        ]
+        for (_, _, directory), future in zip(databases, futures):
+            elapsed, cached = future.result()
+            print(
+                f"{'Copied cached' if cached else 'Built'} {directory}/portfolio.db "
+                f"in {elapsed:.1f} s."
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=build_all.__doc__.splitlines()[0])
+    parser.add_argument(
+        "--database",
+        nargs=3,
+        action="append",
+        metavar=("LEDGER", "TARGET_ALLOCATION", "DIRECTORY"),
+        help="database to build (default: main and demo databases)",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="build even if a cached build exists"
+    )
+    args = parser.parse_args()
+    build_all(args.database or DATABASES, force=args.force)
@@ -1,6 +1,154 @@
 __version__ = "0.1.0"
 
 from datetime import datetime
+import os
+import re
+import threading
+import typing
+from pathlib import Path
 from zoneinfo import ZoneInfo
 
+import httpx
+
 queensland_now = lambda: datetime.now(tz=ZoneInfo("Australia/Queensland"))
+
+
+def state_dir() -> Path:
+    """Returns directory for state kept between runs (tokens, sessions, etc.).
+
+    Defaults to ~/.cache/portfolio. Override with the PORTFOLIO_STATE_DIR environment
+    variable.
+    """
+    return Path(
+        os.environ.get("PORTFOLIO_STATE_DIR", "~/.cache/portfolio")
+    ).expanduser()
+
+# Timeouts (seconds) applied to every request made by provider clients.
+TIMEOUT = httpx.Timeout(30, connect=10)
+
+# Keep connections alive between the steps of provider login flows.
+LIMITS = httpx.Limits(
+    max_connections=20, max_keepalive_connections=20, keepalive_expiry=60
+)
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def transport() -> httpx.HTTPTransport:
+    """Returns the HTTP transport (connection pool) shared by all providers."""
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = httpx.HTTPTransport(http2=True, limits=LIMITS)
+        return _transport
+
+
+class SharedTransport(httpx.BaseTransport):
+    """Sends requests via the shared connection pool.
+
+    Closing a client closes its transport. Clients are given this wrapper instead of
+    the shared transport so that closing one client leaves the pool open.
+    """
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        return transport().handle_request(request)
+
+
+def client(cls: type[httpx.Client] = httpx.Client, **kwargs) -> typing.Any:
+    """Returns an HTTP client that uses the shared connection pool.
+
+    Each client has its own cookies and headers, but connections (and their TLS
+    sessions) are reused across all clients.
+
+    :param cls: httpx.Client or a subclass, such as authlib's OAuth2Client.
+    :param kwargs: Keyword arguments passed to `cls`.
+
+    :return: Instance of `cls`.
+    """
+    kwargs.setdefault("timeout", TIMEOUT)
+    return cls(transport=SharedTransport(), **kwargs)
+
+
+def preconnect(urls: typing.Iterable[str]) -> None:
+    """Opens pooled connections to hosts before they are first used.
+
+    DNS lookups and TCP/TLS handshakes for all hosts happen concurrently. Failures
+    are ignored; the connection is simply opened again when it is first used.
+
+    :param urls: URLs of hosts to connect to.
+    """
+
+    def connect(url: str) -> None:
+        try:
+            with client() as http_client:
+                http_client.head(url)
+        except httpx.HTTPError:
+            pass
+
+    threads = [
+        threading.Thread(target=connect, args=(url,), daemon=True) for url in urls
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(TIMEOUT.connect)
+
+
+class FieldNotFoundError(Exception):
+    """Raised when a field can't be found in a response."""
+
+    def __init__(self, field: str, url: httpx.URL) -> None:
+        super().__init__(f"{field!r} not found in response from {url}")
+        self.field = field
+        self.url = url
+
+
+def extract_fields(
+    response: httpx.Response, patterns: dict[str, str], overlap: int = 2048
+) -> dict[str, str]:
+    """Extracts fields from a streamed response in a single pass.
+
+    The response body is read in chunks and scanned once for all patterns at the
+    same time. Reading stops, and the response is closed, as soon as every field
+    has been found.
+
+    Use with a streamed response:
+
+        with client.stream("GET", url) as response:
+            fields = extract_fields(response, {"token": 'name="token" value="(.+?)"'})
+
+    :param response: Streamed response.
+    :param patterns: Maps field names to regular expressions containing exactly one
+        group, which captures the field's value.
+    :param overlap: Characters kept from the end of each chunk, so that matches
+        spanning chunks are found. Must be longer than any match.
+
+    :raises FieldNotFoundError: If a field was not found in the whole response.
+
+    :return: Maps field names to the first value found for each.
+    """
+    names = list(patterns)
+    for name in names:
+        assert re.compile(patterns[name]).groups == 1, name
+    # Combine patterns into one alternation. Group i + 1 belongs to names[i].
+    combined = re.compile("|".join(f"(?:{patterns[name]})" for name in names))
+
+    fields = {}
+    buffer = ""
+    for chunk in response.iter_text():
+        buffer += chunk
+        end = 0
+        for match in combined.finditer(buffer):
+            name = names[match.lastindex - 1]
+            fields.setdefault(name, match.group(match.lastindex))
+            end = match.end()
+        if len(fields) == len(names):
+            response.close()
+            return fields
+        # Discard text that has been scanned, except the end of the buffer where a
+        # match may have only partially arrived.
+        buffer = buffer[max(end, len(buffer) - overlap) :]
+
+    missing = next(name for name in names if name not in fields)
+    raise FieldNotFoundError(missing, response.url)
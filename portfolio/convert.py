@@ -0,0 +1,244 @@
+"""Converts a Beancount ledger to SQLite, like bean-sql, but incrementally.
+
+balances.beancount and prices.beancount are only ever appended to. The byte
+offset, line count and SHA-256 hash of each file loaded are recorded in the
+database's convert_file table. On the next conversion, only directives appended
+to the files since are parsed and inserted. The database is rebuilt from scratch
+with bean-sql's writers if
+
+- there is no database or recorded state,
+- any file's recorded prefix has changed (e.g., an entry was edited),
+- anything other than balance and price directives was appended,
+- an appended directive doesn't sort after every entry in the database, as entry
+  IDs follow the ledger's sort order (by date, then type and line number across
+  all files), and tables.sql relies on this to find the latest entry, or
+- the ledger has transactions or plugins, which may depend on the whole ledger.
+"""
+
+import argparse
+import datetime
+import hashlib
+import os
+import sqlite3
+import typing
+from pathlib import Path
+
+from beancount.core import data
+from beancount.ops import balance
+from beancount.parser import options
+from beancount.parser.parser import parse_string
+from beancount.scripts import sql
+
+from . import loader
+
+# Writers of directive types that may be appended without a full rebuild.
+WRITERS = {data.Balance: sql.BalanceWriter(), data.Price: sql.PriceWriter()}
+
+# Sort order of entries on the same date, by the type bean-sql records (see
+# data.entry_sortkey).
+SORT_ORDER = {type.__name__.lower(): order for type, order in data.SORT_ORDER.items()}
+
+
+class FallBack(Exception):
+    """Raised when a ledger can't be converted incrementally."""
+
+
+def _record(connection: sqlite3.Connection, filenames: list[str]) -> None:
+    """Records offset, line count and hash of each file."""
+    with connection:
+        connection.execute("""
+            create table if not exists convert_file (
+              filename text primary key,
+              offset integer,
+              lines integer,
+              sha256 text
+            )
+            """)
+        connection.execute("delete from convert_file")
+        for filename in filenames:
+            content = Path(filename).read_bytes()
+            connection.execute(
+                "insert into convert_file values (?, ?, ?, ?)",
+                (
+                    filename,
+                    len(content),
+                    content.count(b"\n"),
+                    hashlib.sha256(content).hexdigest(),
+                ),
+            )
+
+
+def rebuild(filename: str, database: str) -> int:
+    """Converts ledger to a new database, as bean-sql does.
+
+    :param filename: Beancount ledger.
+    :param database: SQLite database to replace.
+
+    :return: Number of entries inserted.
+    """
+    entries, _, options_map = loader.load_file(filename)
+    if os.path.exists(database):
+        os.remove(database)
+    connection = sqlite3.connect(database)
+    sql.setup_decimal_support()
+    for function in [
+        sql.output_common,
+        sql.output_transactions,
+        sql.OpenWriter(),
+        sql.CloseWriter(),
+        sql.PadWriter(),
+        sql.BalanceWriter(),
+        sql.NoteWriter(),
+        sql.PriceWriter(),
+        sql.DocumentWriter(),
+    ]:
+        function(connection, entries)
+    # Appended entries might change the meaning of earlier entries in ledgers with
+    # transactions or plugins, so don't record state for these.
+    if not options_map["plugin"] and not any(
+        isinstance(entry, data.Transaction) for entry in entries
+    ):
+        _record(connection, options_map["include"])
+    connection.close()
+    return len(entries)
+
+
+def _appended_entries(connection: sqlite3.Connection) -> list[typing.NamedTuple]:
+    """Returns entries appended to recorded files.
+
+    :param connection: Database containing convert_file table.
+
+    :return: Appended entries, sorted.
+    """
+    try:
+        files = connection.execute(
+            "select filename, offset, lines, sha256 from convert_file"
+        ).fetchall()
+    except sqlite3.OperationalError:
+        raise FallBack("no recorded state")
+    if not files:
+        raise FallBack("no recorded state")
+
+    entries = []
+    for filename, offset, lines, sha256 in files:
+        try:
+            content = Path(filename).read_bytes()
+        except FileNotFoundError:
+            raise FallBack(f"{filename} was removed")
+        if hashlib.sha256(content[:offset]).hexdigest() != sha256:
+            raise FallBack(f"{filename} was changed")
+        if len(content) == offset:
+            continue
+        file_entries, errors, file_options = parse_string(
+            content[offset:].decode(),
+            report_filename=filename,
+            report_firstline=lines + 1,
+        )
+        if errors or file_options["include"] or file_options["plugin"]:
+            raise FallBack(f"{filename} has appended errors, includes or plugins")
+        for entry in file_entries:
+            if type(entry) not in WRITERS:
+                raise FallBack(f"{filename} has appended {type(entry).__name__}")
+        entries.extend(file_entries)
+    if not entries:
+        return []
+    entries.sort(key=data.entry_sortkey)
+    # Without transactions, balance assertions are checked against empty accounts,
+    # so appended balances can be checked with just the ledger's Open directives.
+    # This sets diff_amount (and drops balances of unopened accounts) as the loader
+    # would have.
+    opens = [
+        data.Open(
+            meta={},
+            date=datetime.date.fromisoformat(date),
+            account=account,
+            currencies=currencies.split(",") if currencies else None,
+            booking=None,
+        )
+        for date, account, currencies in connection.execute(
+            "select date, account, currencies from open"
+        )
+    ]
+    entries, _ = balance.check(opens + entries, options.OPTIONS_DEFAULTS)
+    entries = [entry for entry in entries if type(entry) in WRITERS]
+    return entries
+
+
+def _latest_sortkey(connection: sqlite3.Connection) -> tuple | None:
+    """Returns sort key of the entry sorted last in the database, if any."""
+    return max(
+        (
+            (datetime.date.fromisoformat(date), SORT_ORDER.get(type, 0), lineno)
+            for date, type, lineno in connection.execute(
+                "select date, type, source_lineno from entry "
+                "where date = (select max(date) from entry)"
+            )
+        ),
+        default=None,
+    )
+
+
+def update(filename: str, database: str) -> int:
+    """Converts ledger to database, inserting only newly appended directives.
+
+    The database is rebuilt from scratch if this is not possible (see above).
+
+    :param filename: Beancount ledger.
+    :param database: SQLite database.
+
+    :return: Number of entries inserted.
+    """
+    if not os.path.exists(database):
+        return rebuild(filename, database)
+    connection = sqlite3.connect(database)
+    try:
+        entries = _appended_entries(connection)
+        latest = _latest_sortkey(connection)
+        # Equal keys are ordered by file, so would need a rebuild too.
+        if entries and latest and data.entry_sortkey(entries[0]) <= latest:
+            raise FallBack("appended entries sort before existing entries")
+    except FallBack:
+        connection.close()
+        return rebuild(filename, database)
+
+    sql.setup_decimal_support()
+    with connection:
+        (last_id,) = connection.execute("select max(id) from entry").fetchone()
+        for id, entry in enumerate(entries, start=(last_id or 0) + 1):
+            writer = WRITERS[type(entry)]
+            connection.execute(
+                "insert into entry values (?, ?, ?, ?, ?)",
+                (
+                    id,
+                    entry.date,
+                    writer.name,
+                    entry.meta["filename"],
+                    entry.meta["lineno"],
+                ),
+            )
+            detail = (id,) + writer.get_detail(entry)
+            connection.execute(
+                f"insert into {writer.name}_detail values "
+                f"({', '.join('?' * len(detail))})",
+                detail,
+            )
+    _record(
+        connection,
+        [row[0] for row in connection.execute("select filename from convert_file")],
+    )
+    connection.close()
+    return len(entries)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=update.__doc__.splitlines()[0])
+    parser.add_argument("filename", help="Beancount ledger")
+    parser.add_argument("database", help="SQLite database to create or update")
+    parser.add_argument(
+        "--full", action="store_true", help="rebuild database from scratch"
+    )
+    args = parser.parse_args()
+    if args.full:
+        rebuild(args.filename, args.database)
+    else:
+        update(args.filename, args.database)
@@ -0,0 +1,158 @@
+"""Converts commodities to AUD through any number of price hops.
+
+Each price directive is an edge of a currency graph, from the priced commodity to
+the currency it's priced in. The edge can also be followed in reverse, with the
+reciprocal rate. On each date, a commodity's rate is found along the shortest
+path from it to AUD, using the latest price of each edge on or before that date.
+"""
+
+import argparse
+import collections
+import sqlite3
+import typing
+
+# Currency balances are valued in.
+TARGET = "AUD"
+
+
+class Price(typing.NamedTuple):
+    date: str
+    currency: str
+    number: int | float
+    quote: str
+
+
+class Rate(typing.NamedTuple):
+    date: str
+    currency: str
+    # Rate to target currency.
+    rate: int | float
+    # Date of the price of the first hop.
+    price_date: str
+
+
+class _Edge(typing.NamedTuple):
+    # Tuples of edges compare by preference: forward over reverse, then recent.
+    forward: bool
+    date: str
+    rate: int | float
+
+
+def _resolve(
+    edges: dict[tuple[str, str], _Edge], target: str
+) -> dict[str, tuple[int | float, str]]:
+    """Returns rate and first hop price date of each currency with a path to target.
+
+    Searches breadth-first from target, so paths have as few hops as possible.
+    Among paths with the same number of hops, the first hop's preferred edge wins.
+
+    :param edges: Latest edge between each (from, to) currency pair.
+    :param target: Target currency.
+    """
+    neighbours = collections.defaultdict(list)
+    for (currency, quote), edge in edges.items():
+        neighbours[quote].append((currency, edge))
+
+    resolved = {}
+    level = {target: 1}
+    while level:
+        candidates = {}
+        for quote, quote_rate in level.items():
+            for currency, edge in neighbours[quote]:
+                if currency == target or currency in resolved or currency in level:
+                    continue
+                if currency not in candidates or edge > candidates[currency][0]:
+                    candidates[currency] = (edge, edge.rate * quote_rate)
+        for currency, (edge, rate) in candidates.items():
+            resolved[currency] = (rate, edge.date)
+        level = {currency: rate for currency, (_, rate) in candidates.items()}
+    return resolved
+
+
+def rates(
+    prices: typing.Iterable[Price], dates: typing.Iterable[str], target=TARGET
+) -> typing.Iterator[Rate]:
+    """Yields rates of every currency with a path to target on each date.
+
+    Resolved rates are cached, and only resolved again on dates after prices
+    changed.
+
+    :param prices: Prices sorted by date (and within a date, ledger order).
+    :param dates: Sorted dates to yield rates for.
+    :param target: Target currency.
+
+    :return: Iterator of rates, sorted by date and currency.
+    """
+    edges = {}
+    prices = iter(prices)
+    price = next(prices, None)
+    resolved = None
+    for date in dates:
+        while price and price.date <= date:
+            # Later prices replace earlier ones.
+            edges[price.currency, price.quote] = _Edge(True, price.date, price.number)
+            reverse = edges.get((price.quote, price.currency))
+            if reverse is None or not reverse.forward:
+                if price.number:
+                    edges[price.quote, price.currency] = _Edge(
+                        False, price.date, 1 / price.number
+                    )
+                else:
+                    # A zero price (e.g., of a delisted commodity) has no reverse.
+                    edges.pop((price.quote, price.currency), None)
+            resolved = None
+            price = next(prices, None)
+        if resolved is None:
+            resolved = _resolve(edges, target)
+        for currency in sorted(resolved):
+            rate, price_date = resolved[currency]
+            yield Rate(date, currency, rate, price_date)
+
+
+def write(connection: sqlite3.Connection, target=TARGET) -> None:
+    """Writes rate_aud table with rates on every valuation date.
+
+    Valuation dates are dates with a balance entry, or a price entry on or after
+    the first balance entry (as in tables.sql).
+
+    :param connection: Database converted from ledger by bean-sql.
+    :param target: Target currency.
+    """
+    prices = [Price(*row) for row in connection.execute("""
+            select date, currency, amount_number, amount_currency
+            from price
+            order by date, id
+            """)]
+    dates = [date for (date,) in connection.execute("""
+            select date from balance
+            union
+            select date from price where date >= (select min(date) from balance)
+            order by date
+            """)]
+    with connection:
+        connection.execute("drop table if exists rate_aud")
+        # Declared types match bean-sql's. Rates have no declared type, so they keep
+        # the storage classes of the prices they were calculated from.
+        connection.execute("""
+            create table rate_aud (
+              date DATE,
+              currency VARCHAR,
+              rate,
+              price_date DATE
+            )
+            """)
+        connection.executemany(
+            "insert into rate_aud values (?, ?, ?, ?)", rates(prices, dates, target)
+        )
+        connection.execute(
+            "create unique index rate_aud_date_currency on rate_aud (date, currency)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=write.__doc__.splitlines()[0])
+    parser.add_argument("database", help="database converted by bean-sql")
+    args = parser.parse_args()
+    connection = sqlite3.connect(args.database)
+    write(connection)
+    connection.close()
@@ -0,0 +1,173 @@
+"""Writes directives to Beancount ledger files."""
+
+import datetime
+import hashlib
+import json
+import os
+import typing
+from pathlib import Path
+
+from beancount.core.data import Balance, D, Price
+from beancount.parser import parser, printer
+
+from .scheduler import Result
+
+
+class BalanceIndex:
+    """Index of the last balance written to a ledger file for each account.
+
+    The index is saved to a JSON file, along with the SHA-256 hash of the ledger
+    file when it was saved. If the ledger has changed since (e.g., it was edited by
+    hand), or there is no saved index, the index is rebuilt by parsing the ledger.
+    """
+
+    def __init__(self, filename: str, path: Path | None = None) -> None:
+        """
+        :param filename: Ledger file.
+        :param path: JSON file to save index in. Defaults to a hidden file next to
+            the ledger file, as the index contains balances.
+        """
+        self.filename = Path(filename)
+        self.path = path or self.filename.with_name(f".{self.filename.name}.index.json")
+        try:
+            saved = json.loads(self.path.read_text())
+        except FileNotFoundError:
+            saved = None
+        self.balances = {}
+        # Indexes saved by earlier versions have the ledger's size instead of hash.
+        if saved and saved.get("sha256") == self._hash():
+            self.balances = saved["balances"]
+        else:
+            self._build()
+
+    def _hash(self) -> str:
+        try:
+            content = self.filename.read_bytes()
+        except FileNotFoundError:
+            content = b""
+        return hashlib.sha256(content).hexdigest()
+
+    def _build(self) -> None:
+        """Builds index from balances in ledger file."""
+        if not os.path.exists(self.filename):
+            return
+        entries, _, _ = parser.parse_file(self.filename)
+        for entry in sorted(
+            (entry for entry in entries if isinstance(entry, Balance)),
+            key=lambda entry: entry.date,
+        ):
+            self.record(entry)
+
+    def record(self, entry: typing.NamedTuple) -> None:
+        """Records balance as the last balance written for its account."""
+        self.balances[entry.account] = {
+            "number": str(entry.amount.number),
+            "currency": entry.amount.currency,
+            "date": entry.date.isoformat(),
+        }
+
+    def is_unchanged(self, entry: typing.NamedTuple, keepalive: int) -> bool:
+        """Returns True if balance need not be written.
+
+        :param entry: Balance directive.
+        :param keepalive: Days after which an unchanged balance is written anyway.
+        """
+        last = self.balances.get(entry.account)
+        return (
+            last is not None
+            and D(last["number"]) == entry.amount.number
+            and last["currency"] == entry.amount.currency
+            and entry.date - datetime.date.fromisoformat(last["date"])
+            < datetime.timedelta(days=keepalive)
+        )
+
+    def save(self) -> None:
+        """Saves index along with the ledger file's current hash."""
+        self.path.write_text(
+            json.dumps({"sha256": self._hash(), "balances": self.balances}, indent=2)
+        )
+
+
+def append(
+    filename: str,
+    results: typing.Iterable[Result],
+    changes_only: bool = False,
+    keepalive: int = 30,
+    index_path: Path | None = None,
+    kind: str = "balances",
+) -> None:
+    """Appends fetched directives to ledger file.
+
+    This is the only place that writes provider results to the ledger. Results are
+    written in the order given, so the file contents do not depend on which
+    provider finished first.
+
+    In changes-only mode, a Balance directive is skipped if its account's last
+    written balance has the same amount, unless that balance is at least `keepalive`
+    days old. Other directives are always written.
+
+    :param filename: Ledger file to append to.
+    :param results: Provider results, in the order they should be written.
+    :param changes_only: Skip unchanged balances.
+    :param keepalive: Days after which an unchanged balance is written anyway.
+    :param index_path: JSON file to save index of last written balances in.
+        Defaults to a hidden file next to the ledger file.
+    :param kind: Kind of directives fetched, for log messages.
+    """
+    index = BalanceIndex(filename, index_path) if changes_only else None
+    # Open ledger file in append mode.
+    with open(filename, mode="a") as file:
+        for result in results:
+            if result.error is not None:
+                # Log exception type only, as messages may contain credentials.
+                print(
+                    f"Failed to update {result.name} {kind} "
+                    f"({type(result.error).__name__})."
+                )
+                continue
+            print(
+                f"Retrieved {len(result.entries)} {result.name} {kind} "
+                f"in {result.elapsed:.1f} s."
+            )
+            entries = result.entries
+            if index is not None:
+                entries, skipped = [], []
+                for entry in result.entries:
+                    if isinstance(entry, Balance):
+                        if index.is_unchanged(entry, keepalive):
+                            skipped.append(entry)
+                            continue
+                        index.record(entry)
+                    entries.append(entry)
+                if skipped:
+                    print(
+                        f"Skipped {len(skipped)} unchanged {result.name} balances: "
+                        + ", ".join(entry.account for entry in skipped)
+                    )
+            printer.print_entries(entries, file=file)
+            print(f"Wrote {result.name} {kind} to {file.name}.")
+    if index is not None:
+        index.save()
+
+
+def split_prices(results: list[Result]) -> tuple[list[Result], list[Result]]:
+    """Splits Price directives from other directives of provider results, so they
+    can be appended to the prices file.
+
+    :param results: Provider results.
+
+    :return: Results without Price directives, and results of providers that
+        returned Price directives, with only those.
+    """
+    others = [
+        result._replace(
+            entries=[entry for entry in result.entries if not isinstance(entry, Price)]
+        )
+        for result in results
+    ]
+    prices = [
+        result._replace(entries=entries)
+        for result in results
+        if (entries := [entry for entry in result.entries if isinstance(entry, Price)])
+    ]
+    return others, prices
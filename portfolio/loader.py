@@ -0,0 +1,187 @@
+"""Loads Beancount ledgers like beancount.loader, caching parsed entries.
+
+Two kinds of pickles are cached, each keyed by a hash of the Beancount version,
+file name and file contents:
+
+- The parsed entries, errors and options of each file in the include tree.
+- The loaded ledger (booked, transformed and validated entries), keyed by the
+  hashes of all files in its include tree.
+
+If no file has changed, the ledger is loaded from its pickle without any parsing.
+If a file has changed, only that file is parsed again before the ledger is
+booked, transformed and validated.
+"""
+
+import glob
+import hashlib
+import os
+import pickle
+import typing
+from pathlib import Path
+
+import beancount
+from beancount.core import data
+from beancount.loader import (
+    LoadError,
+    aggregate_options_map,
+    booking,
+    compute_input_hash,
+    run_transformations,
+)
+from beancount.ops import validation
+from beancount.parser import parser
+
+
+def cache_dir() -> Path:
+    """Returns directory in which parsed entries are cached.
+
+    This is not in the state directory, which is saved to GitHub Actions caches
+    that are not private.
+    """
+    return Path(
+        os.environ.get(
+            "PORTFOLIO_ENTRIES_DIR", Path.home() / ".cache" / "portfolio-entries"
+        )
+    )
+
+
+class _Cache:
+    """Pickles keyed by file names and hashes, stored in a directory."""
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+
+    def _path(self, kind: str, filename: str) -> Path:
+        # Keep one pickle of each kind for each file name.
+        name = hashlib.sha256(filename.encode()).hexdigest()
+        return self.directory / f"{name}.{kind}.pickle"
+
+    def load(self, kind: str, filename: str) -> tuple:
+        """Returns cached key and value, or Nones if nothing is cached."""
+        try:
+            with self._path(kind, filename).open("rb") as file:
+                return pickle.load(file)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None, None
+
+    def save(self, kind: str, filename: str, key, value) -> None:
+        """Caches value."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(kind, filename)
+        # Write to a temporary file first, so a partially written pickle is never
+        # loaded.
+        temporary = path.with_suffix(f".{os.getpid()}.tmp")
+        with temporary.open("wb") as file:
+            pickle.dump((key, value), file, protocol=pickle.HIGHEST_PROTOCOL)
+        temporary.replace(path)
+
+
+def _key(filename: str, content: bytes) -> str:
+    """Returns cache key of file."""
+    return hashlib.sha256(
+        f"{beancount.__version__}\0{filename}\0".encode() + content
+    ).hexdigest()
+
+
+def _parse_recursive(filename: str, cache: _Cache) -> tuple[list, list, dict, dict]:
+    """Parses ledger file and its includes, using cached results where possible.
+
+    Follows beancount.loader._parse_recursive.
+
+    :return: Entries, errors, options and cache keys of files in the include tree.
+    """
+    entries, errors = [], []
+    options_map = None
+    keys = {}
+    filenames = [filename]
+    seen = set()
+    while filenames:
+        filename = os.path.normpath(filenames.pop(0))
+        if filename in seen:
+            errors.append(
+                LoadError(
+                    data.new_metadata("<load>", 0),
+                    f'Duplicate filename parsed: "{filename}"',
+                    None,
+                )
+            )
+            continue
+        try:
+            content = Path(filename).read_bytes()
+        except FileNotFoundError:
+            errors.append(
+                LoadError(
+                    data.new_metadata("<load>", 0),
+                    f'File "{filename}" does not exist',
+                    None,
+                )
+            )
+            continue
+        seen.add(filename)
+        key = _key(filename, content)
+        keys[filename] = key
+        cached_key, parsed = cache.load("parse", filename)
+        if cached_key != key:
+            parsed = parser.parse_string(content.decode(), report_filename=filename)
+            cache.save("parse", filename, key, parsed)
+        file_entries, file_errors, file_options_map = parsed
+        entries.extend(file_entries)
+        errors.extend(file_errors)
+        if options_map is None:
+            options_map = file_options_map
+        else:
+            aggregate_options_map(options_map, file_options_map)
+
+        # Include paths are relative to the including file.
+        directory = os.path.dirname(filename)
+        for include in file_options_map["include"]:
+            matches = glob.glob(os.path.join(directory, include), recursive=True)
+            if not matches:
+                errors.append(
+                    LoadError(
+                        data.new_metadata("<load>", 0),
+                        f'File glob "{include}" does not match any files',
+                        None,
+                    )
+                )
+            filenames.extend(matches)
+
+    options_map["include"] = sorted(seen)
+    return entries, errors, options_map, keys
+
+
+def load_file(
+    filename: str, directory: Path | None = None
+) -> tuple[list[typing.NamedTuple], list, dict]:
+    """Loads ledger, as beancount.loader.load_file does.
+
+    :param filename: Beancount ledger.
+    :param directory: Cache directory. Defaults to `cache_dir()`.
+
+    :return: Entries sorted by date, errors and options.
+    """
+    filename = os.path.abspath(os.path.expanduser(filename))
+    cache = _Cache(directory or cache_dir())
+    # The loaded ledger is cached with the keys of files in its include tree. If
+    # none have changed, the include tree is unchanged too.
+    keys, loaded = cache.load("ledger", filename)
+    if keys and all(
+        os.path.exists(include) and _key(include, Path(include).read_bytes()) == key
+        for include, key in keys.items()
+    ):
+        return loaded
+
+    # Options and errors of each file are cached alongside its entries, so the
+    # include tree can be walked without parsing unchanged files.
+    parsed_entries, parse_errors, options_map, keys = _parse_recursive(filename, cache)
+
+    # Follows beancount.loader._load.
+    parsed_entries.sort(key=data.entry_sortkey)
+    entries, booking_errors = booking.book(parsed_entries, options_map)
+    parse_errors.extend(booking_errors)
+    entries, errors = run_transformations(entries, parse_errors, options_map, None)
+    errors.extend(validation.validate(entries, options_map, None, None))
+    options_map["input_hash"] = compute_input_hash(options_map["include"])
+
+    cache.save("ledger", filename, keys, (entries, errors, options_map))
+    return entries, errors, options_map
@@ -0,0 +1,333 @@
+"""Fetches commodity prices, as bean-price does, but concurrently and in-process.
+
+Price sources are read from the `price` metadata of Commodity directives, in
+bean-price's format. This is a space-separated list of `QUOTE:source/TICKER`
+specifications, one for each quote currency. Alternative sources for the same
+quote currency are separated by commas and tried in order. A `^` before the ticker
+inverts the fetched price. For example:
+
+    2020-01-01 commodity USD
+      price: "AUD:yahoo/^AUDUSD=X"
+    2020-01-01 commodity BTC
+      price: "AUD:coinbase/BTC-AUD,yahoo/BTC-AUD"
+
+All prices are fetched at the same time, with at most `Source.limit` requests to
+each source in flight. Each (source, ticker) pair is fetched only once, so
+commodities sharing a ticker (e.g., an FX rate) share the fetched price.
+Commodities that already have a price in the ledger for the date are skipped.
+"""
+
+import abc
+import argparse
+import collections
+import concurrent.futures
+import datetime
+import threading
+import time
+import typing
+from decimal import Decimal
+
+import httpx
+from beancount.core.data import Amount, Commodity, D, Price
+
+from . import common, ledger, loader
+from .common import queensland_now
+from .scheduler import Result
+
+
+class Source(abc.ABC):
+    """Price source, fetching prices from a particular API.
+
+    Subclasses implement get_price().
+    """
+
+    # Maximum number of requests to the source in flight at once.
+    limit = 4
+
+    def __init__(self, url: str | None = None) -> None:
+        """
+        :param url: Base URL of API. Defaults to the source's public API.
+        """
+        if url is not None:
+            self.url = url
+
+    @abc.abstractmethod
+    def get_price(
+        self, client: httpx.Client, ticker: str, date: datetime.date
+    ) -> tuple[Decimal, str | None]:
+        """Returns latest price of ticker on or before date, and its currency.
+
+        :param client: HTTP client.
+        :param ticker: Source's symbol for commodity.
+        :param date: Date to price commodity on.
+
+        :return: Price and currency, or None if the API doesn't give the currency.
+        """
+
+
+class Yahoo(Source):
+    """Yahoo Finance daily closing prices."""
+
+    url = "https://query1.finance.yahoo.com"
+
+    def get_price(
+        self, client: httpx.Client, ticker: str, date: datetime.date
+    ) -> tuple[Decimal, str | None]:
+        # Request the week before date, so there's a close even after holidays.
+        start = datetime.datetime.combine(
+            date - datetime.timedelta(days=7), datetime.time(), datetime.UTC
+        )
+        end = datetime.datetime.combine(
+            date + datetime.timedelta(days=2), datetime.time(), datetime.UTC
+        )
+        response = client.get(
+            f"{self.url}/v8/finance/chart/{ticker}",
+            params={
+                "period1": int(start.timestamp()),
+                "period2": int(end.timestamp()),
+                "interval": "1d",
+            },
+            # Yahoo rejects requests without a browser-like user agent.
+            headers={"User-Agent": "Mozilla/5.0"},
+        )
+        response.raise_for_status()
+        (result,) = response.json()["chart"]["result"]
+        # Timestamps are dates in the exchange's time zone.
+        offset = datetime.timedelta(seconds=result["meta"]["gmtoffset"])
+        closes = [
+            (
+                (
+                    datetime.datetime.fromtimestamp(timestamp, datetime.UTC) + offset
+                ).date(),
+                close,
+            )
+            for timestamp, close in zip(
+                result.get("timestamp", []),
+                result["indicators"]["quote"][0]["close"],
+            )
+            if close is not None
+        ]
+        _, close = max(
+            (close for close in closes if close[0] <= date),
+            key=lambda close: close[0],
+        )
+        return D(str(close)), result["meta"]["currency"]
+
+
+class Coinbase(Source):
+    """Coinbase spot prices."""
+
+    url = "https://api.coinbase.com"
+
+    def get_price(
+        self, client: httpx.Client, ticker: str, date: datetime.date
+    ) -> tuple[Decimal, str | None]:
+        response = client.get(
+            f"{self.url}/v2/prices/{ticker}/spot", params={"date": date.isoformat()}
+        )
+        response.raise_for_status()
+        data = response.json()["data"]
+        return D(data["amount"]), data["currency"]
+
+
+SOURCES = {"yahoo": Yahoo(), "coinbase": Coinbase()}
+
+
+class Job(typing.NamedTuple):
+    """Price of a commodity in a quote currency to fetch."""
+
+    currency: str
+    quote: str
+    # Alternative (source, ticker, invert) tuples, tried in order.
+    sources: list[tuple[str, str, bool]]
+
+
+def parse_metadata(currency: str, value: str) -> list[Job]:
+    """Returns jobs from a commodity's `price` metadata.
+
+    :param currency: Commodity.
+    :param value: Metadata value, in bean-price's format (see above).
+    """
+    jobs = []
+    for specification in value.split():
+        quote, _, alternatives = specification.partition(":")
+        sources = []
+        # Specifications without alternatives (e.g., "AUD:") have no sources.
+        for alternative in filter(None, alternatives.split(",")):
+            source, _, ticker = alternative.partition("/")
+            # bean-price also accepts full module names.
+            source = source.removeprefix("beanprice.sources.")
+            sources.append((source, ticker.removeprefix("^"), ticker.startswith("^")))
+        jobs.append(Job(currency, quote, sources))
+    return jobs
+
+
+def jobs(entries: typing.Iterable[typing.NamedTuple], date: datetime.date) -> list[Job]:
+    """Returns jobs for all commodities with price sources, sorted by commodity.
+
+    Commodities already priced in the quote currency on date are skipped.
+
+    :param entries: Ledger entries.
+    :param date: Date to price commodities on.
+    """
+    priced = set()
+    commodities = []
+    for entry in entries:
+        if isinstance(entry, Price) and entry.date == date:
+            priced.add((entry.currency, entry.amount.currency))
+        elif isinstance(entry, Commodity) and "price" in entry.meta:
+            commodities.append(entry)
+    return [
+        job
+        for entry in sorted(commodities, key=lambda entry: entry.currency)
+        for job in parse_metadata(entry.currency, entry.meta["price"])
+        if (job.currency, job.quote) not in priced
+    ]
+
+
+class _Fetcher:
+    """Fetches prices, limiting concurrent requests to each source.
+
+    Each (source, ticker) pair is only fetched once. Later requests for the same
+    pair wait for, and share, the first request's result.
+    """
+
+    def __init__(
+        self, sources: dict[str, Source], client: httpx.Client, date: datetime.date
+    ) -> None:
+        self.sources = sources
+        self.client = client
+        self.date = date
+        self.semaphores = {
+            name: threading.Semaphore(source.limit) for name, source in sources.items()
+        }
+        self.futures = {}
+        self.lock = threading.Lock()
+
+    def fetch(self, source: str, ticker: str) -> tuple[Decimal, str | None]:
+        """Returns price and currency of ticker from source (see Source.get_price)."""
+        with self.lock:
+            future = self.futures.get((source, ticker))
+            first = future is None
+            if first:
+                future = self.futures[source, ticker] = concurrent.futures.Future()
+        if first:
+            try:
+                with self.semaphores[source]:
+                    future.set_result(
+                        self.sources[source].get_price(self.client, ticker, self.date)
+                    )
+            except Exception as exception:
+                future.set_exception(exception)
+        return future.result()
+
+    def price(self, job: Job) -> tuple[str, Price]:
+        """Returns name of source and price of job's commodity.
+
+        :raises ValueError: If job has no sources.
+        :raises Exception: The last alternative source's error, if none succeed.
+        """
+        if not job.sources:
+            raise ValueError(f"{job.currency} has no price sources for {job.quote}")
+        error = None
+        for source, ticker, invert in job.sources:
+            try:
+                if source not in self.sources:
+                    raise KeyError(f"unknown price source {source!r}")
+                number, currency = self.fetch(source, ticker)
+                # Inverted tickers are priced in the commodity.
+                if currency is not None and currency != (
+                    job.currency if invert else job.quote
+                ):
+                    raise ValueError(f"{source}/{ticker} is priced in {currency}")
+            except Exception as exception:
+                error = exception
+                continue
+            if invert:
+                number = 1 / number
+            return source, Price(
+                meta={},
+                date=self.date,
+                currency=job.currency,
+                amount=Amount(number, job.quote),
+            )  # type: ignore
+        raise error
+
+
+def fetch(
+    jobs: list[Job],
+    date: datetime.date,
+    sources: dict[str, Source] = SOURCES,
+) -> list[Result]:
+    """Fetches prices of all jobs concurrently.
+
+    Failures are printed for each commodity, and its other jobs carry on.
+
+    :param jobs: Jobs to fetch prices for.
+    :param date: Date to price commodities on.
+    :param sources: Maps names used in price metadata to sources.
+
+    :return: A result for each source, in the order of `sources`. Each contains
+        prices in the order of `jobs`.
+    """
+    start = time.monotonic()
+    with common.client() as client:
+        fetcher = _Fetcher(sources, client, date)
+        # Each job waits on at most one request at a time, and the semaphores
+        # limit requests to each source, so a thread for each job is enough.
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(len(jobs), 1)
+        ) as executor:
+            futures = [executor.submit(fetcher.price, job) for job in jobs]
+            prices = collections.defaultdict(list)
+            elapsed = collections.defaultdict(float)
+            for job, future in zip(jobs, futures):
+                try:
+                    source, price = future.result()
+                except Exception as exception:
+                    # Log exception type only, as for balances.
+                    print(
+                        f"Failed to fetch {job.currency} price in {job.quote} "
+                        f"({type(exception).__name__})."
+                    )
+                    continue
+                prices[source].append(price)
+                elapsed[source] = time.monotonic() - start
+    return [
+        Result(name, prices[name], None, elapsed[name])
+        for name in sources
+        if prices[name]
+    ]
+
+
+def update(
+    filename: str,
+    prices_filename: str,
+    date: datetime.date | None = None,
+    sources: dict[str, Source] = SOURCES,
+) -> None:
+    """Appends latest prices of commodities in ledger to prices file.
+
+    :param filename: Beancount ledger, including commodities and prices.
+    :param prices_filename: Ledger file to append prices to.
+    :param date: Date to price commodities on. Defaults to today.
+    :param sources: Maps names used in price metadata to sources.
+    """
+    date = date or queensland_now().date()
+    entries, _, _ = loader.load_file(filename)
+    ledger.append(
+        prices_filename, fetch(jobs(entries, date), date, sources), kind="prices"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=update.__doc__.splitlines()[0])
+    parser.add_argument("filename", help="Beancount ledger")
+    parser.add_argument("prices_filename", help="ledger file to append prices to")
+    parser.add_argument(
+        "--date",
+        type=datetime.date.fromisoformat,
+        help="date to price commodities on (default: today)",
+    )
+    args = parser.parse_args()
+    update(args.filename, args.prices_filename, args.date)
@@ -0,0 +1,79 @@
+"""Runs provider balance fetches concurrently.
+
+Each provider is a `(name, get_balances)` tuple, where `get_balances` is a callable
+taking no arguments and returning a list of Beancount directives. Providers are
+started at the same time in daemon threads, so a provider that never returns cannot
+stop the process from exiting.
+"""
+
+import threading
+import time
+import typing
+from concurrent.futures import Future
+
+
+class Result(typing.NamedTuple):
+    """Outcome of a single provider fetch."""
+
+    name: str
+    entries: list[typing.NamedTuple]
+    error: BaseException | None
+    elapsed: float
+
+
+def _run(future: Future, get_balances: typing.Callable[[], list]) -> None:
+    """Runs callable, setting (entries, error, elapsed) on future.
+
+    Elapsed time is measured here, when the callable finishes, rather than when its
+    result is collected.
+    """
+    if not future.set_running_or_notify_cancel():
+        return
+    start = time.monotonic()
+    try:
+        entries = get_balances()
+    except Exception as exception:
+        future.set_result(([], exception, time.monotonic() - start))
+    except BaseException as exception:
+        future.set_exception(exception)
+    else:
+        future.set_result((entries, None, time.monotonic() - start))
+
+
+def fetch(
+    providers: typing.Iterable[tuple[str, typing.Callable[[], list]]],
+    timeout: float = 60,
+    deadline: float = 180,
+) -> list[Result]:
+    """Fetches balances from all providers concurrently.
+
+    Results are returned in the same order as `providers`, regardless of the order
+    in which providers finish.
+
+    :param providers: Iterable of (name, get_balances) tuples.
+    :param timeout: Seconds each provider is allowed to run.
+    :param deadline: Seconds all providers are allowed to run.
+
+    :return: List of results, one for each provider.
+    """
+    start = time.monotonic()
+    futures = []
+    for name, get_balances in providers:
+        future = Future()
+        threading.Thread(
+            target=_run, args=(future, get_balances), name=name, daemon=True
+        ).start()
+        futures.append((name, future))
+
+    results = []
+    for name, future in futures:
+        # A provider's own timeout is measured from when it started, but no
+        # provider may run past the overall deadline.
+        remaining = start + min(timeout, deadline) - time.monotonic()
+        try:
+            entries, error, elapsed = future.result(timeout=max(remaining, 0))
+        except TimeoutError as exception:
+            future.cancel()
+            entries, error, elapsed = [], exception, time.monotonic() - start
+        results.append(Result(name, entries, error, elapsed))
+    return results
@@ -1,39 +1,35 @@
-import re
+import collections
+import concurrent.futures
 import typing
 import uuid
 
 import httpx
 from authlib.common.security import generate_token
+from authlib.integrations.base_client import OAuthError
 from authlib.integrations.httpx_client import OAuth2Client
-from beancount.core.data import Amount, Balance, D
+from beancount.core.data import Amount, Balance, D, Price
 
+from . import common
 from .common import queensland_now
+from .tokens import TokenStore
 
+# Hosts contacted during login, for opening connections ahead of time.
+URLS = ("https://auth.selfwealth.com.au", "https://api.selfwealth.com.au")
 
-def get_balances(
-    email: str, password: str, otp: str, account_prefix="Assets:SelfWealth:"
-) -> list[typing.NamedTuple]:
-    """Returns SelfWealth account balances as Beancount Balance directives.
+TOKEN_URL = "https://auth.selfwealth.com.au/connect/token"
 
-    SelfWealth assets are represented as separate accounts. That is, one account
-    for each security and cash balance.
+# Maps codes of cash holdings to currency codes.
+CASH_CODES = {"CASH": "AUD", "US CASH": "USD"}
 
+
+def _login(oauth2_client: OAuth2Client, email: str, password: str, otp: str) -> None:
+    """Authenticates OAuth2 client with SelfWealth's interactive login flow.
+
+    :param oauth2_client: Client to set token on.
     :param email: SelfWealth email address.
     :param password: Selfwealth password.
     :param otp: Selfwealth one-time pin.
-    :param account_prefix: Prefix account names with this string.
-
-    :return: List of Balance directives.
     """
-    oauth2_client = OAuth2Client(
-        client_id="mobile",
-        # Client secrets seem to be arbitrary UUIDs 🤷. See authorization header
-        # in request to https://auth.selfwealth.com.au/connect/token
-        client_secret=str(uuid.uuid4()).upper(),
-        scope="mobileAPI offline_access",
-        redirect_uri="au.com.selfwealth://callback",
-        code_challenge_method="S256",
-    )
     # SelfWealth state, code and nonce tokens are 43 characters long.
     state, code_verifier, nonce = (
         generate_token(43),
@@ -49,15 +45,20 @@ def get_balances(
         prompt="login",
     )
 
-    with httpx.Client() as http_client:
-        # Authorization URL redirects to SelfWealth login page.
-        response = http_client.get(authorization_url, follow_redirects=True)
-
-        # Parse XSRF token and return URL from login page.
-        xsrf_token = re.search(
-            r'<input name="__aft" type="hidden" value="(.+?)" />', response.text
-        ).group(1)
-        return_url = re.search(r"ReturnUrl: '(.+?)',", response.text).group(1)
+    with common.client() as http_client:
+        # Authorization URL redirects to SelfWealth login page. Parse XSRF token
+        # and return URL from login page.
+        with http_client.stream(
+            "GET", authorization_url, follow_redirects=True
+        ) as response:
+            fields = common.extract_fields(
+                response,
+                {
+                    "__aft": r'<input name="__aft" type="hidden" value="(.+?)" />',
+                    "ReturnUrl": r"ReturnUrl: '(.+?)',",
+                },
+            )
+        xsrf_token, return_url = fields["__aft"], fields["ReturnUrl"]
 
         # This might check if a captcha needs to be completed. It is not strictly
         # necessary, but we do it to run asserts in order to notice if things change.
@@ -103,22 +104,93 @@ def get_balances(
     # Finally, we can get the token! Setting the token here allows us to make
     # authenticated requests using the OAuth2 client.
     oauth2_client.token = oauth2_client.fetch_token(
-        url="https://auth.selfwealth.com.au/connect/token",
+        url=TOKEN_URL,
         state=state,
         # The code is contained in the query parameters of the redirect URI.
         authorization_response=str(response.next_request.url),
         code_verifier=code_verifier,
     )
 
-    # Get portfolio ID (ignoring "virtual" portfolios).
+
+def _refresh(oauth2_client: OAuth2Client, token_store: TokenStore | None) -> bool:
+    """Authenticates OAuth2 client with saved refresh token.
+
+    :param oauth2_client: Client to set token on.
+    :param token_store: Store containing token saved by a previous run.
+
+    :return: True if client was authenticated, False if there is no saved refresh
+        token, SelfWealth rejected it, or the refresh failed (e.g., an HTML error
+        page instead of a token).
+    """
+    token = token_store.load("selfwealth") if token_store else None
+    if not token or "refresh_token" not in token:
+        return False
+    try:
+        # This sets the client's token.
+        oauth2_client.refresh_token(TOKEN_URL, refresh_token=token["refresh_token"])
+    except (OAuthError, httpx.HTTPError, ValueError):
+        return False
+    return True
+
+
+def get_balances(
+    email: str,
+    password: str,
+    otp: str,
+    account_prefix="Assets:SelfWealth:",
+    token_store: TokenStore | None = None,
+    prices: bool = False,
+) -> list[typing.NamedTuple]:
+    """Returns SelfWealth account balances as Beancount Balance directives.
+
+    SelfWealth assets are represented as separate accounts. That is, one account
+    for each security and cash balance. Holdings of all trading portfolios are
+    fetched concurrently and summed.
+
+    Holdings include their latest prices. If `prices` is true, Price directives
+    for each security are returned after the balances, so other price sources
+    need not be queried for these securities.
+
+    If a token store is given, the refresh token saved by the previous run is used
+    to get an access token, skipping the interactive login. The interactive login
+    (and one-time pin) is used only when there is no saved refresh token, or
+    SelfWealth rejects it or fails to exchange it.
+
+    :param email: SelfWealth email address.
+    :param password: Selfwealth password.
+    :param otp: Selfwealth one-time pin.
+    :param account_prefix: Prefix account names with this string.
+    :param token_store: Store for keeping tokens between runs.
+    :param prices: Also return Price directives.
+
+    :return: List of Balance directives, followed by Price directives.
+    """
+    oauth2_client = common.client(
+        OAuth2Client,
+        client_id="mobile",
+        # Client secrets seem to be arbitrary UUIDs 🤷. See authorization header
+        # in request to https://auth.selfwealth.com.au/connect/token
+        client_secret=str(uuid.uuid4()).upper(),
+        scope="mobileAPI offline_access",
+        redirect_uri="au.com.selfwealth://callback",
+        code_challenge_method="S256",
+    )
+
+    if not _refresh(oauth2_client, token_store):
+        _login(oauth2_client, email, password, otp)
+    if token_store:
+        # SelfWealth may rotate refresh tokens, so always save the latest token.
+        token_store.save("selfwealth", dict(oauth2_client.token))
+
+    # Get IDs of all portfolios (ignoring "virtual" portfolios).
     # See https://apitest.selfwealth.com.au/swagger/index.html?urls.primaryName=SelfWealth%20Mobile%20API%20V4#operations-Mobile-get_api_v4_Mobile_portfolios
-    portfolio_id = next(
+    portfolio_ids = [
         portfolio["portfolioId"]
         for portfolio in oauth2_client.get(
             "https://api.selfwealth.com.au/api/v4/Mobile/portfolios"
         ).json()["data"]["portfolios"]
         if portfolio["tradingStatusId"]
-    )
+    ]
 
     # /api/v3.3/Mobile/GetHoldings endpoint returns an object like the following.
     # See https://apitest.selfwealth.com.au/swagger/index.html?urls.primaryName=SelfWealth%20Mobile%20API%20V3.3#operations-Mobile-get_api_v3_3_Mobile_GetHoldings
@@ -150,30 +222,55 @@ def get_balances(
     #   },
     #   ...
     # ]
-    now = queensland_now()
-    balances = []
-    for holding in oauth2_client.get(
-        "https://api.selfwealth.com.au/api/v3.3/Mobile/GetHoldings",
-        params={"PortfolioId": portfolio_id},
-    ).json():
-        # Make it so each holding's code is either a currency code or stock symbol.
-        code = holding["Code"]
-        if code == "CASH":
-            code = "AUD"
-        elif code == "US CASH":
-            code = "USD"
-        balances.append(
-            Balance(
-                meta={},
-                date=now.date(),
-                account=f"{account_prefix}{code}",
-                amount=Amount(
-                    D(str(holding["TotalUnits"])),
-                    code,
-                ),
-                tolerance=None,
-                diff_amount=None,
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        portfolios_holdings = list(
+            executor.map(
+                lambda portfolio_id: oauth2_client.get(
+                    "https://api.selfwealth.com.au/api/v3.3/Mobile/GetHoldings",
+                    params={"PortfolioId": portfolio_id},
+                ).json(),
+                portfolio_ids,
             )
         )
     oauth2_client.close()
+
+    now = queensland_now()
+    # Sum units of each holding across portfolios, so account names don't depend
+    # on which portfolio a holding is in.
+    units = collections.defaultdict(D)
+    price_entries = {}
+    for holdings in portfolios_holdings:
+        # Holdings are priced in the currency of their market. Work out each
+        # market's currency from its cash holding.
+        market_currencies = {
+            holding["ProductMarketGroupId"]: CASH_CODES[holding["Code"]]
+            for holding in holdings
+            if holding["Code"] in CASH_CODES
+        }
+        for holding in holdings:
+            # Make it so each holding's code is either a currency code or stock symbol.
+            code = CASH_CODES.get(holding["Code"], holding["Code"])
+            units[code] += D(str(holding["TotalUnits"]))
+            currency = market_currencies.get(holding["ProductMarketGroupId"])
+            if not holding["IsCash"] and currency and holding["Price"]:
+                price_entries[code] = Price(
+                    meta={},
+                    date=now.date(),
+                    currency=code,
+                    amount=Amount(D(str(holding["Price"])), currency),
+                )  # type: ignore
+
+    balances = [
+        Balance(
+            meta={},
+            date=now.date(),
+            account=f"{account_prefix}{code}",
+            amount=Amount(number, code),
+            tolerance=None,
+            diff_amount=None,
+        )  # type: ignore
+        for code, number in units.items()
+    ]
+    if prices:
+        return balances + list(price_entries.values())
     return balances
@@ -0,0 +1,87 @@
+"""Caches authenticated HTTP sessions between runs.
+
+A session is a cookie jar plus any provider-specific state (e.g., auth headers).
+Sessions are kept in a token store (see `portfolio.tokens`), so they are encrypted
+at rest, and expire after a fixed time to live. Providers should still check that a
+loaded session is valid before relying on it, as servers may end sessions early.
+
+The time to live is short (minutes, as banks end idle sessions), so sessions are
+only resumed by a run shortly after the previous one, such as a rerun of a failed
+update. Providers whose sessions must be ended on the server shouldn't be cached.
+"""
+
+import http.cookiejar
+import time
+import typing
+
+import httpx
+
+from .tokens import TokenStore
+
+
+class Session(typing.NamedTuple):
+    """Saved session."""
+
+    cookies: httpx.Cookies
+    state: dict
+    saved_at: float
+
+
+def dump_cookies(cookies: httpx.Cookies) -> list[dict]:
+    """Returns cookies as a JSON-serialisable list, skipping expired cookies."""
+    dumped = []
+    for cookie in cookies.jar:
+        if cookie.is_expired():
+            continue
+        attributes = dict(vars(cookie))
+        attributes["rest"] = attributes.pop("_rest")
+        dumped.append(attributes)
+    return dumped
+
+
+def load_cookies(dumped: list[dict]) -> httpx.Cookies:
+    """Returns cookies from list created by `dump_cookies`."""
+    cookies = httpx.Cookies()
+    for attributes in dumped:
+        cookies.jar.set_cookie(http.cookiejar.Cookie(**attributes))
+    return cookies
+
+
+class SessionCache:
+    """Saves and loads sessions by name."""
+
+    def __init__(self, store: TokenStore, ttl: float = 30 * 60) -> None:
+        """
+        :param store: Store that sessions are kept in.
+        :param ttl: Seconds after which a saved session is no longer loaded.
+        """
+        self.store = store
+        self.ttl = ttl
+
+    def load(self, name: str) -> Session | None:
+        """Returns saved session, or None if there is none or it has expired."""
+        saved = self.store.load(f"session-{name}")
+        if not saved or time.time() - saved["saved_at"] > self.ttl:
+            return None
+        return Session(
+            cookies=load_cookies(saved["cookies"]),
+            state=saved["state"],
+            saved_at=saved["saved_at"],
+        )
+
+    def save(
+        self, name: str, cookies: httpx.Cookies, state: dict | None = None
+    ) -> None:
+        """Saves session, replacing any existing session."""
+        self.store.save(
+            f"session-{name}",
+            {
+                "cookies": dump_cookies(cookies),
+                "state": state or {},
+                "saved_at": time.time(),
+            },
+        )
+
+    def delete(self, name: str) -> None:
+        """Deletes saved session, if any."""
+        self.store.delete(f"session-{name}")
@@ -0,0 +1,83 @@
+"""Materialises valuation tables in a database converted from a ledger by bean-sql."""
+
+import argparse
+import sqlite3
+from pathlib import Path
+
+from . import fx
+
+# Creates normalised_balance_aud table.
+TABLES_SQL = Path(__file__).parent.parent / "tables.sql"
+# Creates latest_balance, change and asset value rollup tables from
+# normalised_balance_aud.
+SUMMARY_TABLES_SQL = Path(__file__).parent.parent / "summary_tables.sql"
+
+
+def materialise(connection: sqlite3.Connection, full=False) -> None:
+    """Materialises valuation tables.
+
+    rate_aud is rewritten first (see portfolio.fx).
+
+    By default, rows of normalised_balance_aud are materialised only for new dates
+    and dates on or after the earliest backdated balance or price entry (see
+    tables.sql). latest_balance, change and the rollups are always rebuilt (see
+    summary_tables.sql).
+
+    :param connection: Database connection.
+    :param full: Rebuild normalised_balance_aud from scratch.
+    """
+    if full:
+        connection.executescript("""
+            drop table if exists normalised_balance_aud;
+            drop table if exists normalised_balance_aud_fingerprint;
+            """)
+    fx.write(connection)
+    connection.executescript(TABLES_SQL.read_text())
+    connection.executescript(SUMMARY_TABLES_SQL.read_text())
+
+
+def verify(connection: sqlite3.Connection) -> list[tuple]:
+    """Compares normalised_balance_aud with the result of a full rebuild.
+
+    Must be called after `materialise`, on the same connection.
+
+    :param connection: Database connection.
+
+    :return: Rows in either normalised_balance_aud or a full rebuild, but not both.
+    """
+    # Materialising from the empty string covers every date.
+    connection.execute("update temp.since set date = ''")
+    return connection.execute("""
+        select * from (
+          select * from normalised_balance_aud
+          except
+          select * from temp.normalised_balance_aud_since
+        )
+        union all
+        select * from (
+          select * from temp.normalised_balance_aud_since
+          except
+          select * from normalised_balance_aud
+        )
+        """).fetchall()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=materialise.__doc__.splitlines()[0])
+    parser.add_argument("database", help="database converted by bean-sql")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="rebuild normalised_balance_aud from scratch",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="check normalised_balance_aud matches a full rebuild",
+    )
+    args = parser.parse_args()
+    connection = sqlite3.connect(args.database)
+    materialise(connection, full=args.full)
+    if args.verify and (rows := verify(connection)):
+        parser.exit(1, f"{len(rows)} rows differ from a full rebuild.\n")
+    connection.close()
@@ -0,0 +1,99 @@
+"""Stores OAuth 2.0 tokens between runs.
+
+Token stores implement the `TokenStore` protocol. `EncryptedFileTokenStore` keeps
+tokens in files encrypted with a key derived from a secret, so refresh tokens are
+never written to disk in plain text.
+"""
+
+import base64
+import json
+import os
+import typing
+from pathlib import Path
+
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+
+from .common import state_dir
+
+
+class TokenStore(typing.Protocol):
+    """Loads and saves tokens by name."""
+
+    def load(self, name: str) -> dict | None:
+        """Returns token saved under name, or None if there is no usable token."""
+        ...
+
+    def save(self, name: str, token: dict) -> None:
+        """Saves token under name, replacing any existing token."""
+        ...
+
+    def delete(self, name: str) -> None:
+        """Deletes token saved under name, if any."""
+        ...
+
+
+class EncryptedFileTokenStore:
+    """Stores each token in its own Fernet-encrypted file.
+
+    Each file contains a random salt followed by the encrypted token. The encryption
+    key is derived from the salt and `secret`. A token that cannot be decrypted
+    (e.g., because the secret changed) is treated as missing.
+    """
+
+    # PBKDF2 iterations, as recommended by Django at the time of writing.
+    iterations = 600_000
+    salt_length = 16
+
+    def __init__(self, secret: str, directory: Path | None = None) -> None:
+        """
+        :param secret: Secret from which encryption keys are derived.
+        :param directory: Directory to store token files in.
+        """
+        self.secret = secret.encode()
+        self.directory = directory or state_dir() / "tokens"
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(directory={str(self.directory)!r})"
+
+    def _path(self, name: str) -> Path:
+        return self.directory / f"{name}.token"
+
+    def _fernet(self, salt: bytes) -> Fernet:
+        kdf = PBKDF2HMAC(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=salt,
+            iterations=self.iterations,
+        )
+        return Fernet(base64.urlsafe_b64encode(kdf.derive(self.secret)))
+
+    def load(self, name: str) -> dict | None:
+        try:
+            content = self._path(name).read_bytes()
+        except FileNotFoundError:
+            return None
+        salt, ciphertext = content[: self.salt_length], content[self.salt_length :]
+        try:
+            return json.loads(self._fernet(salt).decrypt(ciphertext))
+        except (InvalidToken, ValueError):
+            return None
+
+    def save(self, name: str, token: dict) -> None:
+        salt = os.urandom(self.salt_length)
+        content = salt + self._fernet(salt).encrypt(json.dumps(token).encode())
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file that is only readable by this user, then move
+        # it into place so a partially written token is never loaded.
+        path = self._path(name)
+        temporary_path = path.with_suffix(".tmp")
+        with open(
+            os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600),
+            "wb",
+        ) as file:
+            file.write(content)
+        temporary_path.replace(path)
+
+    def delete(self, name: str) -> None:
+        self._path(name).unlink(missing_ok=True)
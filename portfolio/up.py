@@ -1,22 +1,78 @@
+import collections
+import datetime
+import json
 import typing
+from pathlib import Path
+from zoneinfo import ZoneInfo
 
-import requests
+import httpx
 from beancount.core.data import Amount, Balance, D
 
-from .common import queensland_now
+from . import common
+from .common import queensland_now, state_dir
 
+# Hosts contacted when retrieving balances, for opening connections ahead of time.
+URLS = ("https://api.up.com.au",)
 
-def ping(token: str) -> requests.Response:
+API_URL = "https://api.up.com.au/api/v1"
+
+# Largest page size supported by Up API.
+PAGE_SIZE = 100
+
+
+def ping(token: str) -> httpx.Response:
     """Pings Up API.
 
     :param token: Up API token.
 
     :return: Ping response.
     """
-    return requests.get(
-        url="https://api.up.com.au/api/v1/util/ping",
-        headers={"Authorization": f"Bearer {token}"},
-    )
+    with common.client() as client:
+        return client.get(
+            url=f"{API_URL}/util/ping",
+            headers={"Authorization": f"Bearer {token}"},
+        )
+
+
+def paginate(
+    client: httpx.Client, url: str, params: dict | None = None
+) -> typing.Iterator[dict]:
+    """Yields resources from every page of a paginated Up API response.
+
+    Up API responses contain at most one page of resources. The URL of the next
+    page is in `links.next` (see https://developer.up.com.au/#pagination).
+
+    :param client: Client with Up API authorization header.
+    :param url: URL of first page.
+    :param params: Query parameters for first page.
+
+    :return: Iterator of resources.
+    """
+    while url:
+        response = client.get(url, params=params)
+        response.raise_for_status()
+        page = response.json()
+        yield from page["data"]
+        # Next page URL includes query parameters.
+        url, params = page["links"]["next"], None
+
+
+def _balance(
+    account: dict, date: datetime.date, number, account_prefix: str
+) -> typing.NamedTuple:
+    """Returns Balance directive for Up account resource."""
+    return Balance(
+        meta={},
+        date=date,
+        account=f"{account_prefix}{account['attributes']['displayName']}",
+        amount=Amount(number, account["attributes"]["balance"]["currencyCode"]),
+        tolerance=None,
+        diff_amount=None,
+    )  # type: ignore
+
+
+def _is_transactional(account: dict) -> bool:
+    return account["attributes"]["accountType"] == "TRANSACTIONAL"
 
 
 def get_balances(token: str, account_prefix="Assets:Up:") -> list[typing.NamedTuple]:
@@ -31,22 +87,146 @@ def get_balances(token: str, account_prefix="Assets:Up:") -> list[typing.NamedTu
     :return: List of Balance directives.
     """
     now = queensland_now()
-    response = requests.get(
-        url="https://api.up.com.au/api/v1/accounts",
-        headers={"Authorization": f"Bearer {token}"},
-    )
+    with common.client(headers={"Authorization": f"Bearer {token}"}) as client:
+        accounts = list(
+            paginate(client, f"{API_URL}/accounts", params={"page[size]": PAGE_SIZE})
+        )
     return [
-        Balance(
-            meta={},
-            date=now.date(),
-            account=f"{account_prefix}{account['attributes']['displayName']}",
-            amount=Amount(
-                D(account["attributes"]["balance"]["value"]),
-                account["attributes"]["balance"]["currencyCode"],
-            ),
-            tolerance=None,
-            diff_amount=None,
-        )  # type: ignore
-        for account in response.json()["data"]
-        if account["attributes"]["accountType"] == "TRANSACTIONAL"
+        _balance(
+            account,
+            now.date(),
+            D(account["attributes"]["balance"]["value"]),
+            account_prefix,
+        )
+        for account in accounts
+        if _is_transactional(account)
     ]
+
+
+def _new_transactions(client: httpx.Client, account_id: str, mark: dict) -> list[dict]:
+    """Returns transactions created after high-water mark, newest first.
+
+    :param client: Client with Up API authorization header.
+    :param account_id: Up account ID.
+    :param mark: High-water mark with keys `created_at` and `transaction_id`.
+
+    :return: List of transaction resources.
+    """
+    transactions = []
+    # filter[since] includes transactions created at exactly that time, so stop at
+    # the transaction seen last time.
+    for transaction in paginate(
+        client,
+        f"{API_URL}/accounts/{account_id}/transactions",
+        params={"page[size]": PAGE_SIZE, "filter[since]": mark["created_at"]},
+    ):
+        if transaction["id"] == mark["transaction_id"]:
+            break
+        transactions.append(transaction)
+    return transactions
+
+
+def _daily_balances(
+    account: dict,
+    transactions: list[dict],
+    synced_on: datetime.date,
+    today: datetime.date,
+    account_prefix: str,
+) -> list[typing.NamedTuple]:
+    """Returns end-of-day balances for each day after synced_on and before today.
+
+    Starting from the account's current balance, each day's transactions are undone
+    to find the balance at the end of the previous day.
+
+    :param account: Up account resource.
+    :param transactions: Transactions created since previous sync.
+    :param synced_on: Date of previous sync.
+    :param today: Today's date.
+    :param account_prefix: Prefix account names with this string.
+
+    :return: List of Balance directives, oldest first.
+    """
+    timezone = ZoneInfo("Australia/Queensland")
+    day_totals = collections.defaultdict(D)
+    for transaction in transactions:
+        created_on = (
+            datetime.datetime.fromisoformat(transaction["attributes"]["createdAt"])
+            .astimezone(timezone)
+            .date()
+        )
+        day_totals[created_on] += D(transaction["attributes"]["amount"]["value"])
+
+    balances = []
+    number = D(account["attributes"]["balance"]["value"])
+    day = today
+    while day - datetime.timedelta(days=1) > synced_on:
+        number -= day_totals[day]
+        day -= datetime.timedelta(days=1)
+        balances.append(_balance(account, day, number, account_prefix))
+    return balances[::-1]
+
+
+def sync(
+    token: str, account_prefix="Assets:Up:", state_path: Path | None = None
+) -> list[typing.NamedTuple]:
+    """Returns Up account balances, backfilling daily balances since the last sync.
+
+    Like `get_balances`, but also fetches transactions created since the previous
+    sync. These are used to work out each account's balance at the end of every day
+    between the previous sync and today. A high-water mark (the newest transaction's
+    ID and creation time) is saved for each account, so each sync fetches only new
+    transactions. The first sync of an account just saves a high-water mark.
+
+    :param token: Up API token.
+    :param account_prefix: Prefix account names with this string.
+    :param state_path: JSON file in which high-water marks are saved.
+
+    :return: List of Balance directives, sorted by date.
+    """
+    now = queensland_now()
+    state_path = state_path or state_dir() / "up.json"
+    try:
+        state = json.loads(state_path.read_text())
+    except FileNotFoundError:
+        state = {}
+
+    balances = []
+    with common.client(headers={"Authorization": f"Bearer {token}"}) as client:
+        for account in paginate(
+            client, f"{API_URL}/accounts", params={"page[size]": PAGE_SIZE}
+        ):
+            if not _is_transactional(account):
+                continue
+            mark = state.get(account["id"])
+            if mark:
+                transactions = _new_transactions(client, account["id"], mark)
+                balances.extend(
+                    _daily_balances(
+                        account,
+                        transactions,
+                        datetime.date.fromisoformat(mark["synced_on"]),
+                        now.date(),
+                        account_prefix,
+                    )
+                )
+            else:
+                transactions = []
+                mark = {"created_at": now.isoformat(), "transaction_id": None}
+            if transactions:
+                mark = {
+                    "created_at": transactions[0]["attributes"]["createdAt"],
+                    "transaction_id": transactions[0]["id"],
+                }
+            state[account["id"]] = mark | {"synced_on": now.date().isoformat()}
+            balances.append(
+                _balance(
+                    account,
+                    now.date(),
+                    D(account["attributes"]["balance"]["value"]),
+                    account_prefix,
+                )
+            )
+
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    state_path.write_text(json.dumps(state, indent=2))
+    return sorted(balances, key=lambda balance: balance.date)
@@ -1,21 +1,51 @@
+import argparse
 import io
-import sys
+from pathlib import Path
 
 import pyotp
-from beancount.parser import printer
 from ubank import Passkey
 
-from . import bankwest, secrets, selfwealth, ubank, up
+from . import (
+    bankwest,
+    common,
+    ledger,
+    scheduler,
+    secrets,
+    selfwealth,
+    sessions,
+    tokens,
+    ubank,
+    up,
+)
 
 
-def update(filename="balances.beancount") -> None:
-    """Updates ledger with latest account balances."""
-    # Iterate over (name, get_balances) tuples. For each tuple, retrieve balances
-    # and append to ledger file.
-    for name, get_balances in (
+def update(
+    filename="balances.beancount",
+    timeout=60,
+    deadline=180,
+    changes_only=False,
+    *,
+    prices_filename: str | None = None,
+) -> None:
+    """Updates ledger with latest account balances.
+
+    Balances are retrieved from all financial institutions concurrently, then
+    appended to the ledger in a fixed order. Prices returned with balances (by
+    SelfWealth) are appended to the prices file, with all other prices.
+
+    :param filename: Ledger file to append balances to.
+    :param timeout: Seconds each institution is allowed to take.
+    :param deadline: Seconds all institutions are allowed to take.
+    :param changes_only: Write only balances that have changed (see ledger.append).
+    :param prices_filename: Ledger file to append prices to. Defaults to
+        prices.beancount next to the balances file.
+    """
+    # Define (name, get_balances) tuples. Balances are retrieved concurrently and
+    # appended to ledger file in this order.
+    providers = (
         (
             "Up",
-            lambda: up.get_balances(token=secrets.up.api_token),
+            lambda: up.sync(token=secrets.up.api_token),
         ),
         (
             "SelfWealth",
@@ -23,6 +53,13 @@ def update(filename="balances.beancount") -> None:
                 email=secrets.selfwealth.email,
                 password=secrets.selfwealth.password,
                 otp=pyotp.TOTP(secrets.selfwealth.totp_key).now(),
+                # Reuse refresh token from previous run, encrypted with a key
+                # derived from the SelfWealth password.
+                token_store=tokens.EncryptedFileTokenStore(
+                    secret=secrets.selfwealth.password
+                ),
+                # Record prices of held securities, so portfolio.prices skips them.
+                prices=True,
             ),
         ),
         (
@@ -31,6 +68,9 @@ def update(filename="balances.beancount") -> None:
                 bankwest.get_balance(
                     pan=secrets.bankwest.pan,
                     password=secrets.bankwest.password,
+                    session_cache=sessions.SessionCache(
+                        tokens.EncryptedFileTokenStore(secret=secrets.bankwest.password)
+                    ),
                 )
             ],
         ),
@@ -40,17 +80,37 @@ def update(filename="balances.beancount") -> None:
                 passkey=Passkey.load(io.BytesIO(secrets.ubank.passkey))
             ),
         ),
-    ):
-        # Open ledger file in append mode.
-        with open(filename, mode="a") as file:
-            try:
-                balances = get_balances()
-                print(f"Retrieved {len(balances)} {name} balances.")
-                printer.print_entries(balances, file=file)
-                print(f"Wrote {name} balances to {file.name}.")
-            except Exception:
-                print(f"Failed to update {name} balances.")
+    )
+    # Open connections to all hosts up front, so login flows start with warm
+    # connections.
+    common.preconnect(up.URLS + selfwealth.URLS + bankwest.URLS)
+    balances, prices = ledger.split_prices(
+        scheduler.fetch(providers, timeout=timeout, deadline=deadline)
+    )
+    ledger.append(filename, balances, changes_only=changes_only)
+    ledger.append(
+        prices_filename or Path(filename).with_name("prices.beancount"),
+        prices,
+        kind="prices",
+    )
 
 
 if __name__ == "__main__":
-    update(sys.argv[1])
+    parser = argparse.ArgumentParser(description=update.__doc__.splitlines()[0])
+    parser.add_argument("filename", help="ledger file to append balances to")
+    parser.add_argument(
+        "--prices-filename",
+        help="ledger file to append prices to (default: prices.beancount next to "
+        "the balances file)",
+    )
+    parser.add_argument(
+        "--changes-only",
+        action="store_true",
+        help="write only balances that changed since they were last written",
+    )
+    args = parser.parse_args()
+    update(
+        args.filename,
+        changes_only=args.changes_only,
+        prices_filename=args.prices_filename,
+    )
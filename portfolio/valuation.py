@@ -0,0 +1,216 @@
+"""Values balances of a Beancount ledger in AUD with NumPy.
+
+This is an alternative to materialising normalised_balance_aud with tables.sql.
+Balance entries are loaded into a dense date × account array of entry indices,
+which is forward-filled with a running maximum. Entries are sorted by date, so the
+greatest index on or before a date is the latest entry, as with the entry IDs used
+by tables.sql. Balances are valued with a dense date × commodity array of rates
+resolved by portfolio.fx.
+"""
+
+import argparse
+import sqlite3
+import typing
+from decimal import Decimal
+
+import numpy as np
+from beancount.core.data import Balance, Price
+
+from . import fx, loader
+from .tables import SUMMARY_TABLES_SQL
+
+# Same columns and declared types as normalised_balance_aud created by tables.sql.
+SCHEMA = """
+create table normalised_balance_aud (
+  date NUM,
+  account TEXT,
+  amount_number NUM,
+  amount_currency TEXT,
+  price_aud,
+  value_number,
+  value_currency,
+  asset,
+  "max(price_aud.date)" NUM
+)
+"""
+
+
+def _number(number: Decimal) -> int | float:
+    """Returns number as SQLite stores a decimal converted by bean-sql.
+
+    bean-sql stores decimals as text in columns with numeric affinity, which
+    SQLite converts to integers if they are whole numbers.
+    """
+    if number == number.to_integral_value() and abs(number) < 2**63:
+        return int(number)
+    return float(number)
+
+
+def _numbers(numbers: list[Decimal]) -> tuple[np.ndarray, np.ndarray]:
+    """Returns numbers as floats, and whether each number is an integer."""
+    numbers = [_number(number) for number in numbers]
+    return (
+        np.array(numbers, dtype=float),
+        np.array([isinstance(number, int) for number in numbers], dtype=bool),
+    )
+
+
+def _fill(shape: tuple[int, int], rows, columns) -> np.ndarray:
+    """Returns array of the latest entry index on or before each row.
+
+    :param shape: Shape of array (dates, columns).
+    :param rows: Date index of each entry.
+    :param columns: Column index of each entry.
+
+    :return: Array of entry indices, or -1 where there is no entry.
+    """
+    latest = np.full(shape, -1)
+    np.maximum.at(latest, (rows, columns), np.arange(len(rows)))
+    return np.maximum.accumulate(latest, axis=0)
+
+
+def value(entries: list[typing.NamedTuple]) -> list[tuple]:
+    """Returns rows of normalised_balance_aud for ledger entries.
+
+    Each account's latest balance is carried forward to every valuation date (dates
+    with a balance entry, or a price entry on or after the first balance entry),
+    then valued with its commodity's rate to AUD on that date.
+
+    :param entries: Ledger entries, sorted by date.
+
+    :return: Rows sorted by date and account.
+    """
+    balances = [entry for entry in entries if isinstance(entry, Balance)]
+    if not balances:
+        return []
+
+    dates = sorted(
+        {
+            entry.date.isoformat()
+            for entry in entries
+            if isinstance(entry, Balance)
+            or isinstance(entry, Price)
+            and entry.date >= balances[0].date
+        }
+    )
+    accounts = sorted({entry.account for entry in balances})
+    commodities = sorted({entry.amount.currency for entry in balances})
+    commodity_index = {commodity: i for i, commodity in enumerate(commodities)}
+
+    # Latest balance of each account on each date.
+    balance_number, balance_is_int = _numbers(
+        [entry.amount.number for entry in balances]
+    )
+    balance_commodity = np.array(
+        [commodity_index[entry.amount.currency] for entry in balances], dtype=int
+    )
+    latest_balance = _fill(
+        (len(dates), len(accounts)),
+        np.searchsorted(dates, [entry.date.isoformat() for entry in balances]),
+        np.searchsorted(accounts, [entry.account for entry in balances]),
+    )
+
+    # Rate of each commodity to AUD on each date (see portfolio.fx). Commodities
+    # without a rate keep a rate of 1.
+    shape = (len(dates), len(commodities))
+    rate, rate_is_int = np.ones(shape), np.ones(shape, dtype=bool)
+    has_rate = np.zeros(shape, dtype=bool)
+    price_date = np.full(shape, None, dtype=object)
+    date_index = {date: i for i, date in enumerate(dates)}
+    for fx_rate in fx.rates(
+        [
+            fx.Price(
+                entry.date.isoformat(),
+                entry.currency,
+                _number(entry.amount.number),
+                entry.amount.currency,
+            )
+            for entry in entries
+            if isinstance(entry, Price)
+        ],
+        dates,
+    ):
+        if fx_rate.currency in commodity_index:
+            index = date_index[fx_rate.date], commodity_index[fx_rate.currency]
+            rate[index] = fx_rate.rate
+            rate_is_int[index] = isinstance(fx_rate.rate, int)
+            has_rate[index] = True
+            price_date[index] = fx_rate.price_date
+
+    # Value balances.
+    date_index, account_index = np.nonzero(latest_balance >= 0)
+    balance = latest_balance[date_index, account_index]
+    index = date_index, balance_commodity[balance]
+    value_number = balance_number[balance] * rate[index]
+    value_is_int = balance_is_int[balance] & rate_is_int[index]
+
+    rows = []
+    for i, j, b, price_aud, price_aud_is_int, has_price, v, v_is_int, date in zip(
+        date_index.tolist(),
+        account_index.tolist(),
+        balance.tolist(),
+        rate[index].tolist(),
+        rate_is_int[index].tolist(),
+        has_rate[index].tolist(),
+        value_number.tolist(),
+        value_is_int.tolist(),
+        price_date[index].tolist(),
+    ):
+        account = accounts[j]
+        currency = balances[b].amount.currency
+        if account == "Assets:Vanguard:Super":
+            # Super balance in AUD is considered VDHG.
+            asset = "VDHG"
+        elif currency in ("AUD", "USD"):
+            # AUD and USD are considered cash.
+            asset = "Cash"
+        else:
+            asset = currency
+        rows.append(
+            (
+                dates[i],
+                account,
+                _number(balances[b].amount.number),
+                currency,
+                int(price_aud) if price_aud_is_int else price_aud,
+                int(v) if v_is_int else v,
+                fx.TARGET if has_price else currency,
+                asset,
+                date,
+            )
+        )
+    return rows
+
+
+def write(connection: sqlite3.Connection, entries: list[typing.NamedTuple]) -> None:
+    """Writes normalised_balance_aud, latest_balance and change tables.
+
+    normalised_balance_aud is replaced with rows valued by `value`.
+    summary_tables.sql then creates latest_balance, change and the rollups from it.
+
+    :param connection: Database connection. change requires a target_allocation
+        table.
+    :param entries: Ledger entries, sorted by date.
+    """
+    rows = value(entries)
+    with connection:
+        # Incremental materialisation by tables.sql must start from scratch.
+        connection.execute("drop table if exists normalised_balance_aud_fingerprint")
+        connection.execute("drop table if exists normalised_balance_aud")
+        connection.execute(SCHEMA)
+        connection.executemany(
+            "insert into normalised_balance_aud values (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+    connection.executescript(SUMMARY_TABLES_SQL.read_text())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=write.__doc__.splitlines()[0])
+    parser.add_argument("filename", help="Beancount ledger")
+    parser.add_argument("database", help="database converted from ledger by bean-sql")
+    args = parser.parse_args()
+    entries, _, _ = loader.load_file(args.filename)
+    connection = sqlite3.connect(args.database)
+    write(connection, entries)
+    connection.close()
@@ -0,0 +1,117 @@
+-- Tables summarising normalised_balance_aud, rebuilt whenever it changes: latest
+-- balances, changes required to reach target allocations (see
+-- target_allocation.sql), and rollups of each asset's value for dashboard charts.
+-- normalised_balance_aud is materialised by tables.sql, or by portfolio.valuation.
+
+-- Latest balances of each account.
+drop table if exists latest_balance;
+create table latest_balance as
+select
+  *,
+  max(date)
+from
+  normalised_balance_aud
+group by
+  account;
+
+
+-- Calculate changes required to reach target allocations.
+drop table if exists change;
+create table change as
+-- Group accounts into asset categories.
+with asset as (
+  select
+    date,
+    latest_balance.asset,
+    price_aud,
+    sum(value_number) as value
+  from
+    latest_balance
+  where
+    -- Don't treat debt as cash.
+    account not like 'Liabilities:StateCustodians:%'
+  group by
+    latest_balance.asset
+),
+total as (
+  select sum(value) as total
+  from asset
+)
+select
+  asset.*,
+  target,
+  total,
+  target * total as target_value,
+  value / total as actual,
+  target - value / total as change,
+  target * total - value as change_value,
+  (target * total - value) / price_aud as change_amount
+from
+  asset
+  join target_allocation on asset.asset = target_allocation.asset
+  join total;
+
+
+-- Value of each asset on each date, for the "Asset value over time" chart. The
+-- weekly and monthly rollups keep only the last date of each week (ending on
+-- Sunday) and month, so the chart can show long ranges in few rows (see
+-- metadata.yaml).
+drop table if exists asset_value_daily;
+create table asset_value_daily as
+select
+  date,
+  normalised_balance_aud.asset,
+  round(sum(value_number)) as value,
+  target_allocation.rowid as rank
+from
+  normalised_balance_aud
+  join target_allocation on normalised_balance_aud.asset = target_allocation.asset
+where
+  account not like 'Liabilities:StateCustodians:%'
+group by
+  date,
+  normalised_balance_aud.asset
+order by
+  date,
+  normalised_balance_aud.asset;
+create index asset_value_daily_date on asset_value_daily (date, asset, value, rank);
+
+drop table if exists asset_value_weekly;
+create table asset_value_weekly as
+select
+  *
+from
+  asset_value_daily
+where
+  date in (
+    select
+      max(date)
+    from
+      asset_value_daily
+    group by
+      date(date, 'weekday 0')
+  )
+order by
+  date,
+  asset;
+create index asset_value_weekly_date on asset_value_weekly (date, asset, value, rank);
+
+drop table if exists asset_value_monthly;
+create table asset_value_monthly as
+select
+  *
+from
+  asset_value_daily
+where
+  date in (
+    select
+      max(date)
+    from
+      asset_value_daily
+    group by
+      strftime('%Y-%m', date)
+  )
+order by
+  date,
+  asset;
+create index asset_value_monthly_date on asset_value_monthly (date, asset, value, rank);
@@ -1,11 +1,121 @@
--- Fill in balances in AUD for all accounts for every date with an entry.
-create table normalised_balance_aud as
--- Every date that has a balance entry.
+-- Requires rate_aud table, written by portfolio.fx.
+
+-- Index balance directives by account. bean-sql creates balance as a view joining
+-- entry (date) to balance_detail.
+create index if not exists balance_detail_account on balance_detail (account);
+
+-- Fingerprint balance and price entries on each date. Rows of
+-- normalised_balance_aud depend only on entries on or before their dates, so
+-- only rows on or after the earliest date whose fingerprint changed since the
+-- last run (or new dates) are materialised again.
+create table if not exists normalised_balance_aud_fingerprint (
+  date primary key,
+  fingerprint
+);
+drop view if exists temp.normalised_balance_aud_since;
+drop table if exists temp.entry_fingerprint;
+drop table if exists temp.since;
+create temp table entry_fingerprint as
+select
+  date,
+  group_concat(entry, ';') as fingerprint
+from
+  (
+    select
+      id,
+      date,
+      'balance ' || account || ' ' || amount_number || ' ' || amount_currency as entry
+    from
+      balance
+    union all
+    select
+      id,
+      date,
+      'price ' || currency || ' ' || amount_number || ' ' || amount_currency
+    from
+      price
+    order by
+      date,
+      id
+  )
+group by
+  date;
+-- Earliest date to materialise. This is null if nothing changed.
+create temp table since as
+select
+  min(date) as date
+from
+  (
+    select
+      date
+    from
+      (
+        select
+          *
+        from
+          temp.entry_fingerprint
+        except
+        select
+          *
+        from
+          normalised_balance_aud_fingerprint
+      )
+    union
+    select
+      date
+    from
+      (
+        select
+          *
+        from
+          normalised_balance_aud_fingerprint
+        except
+        select
+          *
+        from
+          temp.entry_fingerprint
+      )
+  );
+
+-- Fill in balances in AUD for all accounts for every valuation date, on or after
+-- the date to materialise.
+create temp view normalised_balance_aud_since as
+--
+-- "Latest" entries are found with window functions rather than by joining each
+-- date to every earlier entry. bean-sql numbers entries in date order, so the
+-- entry with the greatest id on or before a date is the latest entry.
+-- Every date that has a balance entry, or a price entry on or after the first
+-- balance entry, so holdings are valued on days only prices were fetched (e.g.,
+-- when no balance changed).
 with date as (
   select
-    distinct date
+    date
   from
-    balance
+    (
+      select
+        date
+      from
+        balance
+      union
+      select
+        date
+      from
+        price
+      where
+        date >= (
+          select
+            min(date)
+          from
+            balance
+        )
+    )
+  where
+    date >= (
+      select
+        date
+      from
+        temp.since
+    )
 ),
 -- First balance entries for each account.
 account as (
@@ -16,120 +126,116 @@ account as (
     balance
   group by
     account
-  order by
-    id
 ),
--- Fill in balances for all accounts for every date with an entry.
+-- Fill in balances for all accounts for every valuation date. Accounts appear
+-- only after their first balance entries.
 normalised_balance as (
   select
-    date.date,
-    account.account,
-    balance.amount_number,
-    balance.amount_currency,
-    max(balance.id)
-  from
-    date -- Accounts should appear only after their first balance entries.
-    join account on date.date >= account.first_balance_date
-    left join balance on date.date >= balance.date
-    and balance.account = account.account
-  group by
-    date.date,
-    account.account
-),
--- Convert all prices to AUD.
-price_aud as (
-  select
-    price.id,
-    price.date,
-    price.currency,
-    coalesce(
-      price.amount_number * price_2.amount_number,
-      price.amount_number
-    ) as amount_number,
-    coalesce(
-      price_2.amount_currency,
-      price.amount_currency
-    ) as amount_currency,
-    max(price_2.id)
+    *
   from
-    price
-    left join price as price_2 on price.amount_currency = price_2.currency
-    and price.date >= price_2.date
-  group by
-    price.id
+    (
+      select
+        distinct date,
+        account,
+        max(balance_id) over (
+          partition by account
+          order by
+            date
+        ) as balance_id
+      from
+        (
+          select
+            date.date,
+            account.account,
+            balance.id as balance_id
+          from
+            date
+            join account on date.date >= account.first_balance_date
+            left join balance on balance.account = account.account
+            and balance.date = date.date
+          union all
+          -- Latest balance entries before the date to materialise, which sort
+          -- before the dates above.
+          select
+            null,
+            account,
+            max(id)
+          from
+            balance
+          where
+            date < (
+              select
+                date
+              from
+                temp.since
+            )
+          group by
+            account
+        )
+    )
+  where
+    date is not null
 )
+-- Value balances with rates to AUD on the same date (see portfolio.fx).
 select
   normalised_balance.date,
   normalised_balance.account,
-  normalised_balance.amount_number,
-  normalised_balance.amount_currency,
-  coalesce(price_aud.amount_number, 1) as price_aud,
+  balance.amount_number,
+  balance.amount_currency,
+  coalesce(rate_aud.rate, 1) as price_aud,
   coalesce(
-    normalised_balance.amount_number * price_aud.amount_number,
-    normalised_balance.amount_number
+    balance.amount_number * rate_aud.rate,
+    balance.amount_number
   ) as value_number,
-  coalesce(
-    price_aud.amount_currency,
-    normalised_balance.amount_currency
+  iif(
+    rate_aud.rate is null,
+    balance.amount_currency,
+    'AUD'
   ) as value_currency,
   case
     -- Super balance in AUD is considered VDHG.
-    when account = 'Assets:Vanguard:Super' then 'VDHG'
+    when normalised_balance.account = 'Assets:Vanguard:Super' then 'VDHG'
     -- AUD and USD are considered cash.
-    when normalised_balance.amount_currency in ('AUD', 'USD') then 'Cash'
-    else normalised_balance.amount_currency
+    when balance.amount_currency in ('AUD', 'USD') then 'Cash'
+    else balance.amount_currency
   end as asset,
-  max(price_aud.date)
+  -- Date of the price used, named as in previous versions of this table.
+  rate_aud.price_date as "max(price_aud.date)"
 from
   normalised_balance
-  left join price_aud on normalised_balance.date >= price_aud.date
-  and normalised_balance.amount_currency = price_aud.currency
-group by
-  normalised_balance.date,
-  normalised_balance.account;
-
--- Latest balances of each account.
-create table latest_balance as
+  join balance on balance.id = normalised_balance.balance_id
+  left join rate_aud on rate_aud.date = normalised_balance.date
+  and rate_aud.currency = balance.amount_currency;
+create table if not exists normalised_balance_aud as
 select
-  *,
-  max(date)
+  *
 from
+  temp.normalised_balance_aud_since
+where
+  false;
+delete from
   normalised_balance_aud
-group by
+where
+  date >= (
+    select
+      date
+    from
+      temp.since
+  );
+insert into
+  normalised_balance_aud
+select
+  *
+from
+  temp.normalised_balance_aud_since
+order by
+  date,
   account;
-
-
--- Calculate changes required to reach target allocations.
-create table change as
--- Group accounts into asset categories.
-with asset as (
-  select
-    date,
-    latest_balance.asset,
-    price_aud,
-    sum(value_number) as value
-  from
-    latest_balance
-  where
-    -- Don't treat debt as cash.
-    account not like 'Liabilities:StateCustodians:%'
-  group by
-    latest_balance.asset
-),
-total as (
-  select sum(value) as total
-  from asset
-)
+delete from
+  normalised_balance_aud_fingerprint;
+insert into
+  normalised_balance_aud_fingerprint
 select
-  asset.*,
-  target,
-  total,
-  target * total as target_value,
-  value / total as actual,
-  target - value / total as change,
-  target * total - value as change_value,
-  (target * total - value) / price_aud as change_amount
+  *
 from
-  asset
-  join target_allocation on asset.asset = target_allocation.asset
-  join total;
+  temp.entry_fingerprint;
@@ -1,3 +1,8 @@
+import httpx
+
+from portfolio import common
+
+
 class SecretString(str):
     """Obfuscates string in __repr__."""
 
@@ -10,3 +15,22 @@ class SecretDict(dict):
 
     def __repr__(self) -> str:
         return repr({"***": "***"})
+
+
+class MemoryTokenStore(dict):
+    """Token store that keeps tokens in memory."""
+
+    load = dict.get
+    save = dict.__setitem__
+
+    def delete(self, name):
+        self.pop(name, None)
+
+
+def mock_transport(monkeypatch, handler) -> None:
+    """Serves requests of provider clients with handler instead of the network.
+
+    :param monkeypatch: pytest's monkeypatch fixture.
+    :param handler: Function returning an httpx.Response for each httpx.Request.
+    """
+    monkeypatch.setattr(common, "transport", lambda: httpx.MockTransport(handler))
@@ -0,0 +1,101 @@
+import httpx
+import pytest
+
+from portfolio import bankwest, sessions
+from tests import MemoryTokenStore, mock_transport
+
+LOGIN_URL = "https://ibs.bankwest.com.au/Session/PersonalLogin"
+CALLBACK_URL = "https://ibs.bankwest.com.au/signin-oidc"
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """Serves fake Bankwest login pages and banking summary."""
+    server = {"logins": 0, "summaries": 0}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url == LOGIN_URL and request.method == "GET":
+            return httpx.Response(
+                200,
+                html='<input name="__RequestVerificationToken" type="hidden" '
+                'value="token" />',
+            )
+        if request.url == LOGIN_URL:
+            return httpx.Response(
+                200,
+                html=f"<form action='{CALLBACK_URL}'>"
+                "<input name='code' value='code' />"
+                "<input name='scope' value='scope' />"
+                "<input name='state' value='state' />"
+                "<input name='session_state' value='session_state' />",
+            )
+        if request.url == CALLBACK_URL:
+            server["logins"] += 1
+            return httpx.Response(
+                200,
+                headers={"Set-Cookie": "session=new; Domain=.bankwest.com.au; Path=/"},
+            )
+        if request.url == bankwest.SUMMARY_URL:
+            server["summaries"] += 1
+            if request.headers.get("Cookie") != "session=new":
+                # Unauthenticated requests are redirected to the login page.
+                return httpx.Response(302, headers={"Location": LOGIN_URL})
+            return httpx.Response(
+                200,
+                json={
+                    "Accounts": [
+                        {
+                            "AccountNickName": "breeze mastercard",
+                            "AccountCurrentBalance": -10.5,
+                        }
+                    ]
+                },
+            )
+        return httpx.Response(404)
+
+    mock_transport(monkeypatch, handler)
+    return server
+
+
+@pytest.fixture
+def cache():
+    return sessions.SessionCache(MemoryTokenStore(), ttl=60)
+
+
+def save(cache: sessions.SessionCache, value: str) -> None:
+    """Saves Bankwest session with session cookie."""
+    cookies = httpx.Cookies()
+    cookies.set("session", value, domain=".bankwest.com.au", path="/")
+    cache.save("bankwest", cookies)
+
+
+def test_is_authenticated():
+    """Tests only successful JSON responses are authenticated."""
+    assert bankwest._is_authenticated(httpx.Response(200, json={}))
+    assert not bankwest._is_authenticated(httpx.Response(200, html="<html>"))
+    assert not bankwest._is_authenticated(httpx.Response(401, json={}))
+
+
+def test_get_balance_resumes_session(server, cache):
+    """Tests a valid saved session skips the login."""
+    save(cache, "new")
+    balance = bankwest.get_balance("pan", "password", session_cache=cache)
+    assert balance.account == "Liabilities:Bankwest:BreezeMastercard"
+    assert str(balance.amount) == "-10.5 AUD"
+    assert server == {"logins": 0, "summaries": 1}
+
+
+def test_get_balance_logs_in_when_session_invalid(server, cache):
+    """Tests an ended session falls back to the login, and the new session is
+    saved."""
+    save(cache, "ended")
+    balance = bankwest.get_balance("pan", "password", session_cache=cache)
+    assert str(balance.amount) == "-10.5 AUD"
+    assert server == {"logins": 1, "summaries": 2}
+    assert cache.load("bankwest").cookies["session"] == "new"
+
+
+def test_get_balance_without_cache(server):
+    """Tests the login is used without a session cache."""
+    bankwest.get_balance("pan", "password")
+    assert server == {"logins": 1, "summaries": 1}
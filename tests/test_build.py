@@ -0,0 +1,99 @@
+import asyncio
+import json
+import sqlite3
+from pathlib import Path
+
+import pytest
+import yaml
+from datasette import cli
+
+from portfolio import build
+
+from .test_lttb import lttb
+
+DEMO = Path(__file__).parent.parent / "cdk" / "demo-function"
+
+
+@pytest.fixture(autouse=True)
+def cache_dirs(tmp_path, monkeypatch):
+    """Caches parsed entries and builds in temporary directories."""
+    monkeypatch.setenv("PORTFOLIO_ENTRIES_DIR", str(tmp_path / "entries"))
+    monkeypatch.setenv("PORTFOLIO_BUILDS_DIR", str(tmp_path / "builds"))
+
+
+def test_build(tmp_path, monkeypatch):
+    """Tests database is built with the same inspect data as `datasette inspect`."""
+    build.build(
+        DEMO / "demo-portfolio.beancount", DEMO / "target_allocation.sql", tmp_path
+    )
+    monkeypatch.chdir(tmp_path)
+    assert json.loads((tmp_path / "inspect_data.json").read_text()) == asyncio.run(
+        cli.inspect_(["portfolio.db"], None)
+    )
+    connection = sqlite3.connect(tmp_path / "portfolio.db")
+    assert connection.execute("pragma page_size").fetchone() == (build.PAGE_SIZE,)
+    assert not connection.execute(
+        "select name from sqlite_master where name = 'convert_file'"
+    ).fetchall()
+
+
+def test_dashboard_query_plan(tmp_path):
+    """Tests "Asset value over time" reads rollups from their covering indexes."""
+    build.build(
+        DEMO / "demo-portfolio.beancount", DEMO / "target_allocation.sql", tmp_path
+    )
+    connection = sqlite3.connect(tmp_path / "portfolio.db")
+    lttb.prepare_connection(connection)
+    metadata = yaml.safe_load((DEMO / "metadata.yaml").read_text())
+    query = metadata["plugins"]["datasette-dashboards"]["portfolio"]["charts"]["value"][
+        "query"
+    ]
+    # Parameters of dashboard filters that aren't set are empty.
+    parameters = {"date_start": "", "date_end": ""}
+    plan = " ".join(
+        row[3] for row in connection.execute(f"explain query plan {query}", parameters)
+    )
+    assert "normalised_balance_aud" not in plan
+    for rollup in ["daily", "weekly", "monthly"]:
+        assert f"USING COVERING INDEX asset_value_{rollup}_date" in plan
+    # Full history, from the daily rollup, as the demo has fewer dates than lttb()
+    # keeps.
+    assert sorted(connection.execute(query, parameters)) == sorted(
+        connection.execute("select * from asset_value_daily")
+    )
+
+
+def test_build_cached(tmp_path):
+    """Tests unchanged databases are copied from the cache, unless forced."""
+    (tmp_path / "ledger").mkdir()
+    ledger = tmp_path / "ledger" / "portfolio.beancount"
+    ledger.write_text('include "balances.beancount"\n')
+    balances = tmp_path / "ledger" / "balances.beancount"
+    balances.write_text("2024-01-01 open Assets:Cash AUD\n")
+    first, second = tmp_path / "first", tmp_path / "second"
+    first.mkdir()
+    second.mkdir()
+
+    def cached(directory, force=False) -> bool:
+        _, cached = build.build(
+            ledger, DEMO / "target_allocation.sql", directory, force=force
+        )
+        return cached
+
+    assert not cached(first)
+    assert cached(second)
+    for output in build.OUTPUTS:
+        assert (first / output).read_bytes() == (second / output).read_bytes()
+    assert not cached(second, force=True)
+    # Changing an included file changes the key.
+    balances.write_text("2024-01-01 open Assets:Bank AUD\n")
+    assert not cached(second)
+
+
+def test_compile_metadata(tmp_path):
+    """Tests metadata.yaml is compiled to JSON."""
+    (tmp_path / "metadata.yaml").write_text((DEMO / "metadata.yaml").read_text())
+    build.compile_metadata(tmp_path)
+    assert json.loads((tmp_path / "metadata.json").read_text()) == yaml.safe_load(
+        (DEMO / "metadata.yaml").read_text()
+    )
@@ -0,0 +1,92 @@
+import asyncio
+import json
+from pathlib import Path
+
+from datasette.app import Datasette
+
+from .test_precomputed_charts import FUNCTION, directory
+
+QUERY = "/portfolio.json?sql=select+*+from+change+order+by+change+desc&&_shape=objects"
+
+
+def get(
+    directory: Path, path: str, actor: dict | None = None, headers=None, cookies=None
+):
+    """Returns response to request of function, restricted to an actor if given."""
+    metadata = json.loads((directory / "metadata.json").read_text())
+    if actor:
+        metadata["allow"] = actor
+    datasette = Datasette(
+        immutables=["portfolio.db"],
+        inspect_data=json.loads((directory / "inspect_data.json").read_text()),
+        metadata=metadata,
+        plugins_dir=str(FUNCTION / "plugins"),
+        secret="secret",
+    )
+    cookies = dict(cookies or {})
+    if actor:
+        cookies["ds_actor"] = datasette.sign({"a": actor}, "actor")
+    return asyncio.run(datasette.client.get(path, cookies=cookies, headers=headers))
+
+
+def test_public(directory):
+    """Tests pages anyone may view are cached and revalidated."""
+    for path in ["/", "/portfolio/change", QUERY]:
+        response = get(directory, path)
+        assert response.status_code == 200
+        assert (
+            response.headers["cache-control"]
+            == "public, max-age=300, s-maxage=31536000"
+        )
+        etag = response.headers["etag"]
+        assert get(directory, path).headers["etag"] == etag
+        response = get(directory, path, headers={"if-none-match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+    # Different requests get different ETags.
+    assert get(directory, "/").headers["etag"] != get(directory, QUERY).headers["etag"]
+
+
+def test_static(directory):
+    """Tests static assets are cached for longer."""
+    response = get(directory, "/-/static/app.css")
+    assert (
+        response.headers["cache-control"] == "public, max-age=3600, s-maxage=31536000"
+    )
+
+
+def test_authenticated(directory):
+    """Tests pages of a signed-in actor are only cached by CloudFront, per actor."""
+    actor = {"gh_id": "1"}
+    # The first page sets the CSRF token cookie, so isn't cached.
+    response = get(directory, "/portfolio/change", actor)
+    assert response.headers["cache-control"] == "no-store"
+    cookies = {"ds_csrftoken": response.cookies["ds_csrftoken"]}
+
+    response = get(directory, "/portfolio/change", actor, cookies=cookies)
+    assert response.status_code == 200
+    assert "set-cookie" not in response.headers
+    assert (
+        response.headers["cache-control"]
+        == "max-age=0, s-maxage=86400, must-revalidate"
+    )
+    assert (
+        response.headers["etag"] != get(directory, "/portfolio/change").headers["etag"]
+    )
+    response = get(
+        directory,
+        "/portfolio/change",
+        actor,
+        headers={"if-none-match": response.headers["etag"]},
+        cookies=cookies,
+    )
+    assert response.status_code == 304
+
+
+def test_uncached(directory):
+    """Tests errors aren't cached."""
+    response = get(directory, "/missing")
+    assert response.status_code == 404
+    assert response.headers["cache-control"] == "no-store"
+    assert "etag" not in response.headers
@@ -0,0 +1,81 @@
+import http.server
+import threading
+
+import httpx
+import pytest
+
+from portfolio import common
+
+
+@pytest.fixture
+def url():
+    """Serves HTTP requests on localhost in a background thread."""
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_HEAD(self):
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        do_GET = do_HEAD
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_client_shares_connection_pool(url):
+    """Tests closing one client leaves shared connections open for others."""
+    with common.client() as client:
+        client.get(url)
+    connections = list(common.transport()._pool.connections)
+    assert connections
+    with common.client() as client:
+        client.get(url)
+    assert list(common.transport()._pool.connections) == connections
+
+
+def test_preconnect(url):
+    """Tests preconnect leaves an idle connection in the pool."""
+    port = int(url.rsplit(":", 1)[1])
+    common.preconnect([url])
+    assert any(
+        connection._origin.port == port
+        for connection in common.transport()._pool.connections
+    )
+
+
+def test_extract_fields_stops_reading():
+    """Tests response is closed once all fields are found, across chunk boundaries."""
+    chunks = [b"<input name='a' value='", b"1'>", b"<b>2</b>", b"unread"]
+    read = []
+
+    def stream():
+        for chunk in chunks:
+            read.append(chunk)
+            yield chunk
+
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, content=stream()))
+    with httpx.Client(transport=transport) as client:
+        with client.stream("GET", "https://example.com") as response:
+            fields = common.extract_fields(
+                response, {"a": "name='a' value='(.+?)'", "b": "<b>(.+?)</b>"}
+            )
+    assert fields == {"a": "1", "b": "2"}
+    assert b"unread" not in read
+
+
+def test_extract_fields_missing():
+    """Tests missing field is named in error."""
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, text="<a>"))
+    with httpx.Client(transport=transport) as client:
+        with client.stream("GET", "https://example.com") as response:
+            with pytest.raises(common.FieldNotFoundError) as excinfo:
+                common.extract_fields(response, {"a": "<(a)>", "b": "<b>(.+?)</b>"})
+    assert excinfo.value.field == "b"
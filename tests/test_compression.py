@@ -0,0 +1,104 @@
+import asyncio
+import gzip
+import importlib.util
+import json
+import shutil
+from pathlib import Path
+
+import datasette
+import httpx
+from datasette.app import Datasette
+
+from .test_precomputed_charts import FUNCTION, directory
+
+
+def load():
+    """Returns compression plugin module."""
+    spec = importlib.util.spec_from_file_location(
+        "compression", FUNCTION / "plugins" / "compression.py"
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def get(directory: Path, path: str, accept_encoding: str):
+    """Returns response to request of demo function, without decoding its body."""
+    instance = Datasette(
+        immutables=["portfolio.db"],
+        inspect_data=json.loads((directory / "inspect_data.json").read_text()),
+        metadata=json.loads((directory / "metadata.json").read_text()),
+        plugins_dir=str(FUNCTION / "plugins"),
+    )
+
+    async def request():
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=instance.app()),
+            base_url="http://localhost",
+        ) as client:
+            async with client.stream(
+                "GET", path, headers={"accept-encoding": accept_encoding}
+            ) as response:
+                return response, b"".join(
+                    [chunk async for chunk in response.aiter_raw()]
+                )
+
+    return asyncio.run(request())
+
+
+def test_encoding(monkeypatch):
+    """Tests content coding is negotiated from Accept-Encoding."""
+    compression = load()
+    assert compression.encoding("gzip, deflate, br") == (
+        "br" if compression.brotli else "gzip"
+    )
+    monkeypatch.setattr(compression, "brotli", None)
+    assert compression.encoding("gzip, deflate, br") == "gzip"
+    assert compression.encoding("br,gzip") == "gzip"
+    assert compression.encoding("gzip;q=0, deflate") is None
+    assert compression.encoding("") is None
+
+
+def test_compression(directory):
+    """Tests large responses are compressed and small responses aren't."""
+    path = "/portfolio/normalised_balance_aud.json?_shape=array"
+    response, body = get(directory, path, "gzip")
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) == len(body)
+    identity, identity_body = get(directory, path, "identity")
+    assert "content-encoding" not in identity.headers
+    assert gzip.decompress(body) == identity_body
+    assert len(body) < len(identity_body)
+
+    # Pages are compressed too.
+    response, body = get(directory, "/", "gzip")
+    assert response.headers["content-encoding"] == "gzip"
+    assert b"dashboard-grid" in gzip.decompress(body)
+
+    response, body = get(directory, "/portfolio.json?sql=select+1&_shape=array", "gzip")
+    assert "content-encoding" not in response.headers
+    assert json.loads(body) == [{"1": 1}]
+
+
+def test_precompress(tmp_path, monkeypatch):
+    """Tests static assets are precompressed, and served precompressed."""
+    compression = load()
+    monkeypatch.setattr(compression, "brotli", None)
+    static = tmp_path / "datasette" / "static"
+    shutil.copytree(Path(datasette.__file__).parent / "static", static)
+    compression.precompress(tmp_path)
+    assert (
+        gzip.decompress((static / "app.css.gz").read_bytes())
+        == (static / "app.css").read_bytes()
+    )
+    assert not (static / "app.css.gz.gz").exists()
+
+    monkeypatch.setattr(compression, "static_roots", lambda: {"/-/static/": static})
+    assert (
+        compression.precompressed("/-/static/app.css", "gzip")
+        == (static / "app.css.gz").read_bytes()
+    )
+    assert compression.precompressed("/-/static/../static/app.css", "gzip")
+    assert compression.precompressed("/-/static/../../datasette", "gzip") is None
+    assert compression.precompressed("/portfolio", "gzip") is None
@@ -0,0 +1,103 @@
+import sqlite3
+
+import pytest
+
+from portfolio import convert
+
+MAIN = """
+2024-01-01 open Assets:Cash AUD
+include "balances.beancount"
+"""
+
+
+@pytest.fixture
+def ledger(tmp_path, monkeypatch):
+    """Returns main ledger file, including a balances file."""
+    monkeypatch.setenv("PORTFOLIO_ENTRIES_DIR", str(tmp_path / "entries"))
+    (tmp_path / "balances.beancount").write_text(
+        "2024-01-01 balance Assets:Cash 1.00 AUD\n"
+    )
+    filename = tmp_path / "main.beancount"
+    filename.write_text(MAIN)
+    return str(filename)
+
+
+def dump(database) -> list[list[tuple]]:
+    """Returns rows of tables converted from ledger."""
+    connection = sqlite3.connect(database)
+    rows = [
+        connection.execute(f"select * from {table} order by id").fetchall()
+        for table in ["entry", "balance_detail", "price_detail"]
+    ]
+    connection.close()
+    return rows
+
+
+def append(ledger: str, text: str) -> None:
+    """Appends text to balances file."""
+    with open(ledger.replace("main", "balances"), "a") as file:
+        file.write(text)
+
+
+def test_update(ledger, tmp_path):
+    """Tests only appended directives are inserted, as a full rebuild would."""
+    database = tmp_path / "portfolio.db"
+    assert convert.update(ledger, database) == 2
+    append(
+        ledger,
+        "2024-01-02 balance Assets:Cash 2.00 AUD\n2024-01-02 price USD 1.5 AUD\n",
+    )
+    assert convert.update(ledger, database) == 2
+    assert convert.update(ledger, database) == 0
+    convert.rebuild(ledger, tmp_path / "full.db")
+    assert dump(database) == dump(tmp_path / "full.db")
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        # Backdated.
+        "2023-12-31 balance Assets:Cash 2.00 AUD\n",
+        # Not a balance or price.
+        "2024-01-02 open Assets:Bank\n",
+    ],
+)
+def test_update_rebuilds_appended(ledger, tmp_path, text):
+    """Tests ledger is rebuilt when appended directives can't be inserted."""
+    database = tmp_path / "portfolio.db"
+    convert.update(ledger, database)
+    append(ledger, text)
+    assert convert.update(ledger, database) == 3
+
+
+def test_update_same_date(ledger, tmp_path):
+    """Tests entries appended on the latest date are ordered as a rebuild orders
+    them, by line number across files."""
+    (tmp_path / "prices.beancount").write_text(
+        "\n" * 8 + "2024-01-02 price USD 1.5 AUD\n"
+    )
+    with open(ledger, "a") as file:
+        file.write('include "prices.beancount"\n')
+    database = tmp_path / "portfolio.db"
+    convert.update(ledger, database)
+    # Line 2 of balances.beancount sorts before line 9 of prices.beancount.
+    append(ledger, "2024-01-02 price USD 1.7 AUD\n")
+    convert.update(ledger, database)
+    convert.rebuild(ledger, tmp_path / "full.db")
+    assert dump(database) == dump(tmp_path / "full.db")
+    assert [row[2] for row in dump(database)[2]] == [1.7, 1.5]
+    # Entries sorting after every existing entry are inserted incrementally.
+    append(ledger, "2024-01-03 price USD 1.6 AUD\n")
+    assert convert.update(ledger, database) == 1
+    convert.rebuild(ledger, tmp_path / "full.db")
+    assert dump(database) == dump(tmp_path / "full.db")
+
+
+def test_update_rebuilds_changed(ledger, tmp_path):
+    """Tests ledger is rebuilt when an earlier part of a file changes."""
+    database = tmp_path / "portfolio.db"
+    convert.update(ledger, database)
+    balances = tmp_path / "balances.beancount"
+    balances.write_text(balances.read_text().replace("1.00", "3.00"))
+    assert convert.update(ledger, database) == 2
+    assert dump(database)[1][0][2] == 3
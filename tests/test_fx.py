@@ -0,0 +1,75 @@
+import sqlite3
+
+from portfolio import fx
+from portfolio.fx import Price, Rate
+
+
+def test_rates_multiple_hops():
+    """Tests commodities are converted through any number of hops."""
+    prices = [
+        Price("2024-01-01", "USD", 1.5, "AUD"),
+        Price("2024-01-01", "EUR", 1.25, "USD"),
+        Price("2024-01-01", "SAP", 100, "EUR"),
+    ]
+    assert list(fx.rates(prices, ["2024-01-01"])) == [
+        Rate("2024-01-01", "EUR", 1.25 * 1.5, "2024-01-01"),
+        Rate("2024-01-01", "SAP", 100 * (1.25 * 1.5), "2024-01-01"),
+        Rate("2024-01-01", "USD", 1.5, "2024-01-01"),
+    ]
+
+
+def test_rates_reverse():
+    """Tests prices are followed in reverse, but direct prices are preferred."""
+    prices = [Price("2024-01-01", "AUD", 0.5, "USD")]
+    assert list(fx.rates(prices, ["2024-01-01"])) == [
+        Rate("2024-01-01", "USD", 2.0, "2024-01-01")
+    ]
+    prices.append(Price("2024-01-02", "USD", 1.5, "AUD"))
+    assert list(fx.rates(prices, ["2024-01-02"])) == [
+        Rate("2024-01-02", "USD", 1.5, "2024-01-02")
+    ]
+
+
+def test_rates_zero_price():
+    """Tests zero prices are followed, but not in reverse."""
+    prices = [
+        Price("2024-01-01", "OLD", 5, "AUD"),
+        Price("2024-01-02", "OLD", 0, "AUD"),
+        Price("2024-01-02", "NEW", 0, "OLD"),
+    ]
+    assert list(fx.rates(prices, ["2024-01-01", "2024-01-02"])) == [
+        Rate("2024-01-01", "OLD", 5, "2024-01-01"),
+        Rate("2024-01-02", "NEW", 0, "2024-01-02"),
+        Rate("2024-01-02", "OLD", 0, "2024-01-02"),
+    ]
+
+
+def test_rates_shortest_path():
+    """Tests rates use the latest price of each hop on each date."""
+    prices = [
+        Price("2024-01-01", "USD", 1.5, "AUD"),
+        Price("2024-01-01", "IVV", 50, "USD"),
+        Price("2024-01-02", "USD", 1.6, "AUD"),
+        Price("2024-01-03", "IVV", 80, "AUD"),
+    ]
+    assert [
+        rate.rate
+        for rate in fx.rates(prices, ["2024-01-01", "2024-01-02", "2024-01-03"])
+        if rate.currency == "IVV"
+    ] == [50 * 1.5, 50 * 1.6, 80]
+
+
+def test_write():
+    """Tests rate_aud is written for every balance date."""
+    connection = sqlite3.connect(":memory:")
+    connection.executescript("""
+        create table price (id, date, currency, amount_number, amount_currency);
+        insert into price values (1, '2024-01-01', 'USD', 1.5, 'AUD');
+        create table balance (date);
+        insert into balance values ('2024-01-01'), ('2024-01-02');
+        """)
+    fx.write(connection)
+    assert connection.execute("select * from rate_aud").fetchall() == [
+        ("2024-01-01", "USD", 1.5, "2024-01-01"),
+        ("2024-01-02", "USD", 1.5, "2024-01-01"),
+    ]
@@ -0,0 +1,75 @@
+import asyncio
+import http.server
+import importlib.util
+import json
+import shutil
+import threading
+from pathlib import Path
+
+import pytest
+from botocore.exceptions import ClientError
+from datasette.app import Datasette
+
+from benchmarks.handlers import ACTOR, PARAMETERS, SSMHandler, event
+
+from .test_precomputed_charts import FUNCTION, directory
+
+
+class ThrottlingSSMHandler(SSMHandler):
+    """Throttles the first request, then answers as SSMHandler does."""
+
+    failures = 1
+
+    def do_POST(self):
+        if ThrottlingSSMHandler.failures:
+            ThrottlingSSMHandler.failures -= 1
+            self.rfile.read(int(self.headers["Content-Length"]))
+            content = json.dumps(
+                {"__type": "ThrottlingException", "message": "Rate exceeded"}
+            ).encode()
+            self.send_response(400)
+            self.send_header("Content-Type", "application/x-amz-json-1.1")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+            return
+        super().do_POST()
+
+
+def test_handler_retries_parameters(directory, monkeypatch):
+    """Tests a failed SSM request fails only the requests until it's retried."""
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), ThrottlingSSMHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("AWS_ENDPOINT_URL_SSM", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    # Fail on the first throttled request, rather than retrying within it.
+    monkeypatch.setenv("AWS_MAX_ATTEMPTS", "1")
+    # Set by the handler.
+    monkeypatch.setenv("GITHUB_CLIENT_ID", "")
+    monkeypatch.setenv("GITHUB_CLIENT_SECRET", "")
+    cache = Path("/tmp/portfolio-parameters.json")
+    cache.unlink(missing_ok=True)
+    shutil.copy(FUNCTION / "index.py", directory)
+
+    # Importing the handler fetches parameters, as a new Lambda sandbox does.
+    spec = importlib.util.spec_from_file_location("index", directory / "index.py")
+    index = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(index)
+    secret = PARAMETERS["/portfolio/datasette-secret"]
+    cookie = "ds_actor=" + Datasette(secret=secret).sign({"a": ACTOR}, "actor")
+    request = event("/-/versions.json", "edge", cookie)
+    # Mangum runs the application in the current event loop, which a new process has
+    # but earlier tests' asyncio.run() calls unset.
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        with pytest.raises(ClientError, match="ThrottlingException"):
+            index.handler(request, None)
+        response = index.handler(request, None)
+        assert response["status"] == 200
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+        server.shutdown()
+        cache.unlink(missing_ok=True)
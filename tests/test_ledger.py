@@ -0,0 +1,134 @@
+import datetime
+
+from beancount.core.data import Amount, Balance, D, Price
+
+from portfolio import ledger
+from portfolio.scheduler import Result
+
+
+def balance(account: str) -> Balance:
+    return Balance(
+        meta={},
+        date=datetime.date(2024, 1, 1),
+        account=account,
+        amount=Amount(D("1"), "AUD"),
+        tolerance=None,
+        diff_amount=None,
+    )  # type: ignore
+
+
+def test_append(tmp_path):
+    """Tests results are appended in order and failed results are skipped."""
+    filename = tmp_path / "balances.beancount"
+    ledger.append(
+        filename,
+        [
+            Result("B", [balance("Assets:B")], None, 0),
+            Result("Failed", [], ValueError("secret"), 0),
+            Result("A", [balance("Assets:A")], None, 0),
+        ],
+    )
+    text = filename.read_text()
+    assert text.index("Assets:B") < text.index("Assets:A")
+    assert "secret" not in text
+
+
+def test_append_changes_only(tmp_path):
+    """Tests unchanged balances are skipped until keep-alive period passes."""
+    filename = tmp_path / "balances.beancount"
+    index_path = tmp_path / "index.json"
+    filename.write_text("2024-01-01 balance Assets:A  1.00 AUD\n")
+
+    def append(day: int, number: str) -> str:
+        entry = balance("Assets:A")._replace(
+            date=datetime.date(2024, 1, day), amount=Amount(D(number), "AUD")
+        )
+        ledger.append(
+            filename,
+            [Result("A", [entry], None, 0)],
+            changes_only=True,
+            keepalive=7,
+            index_path=index_path,
+        )
+        return filename.read_text()
+
+    # Index is built from ledger, so first unchanged balance is skipped.
+    assert "2024-01-02" not in append(2, "1")
+    assert "2024-01-03" in append(3, "2")
+    assert "2024-01-04" not in append(4, "2")
+    # Unchanged balance is written once keep-alive period has passed.
+    assert "2024-01-10" in append(10, "2")
+
+
+def test_append_changes_only_unchanged(tmp_path):
+    """Tests no balance is written when every balance is unchanged."""
+    filename = tmp_path / "balances.beancount"
+    index_path = tmp_path / "index.json"
+    filename.write_text(
+        "2024-01-01 balance Assets:A  1 AUD\n2024-01-01 balance Assets:B  1 AUD\n"
+    )
+    date = datetime.date(2024, 1, 2)
+    ledger.append(
+        filename,
+        [
+            Result("Failed", [], ValueError(), 0),
+            Result("A", [balance("Assets:A")._replace(date=date)], None, 0),
+            Result("B", [balance("Assets:B")._replace(date=date)], None, 0),
+        ],
+        changes_only=True,
+        index_path=index_path,
+    )
+    assert "2024-01-02" not in filename.read_text()
+
+
+def test_append_changes_only_rebuilds_index(tmp_path):
+    """Tests index is rebuilt when ledger is changed by something else."""
+    filename = tmp_path / "balances.beancount"
+    index_path = tmp_path / "index.json"
+    ledger.append(
+        filename, [Result("A", [balance("Assets:A")], None, 0)], True, 7, index_path
+    )
+    filename.write_text(filename.read_text() + "2024-01-01 balance Assets:A 2 AUD\n")
+    ledger.append(
+        filename, [Result("A", [balance("Assets:A")], None, 0)], True, 7, index_path
+    )
+    assert filename.read_text().count("Assets:A") == 3
+
+
+def test_split_prices():
+    """Tests Price directives are split from balances, keeping failed results with
+    the balances."""
+    price = Price(
+        meta={},
+        date=datetime.date(2024, 1, 1),
+        currency="VDHG",
+        amount=Amount(D("60"), "AUD"),
+    )  # type: ignore
+    failed = Result("Failed", [], ValueError(), 0)
+    balances, prices = ledger.split_prices(
+        [Result("A", [balance("Assets:A"), price], None, 1), failed]
+    )
+    assert balances == [Result("A", [balance("Assets:A")], None, 1), failed]
+    assert prices == [Result("A", [price], None, 1)]
+
+
+def test_append_changes_only_rebuilds_index_same_size(tmp_path):
+    """Tests index is rebuilt when ledger is edited without changing its size."""
+    filename = tmp_path / "balances.beancount"
+    index_path = tmp_path / "index.json"
+
+    def append(number: str) -> None:
+        changed = balance("Assets:B")._replace(amount=Amount(D(number), "AUD"))
+        ledger.append(
+            filename,
+            [Result("A", [balance("Assets:A"), changed], None, 0)],
+            True,
+            7,
+            index_path,
+        )
+
+    append("1")
+    # Assets:A is written first.
+    filename.write_text(filename.read_text().replace("1 AUD", "2 AUD", 1))
+    append("2")
+    assert filename.read_text().count("Assets:A") == 2
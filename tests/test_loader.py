@@ -0,0 +1,58 @@
+import pytest
+from beancount import loader as beancount_loader
+from beancount.parser import parser
+
+from portfolio import loader
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    """Returns main ledger file, including balances and prices files."""
+    (tmp_path / "balances.beancount").write_text(
+        "2024-01-01 balance Assets:Cash 1.00 AUD\n"
+    )
+    (tmp_path / "prices.beancount").write_text("2024-01-01 price USD 1.5 AUD\n")
+    filename = tmp_path / "main.beancount"
+    filename.write_text(
+        "2024-01-01 open Assets:Cash AUD\n"
+        'include "balances.beancount"\n'
+        'include "prices.beancount"\n'
+    )
+    return str(filename)
+
+
+def test_load_file(ledger, tmp_path):
+    """Tests ledger is loaded as Beancount's loader would."""
+    entries, errors, options_map = loader.load_file(ledger, tmp_path / "cache")
+    expected_entries, expected_errors, expected_options_map = (
+        beancount_loader.load_file(ledger)
+    )
+    assert entries == expected_entries
+    assert len(errors) == len(expected_errors)
+    assert options_map["include"] == expected_options_map["include"]
+
+
+def test_load_file_cached(ledger, tmp_path, monkeypatch):
+    """Tests unchanged ledger is loaded without parsing."""
+    entries, _, _ = loader.load_file(ledger, tmp_path / "cache")
+    monkeypatch.setattr(parser, "parse_string", None)
+    assert loader.load_file(ledger, tmp_path / "cache")[0] == entries
+
+
+def test_load_file_changed_include(ledger, tmp_path, monkeypatch):
+    """Tests only a changed include is parsed again."""
+    loader.load_file(ledger, tmp_path / "cache")
+    with open(tmp_path / "prices.beancount", "a") as file:
+        file.write("2024-01-02 price USD 1.6 AUD\n")
+
+    parsed = []
+    parse_string = parser.parse_string
+
+    def parse_string_spy(string, report_filename):
+        parsed.append(report_filename)
+        return parse_string(string, report_filename=report_filename)
+
+    monkeypatch.setattr(parser, "parse_string", parse_string_spy)
+    entries, _, _ = loader.load_file(ledger, tmp_path / "cache")
+    assert parsed == [str(tmp_path / "prices.beancount")]
+    assert len(entries) == 4
@@ -0,0 +1,102 @@
+import importlib.util
+import json
+import math
+import random
+import sqlite3
+
+import pytest
+
+from .test_precomputed_charts import FUNCTION
+
+
+def load():
+    """Returns lttb plugin module."""
+    spec = importlib.util.spec_from_file_location(
+        "lttb", FUNCTION / "plugins" / "lttb.py"
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+lttb = load()
+
+
+def test_downsample():
+    """Tests points forming the largest triangles are kept, as worked by hand."""
+    points = [(0, 0), (1, 1), (2, 0), (3, 5), (4, 0), (5, 1), (6, 0)]
+    assert lttb.downsample(points, 4) == [0, 2, 3, 6]
+    # Series no longer than the threshold are kept whole.
+    assert lttb.downsample(points, 7) == list(range(7))
+    assert lttb.downsample(points[:2], 3) == [0, 1]
+    with pytest.raises(ValueError):
+        lttb.downsample(points, 2)
+
+
+def test_downsample_peaks():
+    """Tests peaks and troughs of a long, noisy series are kept."""
+    generator = random.Random(0)
+    points = [
+        (x, 100 + 10 * math.sin(x / 50) + generator.uniform(-1, 1)) for x in range(5000)
+    ]
+    points[1234] = (1234, 500)
+    points[4321] = (4321, -300)
+    kept = lttb.downsample(points, 300)
+    assert len(kept) == 300
+    assert kept == sorted(set(kept))
+    assert kept[0] == 0 and kept[-1] == 4999
+    assert 1234 in kept and 4321 in kept
+
+
+def test_aggregate():
+    """Tests lttb() downsamples rows in any order, by ISO 8601 date."""
+    connection = sqlite3.connect(":memory:")
+    lttb.prepare_connection(connection)
+    connection.execute("create table value (date, asset, value)")
+    rows = [
+        (f"2024-01-0{day + 1}", asset, value)
+        for asset in ["A", "B"]
+        for day, value in enumerate([0, 1, 0, 5, 0, 1, 0])
+    ]
+    random.Random(0).shuffle(rows)
+    connection.executemany("insert into value values (?, ?, ?)", rows)
+    result = dict(
+        connection.execute(
+            "select asset, lttb(date, value, 4) from value group by asset"
+        ).fetchall()
+    )
+    expected = [
+        ["2024-01-01", 0],
+        ["2024-01-03", 0],
+        ["2024-01-04", 5],
+        ["2024-01-07", 0],
+    ]
+    assert {asset: json.loads(points) for asset, points in result.items()} == {
+        "A": expected,
+        "B": expected,
+    }
+    # Rows are selected by expanding the result with json_each().
+    assert (
+        connection.execute("""
+        select value.* from value
+        where asset = 'A' and date in (
+          select json_extract(point.value, '$[0]')
+          from json_each((select lttb(date, value, 4) from value where asset = 'A'))
+            as point
+        )
+        order by date
+        """).fetchall()
+        == [
+            ("2024-01-01", "A", 0),
+            ("2024-01-03", "A", 0),
+            ("2024-01-04", "A", 5),
+            ("2024-01-07", "A", 0),
+        ]
+    )
+    # SQLite returns null for no rows, and json_each(null) is empty.
+    assert connection.execute(
+        "select lttb(date, value, 4) from value where false"
+    ).fetchone() == (None,)
+    assert connection.execute("select lttb(date, null, 4) from value").fetchone() == (
+        "[]",
+    )
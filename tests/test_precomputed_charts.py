@@ -0,0 +1,80 @@
+import asyncio
+import hashlib
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+from datasette.app import Datasette
+
+from portfolio import build
+
+FUNCTION = Path(__file__).parent.parent / "cdk" / "function"
+DEMO = Path(__file__).parent.parent / "cdk" / "demo-function"
+
+
+@pytest.fixture
+def directory(tmp_path, monkeypatch):
+    """Returns function directory with a database built from the demo ledger."""
+    monkeypatch.setenv("PORTFOLIO_ENTRIES_DIR", str(tmp_path / "entries"))
+    monkeypatch.setenv("PORTFOLIO_BUILDS_DIR", str(tmp_path / "builds"))
+    directory = tmp_path / "function"
+    directory.mkdir()
+    shutil.copy(FUNCTION / "metadata.yaml", directory)
+    shutil.copytree(FUNCTION / "plugins", directory / "plugins")
+    build.build(
+        DEMO / "demo-portfolio.beancount", DEMO / "target_allocation.sql", directory
+    )
+    monkeypatch.chdir(directory)
+    return directory
+
+
+def get(directory: Path, path: str, actor: dict | None, plugins=True):
+    """Returns response to request of function restricted to an actor."""
+    metadata = json.loads((directory / "metadata.json").read_text())
+    metadata["allow"] = {"gh_id": "1"}
+    datasette = Datasette(
+        immutables=["portfolio.db"],
+        inspect_data=json.loads((directory / "inspect_data.json").read_text()),
+        metadata=metadata,
+        plugins_dir=str(FUNCTION / "plugins") if plugins else None,
+        secret="secret",
+    )
+    cookies = {"ds_actor": datasette.sign({"a": actor}, "actor")} if actor else {}
+    return asyncio.run(datasette.client.get(path, cookies=cookies))
+
+
+def test_precomputed_charts(directory):
+    """Tests chart queries are answered from charts.json, as Datasette would."""
+    query = "select * from change order by change desc"
+    path = f"/portfolio.json?sql={query}&&_shape=objects"
+    response = get(directory, path, {"gh_id": "1"})
+    assert response.status_code == 200
+    assert (
+        response.text
+        in json.loads((directory / "charts.json").read_text())["portfolio"].values()
+    )
+    expected = get(directory, path, {"gh_id": "1"}, plugins=False).json()
+    assert {**response.json(), "query_ms": None} == {**expected, "query_ms": None}
+    etag = response.headers["etag"]
+    assert get(directory, path, {"gh_id": "1"}).headers["etag"] == etag
+
+
+def test_precomputed_charts_forbidden(directory):
+    """Tests precomputed results are only served to allowed actors."""
+    query = "select * from change order by change desc"
+    path = f"/portfolio.json?sql={query}&&_shape=objects"
+    assert get(directory, path, None).status_code == 403
+    assert get(directory, path, {"gh_id": "2"}).status_code == 403
+
+
+def test_precomputed_charts_plugins(directory):
+    """Tests chart queries calling plugins' SQL functions, such as lttb(), are
+    precomputed."""
+    metadata = json.loads((directory / "metadata.json").read_text())
+    query = metadata["plugins"]["datasette-dashboards"]["portfolio"]["charts"]["value"][
+        "query"
+    ]
+    assert query in build.chart_queries(metadata, "portfolio")
+    charts = json.loads((directory / "charts.json").read_text())["portfolio"]
+    assert json.loads(charts[hashlib.sha256(query.encode()).hexdigest()])["rows"]
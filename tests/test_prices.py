@@ -0,0 +1,162 @@
+import collections
+import datetime
+import http.server
+import json
+import threading
+import time
+import urllib.parse
+
+import pytest
+from beancount.core.data import D
+
+from portfolio import prices
+
+LEDGER = """
+2024-01-01 commodity AUD
+  price: "USD:yahoo/AUDUSD=X"
+2024-01-01 commodity USD
+  price: "AUD:yahoo/^AUDUSD=X"
+2024-01-01 commodity BTC
+  price: "AUD:yahoo/MISSING,coinbase/BTC-AUD"
+2024-01-01 commodity IVV
+  price: "USD:yahoo/IVV"
+2024-01-01 commodity VDHG
+2024-01-02 price IVV 500 USD
+"""
+
+# Closing prices served for each Yahoo ticker, on 2024-01-01 and 2024-01-02.
+CLOSES = {"AUDUSD=X": ("USD", [0.625, 0.5]), "IVV": ("USD", [480.5, 490.25])}
+
+
+@pytest.fixture
+def url():
+    """Serves fake Yahoo and Coinbase API responses on localhost."""
+    requests = collections.Counter()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urllib.parse.urlparse(self.path)
+            requests[url.path] += 1
+            ticker = url.path.split("/")[-1]
+            if url.path.startswith("/v8/finance/chart/") and ticker in CLOSES:
+                currency, closes = CLOSES[ticker]
+                body = {
+                    "chart": {
+                        "result": [
+                            {
+                                "meta": {"currency": currency, "gmtoffset": 36000},
+                                # 10 am on each date in UTC+10.
+                                "timestamp": [1704067200, 1704153600],
+                                "indicators": {"quote": [{"close": closes}]},
+                            }
+                        ]
+                    }
+                }
+            elif url.path == "/v2/prices/BTC-AUD/spot":
+                assert url.query == "date=2024-01-02"
+                body = {"data": {"amount": "65000.01", "currency": "AUD"}}
+            else:
+                self.send_error(404)
+                return
+            content = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}", requests
+    server.shutdown()
+
+
+def test_parse_metadata():
+    """Tests bean-price's metadata format is parsed."""
+    assert prices.parse_metadata(
+        "BTC", "AUD:coinbase/BTC-AUD,beanprice.sources.yahoo/BTC-AUD USD:yahoo/^X"
+    ) == [
+        prices.Job(
+            "BTC", "AUD", [("coinbase", "BTC-AUD", False), ("yahoo", "BTC-AUD", False)]
+        ),
+        prices.Job("BTC", "USD", [("yahoo", "X", True)]),
+    ]
+
+
+def test_fetch_without_sources(capsys):
+    """Tests a job without sources fails with an error naming the commodity."""
+    (job,) = prices.parse_metadata("BTC", "AUD:")
+    assert job == prices.Job("BTC", "AUD", [])
+    fetcher = prices._Fetcher({}, None, datetime.date(2024, 1, 2))
+    with pytest.raises(ValueError, match="BTC has no price sources for AUD"):
+        fetcher.price(job)
+    assert prices.fetch([job], datetime.date(2024, 1, 2)) == []
+    assert "Failed to fetch BTC price in AUD (ValueError)." in capsys.readouterr().out
+
+
+def test_update(url, tmp_path, monkeypatch):
+    """Tests prices are fetched from each source and appended in order."""
+    monkeypatch.setenv("PORTFOLIO_ENTRIES_DIR", str(tmp_path / "entries"))
+    url, requests = url
+    filename = tmp_path / "portfolio.beancount"
+    filename.write_text(LEDGER)
+    prices_filename = tmp_path / "prices.beancount"
+    prices.update(
+        str(filename),
+        str(prices_filename),
+        datetime.date(2024, 1, 2),
+        {"yahoo": prices.Yahoo(url), "coinbase": prices.Coinbase(url)},
+    )
+    assert [line.split() for line in prices_filename.read_text().splitlines()] == [
+        ["2024-01-02", "price", "AUD", "0.5", "USD"],
+        ["2024-01-02", "price", "USD", "2", "AUD"],
+        ["2024-01-02", "price", "BTC", "65000.01", "AUD"],
+    ]
+    # Shared ticker is fetched once, and IVV was already priced.
+    assert requests == {
+        "/v8/finance/chart/AUDUSD=X": 1,
+        "/v8/finance/chart/MISSING": 1,
+        "/v2/prices/BTC-AUD/spot": 1,
+    }
+
+
+def test_source_abstract():
+    """Tests sources must implement get_price() to be created."""
+
+    class Source(prices.Source):
+        pass
+
+    with pytest.raises(TypeError, match="get_price"):
+        Source()
+
+
+def test_fetch_limit():
+    """Tests concurrent requests to each source are limited."""
+
+    class Source(prices.Source):
+        limit = 2
+
+        def __init__(self):
+            self.running = 0
+            self.most_running = 0
+            self.lock = threading.Lock()
+
+        def get_price(self, client, ticker, date):
+            with self.lock:
+                self.running += 1
+                self.most_running = max(self.most_running, self.running)
+            time.sleep(0.05)
+            with self.lock:
+                self.running -= 1
+            return D(1), None
+
+    source = Source()
+    jobs = [prices.Job(f"C{i}", "AUD", [("test", f"C{i}", False)]) for i in range(6)]
+    (result,) = prices.fetch(jobs, datetime.date(2024, 1, 2), {"test": source})
+    assert [price.currency for price in result.entries] == [
+        job.currency for job in jobs
+    ]
+    assert source.most_running == 2
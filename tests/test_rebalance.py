@@ -0,0 +1,137 @@
+import importlib.util
+import sqlite3
+
+import pytest
+
+from .test_precomputed_charts import FUNCTION, directory, get
+
+
+def load():
+    """Returns rebalance plugin module."""
+    spec = importlib.util.spec_from_file_location(
+        "rebalance", FUNCTION / "plugins" / "rebalance.py"
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+rebalance = load()
+
+HOLDINGS = [
+    {"asset": "VDHG", "price_aud": 100, "value": 6000, "target": 0.7},
+    {"asset": "BTC", "price_aud": 100000, "value": 3000, "target": 0.2},
+    {"asset": "Cash", "price_aud": 1, "value": 1000, "target": 0.1},
+]
+
+
+def test_rebalance():
+    """Tests actions are rounded to whole units, except BTC."""
+    result = rebalance.rebalance(HOLDINGS, contribution=1000)
+    assert result["total"] == 11000
+    actions = {action["asset"]: action for action in result["actions"]}
+    # 0.7 * 11000 - 6000 = 1700, buying 17 units.
+    assert actions["VDHG"]["action"] == "buy"
+    assert actions["VDHG"]["amount"] == 17
+    # 0.2 * 11000 - 3000 = -800, selling 0.008 BTC.
+    assert actions["BTC"]["action"] == "sell"
+    assert actions["BTC"]["amount"] == 0.008
+    # Cash is never bought or sold.
+    assert actions["Cash"]["action"] is None
+    # In order of the change in weight, as the rebalance chart is.
+    assert [action["asset"] for action in result["actions"]] == [
+        "VDHG",
+        "BTC",
+        "Cash",
+    ]
+
+
+def test_rebalance_target():
+    """Tests target weights are overridden, and must sum to 1."""
+    result = rebalance.rebalance(HOLDINGS, target={"VDHG": 0.6, "BTC": 0.3})
+    assert result["target"] == {"VDHG": 0.6, "BTC": 0.3, "Cash": 0.1}
+    assert all(action["action"] is None for action in result["actions"])
+    with pytest.raises(ValueError, match="sum to 1.1"):
+        rebalance.rebalance(HOLDINGS, target={"VDHG": 0.8})
+    with pytest.raises(ValueError, match="Unknown assets: ETH"):
+        rebalance.rebalance(HOLDINGS, target={"ETH": 0})
+    with pytest.raises(ValueError, match="Withdrawal"):
+        rebalance.rebalance(HOLDINGS, contribution=-10000)
+    assert rebalance.parse_target("VDHG:0.6, BTC:0.3") == {"VDHG": 0.6, "BTC": 0.3}
+    with pytest.raises(ValueError):
+        rebalance.parse_target("VDHG")
+
+
+def test_scenarios():
+    """Tests each row of a batch matches the scenario evaluated alone."""
+    targets = [{}, {"VDHG": 0.6, "BTC": 0.3}]
+    results = rebalance.scenarios(HOLDINGS, [0, 1000, -500], targets)
+    assert [
+        (result["contribution"], result["target"]["BTC"]) for result in results
+    ] == [
+        (0, 0.2),
+        (1000, 0.2),
+        (-500, 0.2),
+        (0, 0.3),
+        (1000, 0.3),
+        (-500, 0.3),
+    ]
+    assert results == [
+        rebalance.rebalance(HOLDINGS, contribution, target)
+        for target in targets
+        for contribution in [0, 1000, -500]
+    ]
+    actions = {action["asset"]: action for action in results[4]["actions"]}
+    # 0.3 * 11000 - 3000 = 300, buying 0.003 BTC.
+    assert actions["BTC"]["action"] == "buy"
+    assert actions["BTC"]["amount"] == 0.003
+    assert actions["BTC"]["value"] == 300
+
+
+def test_rebalance_view(directory):
+    """Tests every combination of contributions and targets is evaluated, and the
+    default scenario matches the change table."""
+    response = get(
+        directory,
+        "/-/rebalance.json?contribution=0&contribution=5000"
+        "&target=VDHG:0.64&target=VDHG:0.54,Cash:0.2",
+        {"gh_id": "1"},
+    )
+    assert response.status_code == 200
+    scenarios = response.json()["scenarios"]
+    assert [
+        (scenario["contribution"], scenario["target"]["Cash"]) for scenario in scenarios
+    ] == [(0, 0.1), (5000, 0.1), (0, 0.2), (5000, 0.2)]
+    connection = sqlite3.connect(directory / "portfolio.db")
+    change = dict(
+        connection.execute(
+            "select asset, round(change_amount, iif(asset = 'BTC', 4, 0)) from change"
+        )
+    )
+    assert {
+        action["asset"]: action["amount"] * (-1 if action["action"] == "sell" else 1)
+        for action in scenarios[0]["actions"]
+    } == change
+    # The contribution is added to the total, and more is bought.
+    assert scenarios[1]["total"] == pytest.approx(scenarios[0]["total"] + 5000)
+    amounts = [
+        {action["asset"]: action["amount"] for action in scenario["actions"]}
+        for scenario in scenarios[:2]
+    ]
+    assert amounts[1]["VDHG"] > amounts[0]["VDHG"]
+
+
+def test_rebalance_view_errors(directory):
+    """Tests invalid scenarios and other actors are refused."""
+    for query in [
+        "contribution=lots",
+        "contribution=nan",
+        "target=VDHG:0.9",
+        "target=ETH:0",
+        "&".join(["contribution=1"] * (rebalance.MAX_SCENARIOS + 1)),
+    ]:
+        response = get(directory, f"/-/rebalance.json?{query}", {"gh_id": "1"})
+        assert response.status_code == 400
+        assert not response.json()["ok"]
+    assert get(directory, "/-/rebalance.json", {"gh_id": "2"}).status_code == 403
+    assert get(directory, "/-/rebalance.json", None).status_code == 403
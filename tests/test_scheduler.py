@@ -0,0 +1,64 @@
+import time
+
+from portfolio import scheduler
+
+
+def test_fetch_returns_results_in_provider_order():
+    """Tests results are ordered by provider, not by completion time."""
+
+    def slow():
+        time.sleep(0.2)
+        return ["slow"]
+
+    results = scheduler.fetch((("slow", slow), ("fast", lambda: ["fast"])))
+    assert [result.name for result in results] == ["slow", "fast"]
+    assert [result.entries for result in results] == [["slow"], ["fast"]]
+
+
+def test_fetch_elapsed():
+    """Tests each provider's elapsed time is measured when it finishes, not when
+    its result is collected."""
+    results = scheduler.fetch(
+        (("slow", lambda: time.sleep(0.2) or []), ("fast", lambda: []))
+    )
+    assert results[0].elapsed >= 0.2
+    assert results[1].elapsed < 0.1
+
+
+def test_fetch_runs_providers_concurrently():
+    """Tests total duration is close to the slowest provider's duration."""
+    start = time.monotonic()
+    scheduler.fetch(
+        (name, lambda: time.sleep(0.2) or []) for name in ("a", "b", "c", "d")
+    )
+    assert time.monotonic() - start < 0.4
+
+
+def test_fetch_provider_timeout():
+    """Tests provider that exceeds its timeout does not block other providers."""
+    results = scheduler.fetch(
+        (("stuck", lambda: time.sleep(10)), ("ok", lambda: ["ok"])), timeout=0.1
+    )
+    assert isinstance(results[0].error, TimeoutError)
+    assert results[0].entries == []
+    assert results[1].entries == ["ok"]
+
+
+def test_fetch_deadline():
+    """Tests overall deadline applies even when provider timeout is longer."""
+    start = time.monotonic()
+    results = scheduler.fetch(
+        (("stuck", lambda: time.sleep(10)),), timeout=10, deadline=0.1
+    )
+    assert time.monotonic() - start < 1
+    assert isinstance(results[0].error, TimeoutError)
+
+
+def test_fetch_provider_error():
+    """Tests provider exception is captured in result."""
+
+    def fail():
+        raise ValueError
+
+    (result,) = scheduler.fetch((("fail", fail),))
+    assert isinstance(result.error, ValueError)
@@ -0,0 +1,99 @@
+import json
+
+import httpx
+import pytest
+from beancount.core.data import Price
+
+from portfolio import selfwealth
+from tests import MemoryTokenStore, mock_transport
+
+
+def holding(code: str, units: float, price: float, market: int) -> dict:
+    return {
+        "Code": code,
+        "TotalUnits": units,
+        "Price": price,
+        "IsCash": code in selfwealth.CASH_CODES,
+        "ProductMarketGroupId": market,
+    }
+
+
+@pytest.fixture(autouse=True)
+def api(monkeypatch):
+    """Serves fake SelfWealth token, portfolio and holdings responses."""
+    holdings = {
+        "1": [
+            holding("CASH", 100, 1, 1),
+            holding("US CASH", 10, 1, 2),
+            holding("VDHG", 5, 66.37, 1),
+            holding("AAPL", 2, 230.5, 2),
+        ],
+        "2": [holding("CASH", 50, 1, 1), holding("VDHG", 1, 66.37, 1)],
+    }
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/connect/token":
+            return httpx.Response(
+                200,
+                json={
+                    "access_token": "access",
+                    "token_type": "Bearer",
+                    "expires_in": 3600,
+                    "refresh_token": "rotated",
+                },
+            )
+        if request.url.path == "/api/v4/Mobile/portfolios":
+            return httpx.Response(
+                200,
+                json={
+                    "data": {
+                        "portfolios": [
+                            {"portfolioId": 1, "tradingStatusId": 1},
+                            {"portfolioId": 2, "tradingStatusId": 1},
+                            {"portfolioId": 3, "tradingStatusId": 0},
+                        ]
+                    }
+                },
+            )
+        return httpx.Response(
+            200, content=json.dumps(holdings[request.url.params["PortfolioId"]])
+        )
+
+    mock_transport(monkeypatch, handler)
+
+
+def test_get_balances_with_refresh_token():
+    """Tests saved refresh token is used and rotated token is saved."""
+    token_store = MemoryTokenStore(selfwealth={"refresh_token": "saved"})
+    selfwealth.get_balances("email", "password", "otp", token_store=token_store)
+    assert token_store["selfwealth"]["refresh_token"] == "rotated"
+
+
+def test_get_balances_sums_portfolios():
+    """Tests holdings of all trading portfolios are summed."""
+    token_store = MemoryTokenStore(selfwealth={"refresh_token": "saved"})
+    balances = selfwealth.get_balances(
+        "email", "password", "otp", token_store=token_store
+    )
+    assert {
+        balance.account: balance.amount.number for balance in balances
+    } == {
+        "Assets:SelfWealth:AUD": 150,
+        "Assets:SelfWealth:USD": 10,
+        "Assets:SelfWealth:VDHG": 6,
+        "Assets:SelfWealth:AAPL": 2,
+    }
+
+
+def test_get_balances_prices():
+    """Tests Price directives are in the currency of each security's market."""
+    token_store = MemoryTokenStore(selfwealth={"refresh_token": "saved"})
+    entries = selfwealth.get_balances(
+        "email", "password", "otp", token_store=token_store, prices=True
+    )
+    prices = {
+        entry.currency: str(entry.amount)
+        for entry in entries
+        if isinstance(entry, Price)
+    }
+    assert prices == {"VDHG": "66.37 AUD", "AAPL": "230.5 USD"}
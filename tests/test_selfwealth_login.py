@@ -0,0 +1,136 @@
+import json
+
+import httpx
+import pytest
+from authlib.integrations.httpx_client import OAuth2Client
+
+from portfolio import common, selfwealth
+from tests import MemoryTokenStore, mock_transport
+
+AUTH_URL = "https://auth.selfwealth.com.au"
+
+
+def token(refresh_token: str) -> httpx.Response:
+    return httpx.Response(
+        200,
+        json={
+            "access_token": "access",
+            "token_type": "Bearer",
+            "expires_in": 3600,
+            "refresh_token": refresh_token,
+        },
+    )
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """Serves fake SelfWealth login flow, token and portfolio responses.
+
+    Only the "saved" refresh token is accepted.
+    """
+    server = {"logins": 0, "refreshes": 0}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        url = str(request.url.copy_with(query=None))
+        if url == f"{AUTH_URL}/connect/authorize":
+            server["state"] = request.url.params["state"]
+            return httpx.Response(
+                200,
+                html='<input name="__aft" type="hidden" value="aft" />'
+                "ReturnUrl: '/connect/authorize/callback',",
+            )
+        if url == f"{AUTH_URL}/api/auth/GetCaptchaStatus":
+            return httpx.Response(200, json=False)
+        if url == f"{AUTH_URL}/api/login":
+            assert request.headers["X-XSRF-TOKEN"] == "aft"
+            return httpx.Response(200, json={"Result": 6})
+        if url == f"{AUTH_URL}/api/loginTwoFactor":
+            assert json.loads(request.content)["TwoFactorCode"] == "otp"
+            return httpx.Response(200, json={"Result": 13})
+        if url == f"{AUTH_URL}/connect/authorize/callback":
+            server["logins"] += 1
+            return httpx.Response(
+                302,
+                headers={
+                    "Location": "au.com.selfwealth://callback?code=code&state="
+                    + server["state"]
+                },
+            )
+        if url == selfwealth.TOKEN_URL:
+            form = dict(httpx.QueryParams(request.content.decode()))
+            if form["grant_type"] == "authorization_code":
+                return token("interactive")
+            server["refreshes"] += 1
+            if form["refresh_token"] == "unavailable":
+                return httpx.Response(502, html="<h1>502 Bad Gateway</h1>")
+            if form["refresh_token"] != "saved":
+                return httpx.Response(400, json={"error": "invalid_grant"})
+            return token("rotated")
+        return httpx.Response(200, json={"data": {"portfolios": []}})
+
+    mock_transport(monkeypatch, handler)
+    return server
+
+
+@pytest.fixture
+def oauth2_client():
+    return common.client(OAuth2Client, client_id="mobile")
+
+
+def test_refresh(server, oauth2_client):
+    """Tests client is authenticated with saved refresh token."""
+    token_store = MemoryTokenStore(selfwealth={"refresh_token": "saved"})
+    assert selfwealth._refresh(oauth2_client, token_store)
+    assert oauth2_client.token["refresh_token"] == "rotated"
+
+
+def test_refresh_rejected(server, oauth2_client):
+    """Tests a rejected refresh token doesn't authenticate client."""
+    token_store = MemoryTokenStore(selfwealth={"refresh_token": "revoked"})
+    assert not selfwealth._refresh(oauth2_client, token_store)
+    assert server["refreshes"] == 1
+
+
+def test_refresh_without_token(server, oauth2_client):
+    """Tests nothing is requested without a saved refresh token."""
+    assert not selfwealth._refresh(oauth2_client, None)
+    assert not selfwealth._refresh(oauth2_client, MemoryTokenStore())
+    assert not selfwealth._refresh(
+        oauth2_client, MemoryTokenStore(selfwealth={"access_token": "access"})
+    )
+    assert server["refreshes"] == 0
+
+
+def test_get_balances_skips_login(server):
+    """Tests a saved refresh token skips the interactive login."""
+    token_store = MemoryTokenStore(selfwealth={"refresh_token": "saved"})
+    selfwealth.get_balances("email", "password", "otp", token_store=token_store)
+    assert server["logins"] == 0
+    assert token_store["selfwealth"]["refresh_token"] == "rotated"
+
+
+def test_get_balances_logs_in_when_refresh_rejected(server):
+    """Tests a rejected refresh token falls back to the interactive login, and the
+    new token is saved."""
+    token_store = MemoryTokenStore(selfwealth={"refresh_token": "revoked"})
+    selfwealth.get_balances("email", "password", "otp", token_store=token_store)
+    assert server["refreshes"] == 1
+    assert server["logins"] == 1
+    assert token_store["selfwealth"]["refresh_token"] == "interactive"
+
+
+def test_get_balances_logs_in_when_refresh_fails(server):
+    """Tests a non-JSON error response to the refresh falls back to the
+    interactive login."""
+    token_store = MemoryTokenStore(selfwealth={"refresh_token": "unavailable"})
+    selfwealth.get_balances("email", "password", "otp", token_store=token_store)
+    assert server["refreshes"] == 1
+    assert server["logins"] == 1
+    assert token_store["selfwealth"]["refresh_token"] == "interactive"
+
+
+def test_get_balances_without_token_store(server):
+    """Tests the interactive login is used without a token store."""
+    selfwealth.get_balances("email", "password", "otp")
+    assert server["refreshes"] == 0
+    assert server["logins"] == 1
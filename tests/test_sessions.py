@@ -0,0 +1,45 @@
+import time
+
+import httpx
+import pytest
+
+from portfolio import sessions
+from tests import MemoryTokenStore
+
+
+@pytest.fixture
+def cache():
+    return sessions.SessionCache(MemoryTokenStore(), ttl=60)
+
+
+def test_save_load(cache):
+    """Tests cookies and state survive a save and load."""
+    cookies = httpx.Cookies()
+    cookies.set("session", "value", domain="example.com", path="/")
+    cache.save("example", cookies, state={"key": "value"})
+    session = cache.load("example")
+    assert session.cookies.get("session", domain="example.com") == "value"
+    assert session.state == {"key": "value"}
+
+
+def test_load_expired(cache, monkeypatch):
+    """Tests sessions older than their time to live are not loaded."""
+    cache.save("example", httpx.Cookies())
+    saved_at = cache.load("example").saved_at
+    monkeypatch.setattr(time, "time", lambda: saved_at + 61)
+    assert cache.load("example") is None
+
+
+def test_dump_cookies_skips_expired_cookies():
+    """Tests expired cookies are not saved."""
+    cookies = httpx.Cookies()
+    cookies.set("session", "value", domain="example.com")
+    next(iter(cookies.jar)).expires = int(time.time()) - 1
+    assert sessions.dump_cookies(cookies) == []
+
+
+def test_delete(cache):
+    """Tests deleted sessions are not loaded."""
+    cache.save("example", httpx.Cookies())
+    cache.delete("example")
+    assert cache.load("example") is None
@@ -0,0 +1,144 @@
+import sqlite3
+
+import pytest
+from beancount import loader
+from beancount.scripts import sql
+
+from portfolio import tables
+
+LEDGER = """
+2024-01-01 open Assets:Cash
+2024-01-01 open Assets:Shares
+2024-01-01 open Assets:Vanguard:Super
+2024-01-01 price USD 1.50 AUD
+2024-01-01 price VAS 90.00 AUD
+2024-01-01 price IVV 50.00 USD
+2024-01-01 balance Assets:Cash 100.00 AUD
+2024-01-01 balance Assets:Shares 10 VAS
+2024-01-02 price USD 1.60 AUD
+2024-01-02 balance Assets:Vanguard:Super 1000.00 AUD
+2024-01-03 balance Assets:Cash 50.00 USD
+2024-01-03 balance Assets:Shares 3 IVV
+"""
+
+
+@pytest.fixture
+def connection():
+    """Returns connection to database converted from ledger by bean-sql."""
+    entries, _, _ = loader.load_string(LEDGER)
+    connection = sqlite3.connect(":memory:")
+    sql.setup_decimal_support()
+    for function in [sql.output_common, sql.BalanceWriter(), sql.PriceWriter()]:
+        function(connection, entries)
+    connection.executescript("""
+        create table target_allocation (asset, target);
+        insert into target_allocation values ('Cash', 0.5), ('VDHG', 0.5);
+        """)
+    return connection
+
+
+def insert(connection: sqlite3.Connection, id: int, date: str, type: str, *detail):
+    """Inserts entry as bean-sql would."""
+    connection.execute(
+        "insert into entry values (?, ?, ?, 'test', 0)", (id, date, type)
+    )
+    connection.execute(
+        f"insert into {type}_detail values (?, {', '.join('?' * len(detail))})",
+        (id,) + detail,
+    )
+
+
+def test_materialise(connection):
+    """Tests balances are carried forward and valued with rates to AUD."""
+    tables.materialise(connection)
+    rows = connection.execute("""
+        select date, account, value_number, asset from normalised_balance_aud
+        order by date, account
+        """).fetchall()
+    assert rows[:2] == [
+        ("2024-01-01", "Assets:Cash", 100, "Cash"),
+        ("2024-01-01", "Assets:Shares", 900, "VAS"),
+    ]
+    # USD price on 2024-01-02 converts IVV price from 2024-01-01.
+    assert ("2024-01-03", "Assets:Shares", 3 * 50 * 1.6, "IVV") in rows
+    assert ("2024-01-03", "Assets:Vanguard:Super", 1000, "VDHG") in rows
+    assert len(rows) == 2 + 3 + 3
+    assert connection.execute("select count(*) from change").fetchone() == (2,)
+
+
+def test_materialise_incremental(connection):
+    """Tests new and backdated entries give the same rows as a full rebuild."""
+    tables.materialise(connection)
+    # New date.
+    insert(
+        connection, 100, "2024-01-04", "balance", "Assets:Cash", 75, "AUD", None, None
+    )
+    tables.materialise(connection)
+    assert tables.verify(connection) == []
+    # Backdated price changes values of later dates.
+    insert(connection, 101, "2024-01-02", "price", "VAS", 95, "AUD")
+    tables.materialise(connection)
+    assert tables.verify(connection) == []
+    assert connection.execute("""
+        select value_number from normalised_balance_aud
+        where date = '2024-01-02' and account = 'Assets:Shares'
+        """).fetchone() == (950,)
+
+
+def test_materialise_price_date(connection):
+    """Tests balances are valued on dates with only a price entry, after the first
+    balance entry."""
+    insert(connection, 100, "2023-12-31", "price", "VAS", 80, "AUD")
+    insert(connection, 101, "2024-01-04", "price", "USD", 1.7, "AUD")
+    tables.materialise(connection)
+    assert tables.verify(connection) == []
+    assert connection.execute(
+        "select min(date), max(date) from normalised_balance_aud"
+    ).fetchone() == ("2024-01-01", "2024-01-04")
+    assert connection.execute("""
+        select value_number from latest_balance where account = 'Assets:Cash'
+        """).fetchone() == (50 * 1.7,)
+
+
+def test_verify(connection):
+    """Tests rows differing from a full rebuild are reported."""
+    tables.materialise(connection)
+    connection.execute(
+        "update normalised_balance_aud set value_number = 0 where date = '2024-01-02'"
+    )
+    assert len(tables.verify(connection)) == 2 * 3
+
+
+def test_rollups(connection):
+    """Tests weekly and monthly rollups keep the last date of each period."""
+    insert(
+        connection, 100, "2024-01-08", "balance", "Assets:Cash", 75, "AUD", None, None
+    )
+    insert(
+        connection, 101, "2024-02-01", "balance", "Assets:Cash", 25, "AUD", None, None
+    )
+    tables.materialise(connection)
+
+    def dates(table: str) -> list[str]:
+        return [
+            date
+            for (date,) in connection.execute(
+                f"select distinct date from {table} order by date"
+            )
+        ]
+
+    assert dates("asset_value_daily") == [
+        "2024-01-01",
+        "2024-01-02",
+        "2024-01-03",
+        "2024-01-08",
+        "2024-02-01",
+    ]
+    # Weeks end on Sunday.
+    assert dates("asset_value_weekly") == ["2024-01-03", "2024-01-08", "2024-02-01"]
+    assert dates("asset_value_monthly") == ["2024-01-08", "2024-02-01"]
+    # Assets not in the target allocation are left out.
+    assert connection.execute("""
+        select asset, value, rank from asset_value_monthly
+        where date = '2024-01-08' order by asset
+        """).fetchall() == [("Cash", 75, 1), ("VDHG", 1000, 2)]
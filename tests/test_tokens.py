@@ -0,0 +1,37 @@
+import pytest
+
+from portfolio import tokens
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # Speed up key derivation for tests.
+    monkeypatch.setattr(tokens.EncryptedFileTokenStore, "iterations", 1)
+    return tokens.EncryptedFileTokenStore("secret", tmp_path)
+
+
+def test_save_load(store):
+    """Tests saved token is loaded and not stored in plain text."""
+    token = {"access_token": "access", "refresh_token": "refresh"}
+    store.save("selfwealth", token)
+    assert store.load("selfwealth") == token
+    assert b"refresh" not in (store.directory / "selfwealth.token").read_bytes()
+
+
+def test_load_missing(store):
+    """Tests loading a token that was never saved."""
+    assert store.load("selfwealth") is None
+
+
+def test_load_wrong_secret(store):
+    """Tests token encrypted with a different secret is treated as missing."""
+    store.save("selfwealth", {"refresh_token": "refresh"})
+    store.secret = b"different"
+    assert store.load("selfwealth") is None
+
+
+def test_delete(store):
+    """Tests deleted token is no longer loaded."""
+    store.save("selfwealth", {"refresh_token": "refresh"})
+    store.delete("selfwealth")
+    assert store.load("selfwealth") is None
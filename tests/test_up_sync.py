@@ -0,0 +1,109 @@
+import datetime
+import json
+
+import httpx
+import pytest
+
+from portfolio import up
+from tests import mock_transport
+
+
+def account(balance: str) -> dict:
+    return {
+        "id": "account",
+        "attributes": {
+            "displayName": "Spending",
+            "accountType": "TRANSACTIONAL",
+            "balance": {"currencyCode": "AUD", "value": balance},
+        },
+    }
+
+
+def transaction(id: str, created_at: str, value: str) -> dict:
+    return {
+        "id": id,
+        "attributes": {"createdAt": created_at, "amount": {"value": value}},
+    }
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """Serves fake Up API responses, split into pages of one resource."""
+    resources = {
+        "/api/v1/accounts": [
+            account("100.00"),
+            {"id": "saver", "attributes": {"accountType": "SAVER"}},
+        ],
+        "/api/v1/accounts/account/transactions": [
+            transaction("3", "2024-01-05T09:00:00+10:00", "-10.00"),
+            transaction("2", "2024-01-03T09:00:00+10:00", "-5.00"),
+            transaction("1", "2024-01-01T09:00:00+10:00", "-1.00"),
+        ],
+    }
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        data = resources[request.url.path]
+        index = int(request.url.params.get("index", 0))
+        next = None
+        if index + 1 < len(data):
+            next = str(request.url.copy_set_param("index", index + 1))
+        return httpx.Response(
+            200, json={"data": data[index : index + 1], "links": {"next": next}}
+        )
+
+    mock_transport(monkeypatch, handler)
+    monkeypatch.setattr(
+        up,
+        "queensland_now",
+        lambda: datetime.datetime.fromisoformat("2024-01-06T12:00:00+10:00"),
+    )
+    return requests
+
+
+def test_get_balances_follows_pages(api):
+    """Tests accounts on later pages are included."""
+    (balance,) = up.get_balances(token="token")
+    assert balance.account == "Assets:Up:Spending"
+    assert [request.url.path for request in api] == ["/api/v1/accounts"] * 2
+
+
+def test_sync(api, tmp_path):
+    """Tests daily balances are backfilled from transactions since last sync."""
+    state_path = tmp_path / "up.json"
+    state_path.write_text(
+        json.dumps(
+            {
+                "account": {
+                    "created_at": "2024-01-01T09:00:00+10:00",
+                    "transaction_id": "1",
+                    "synced_on": "2024-01-01",
+                }
+            }
+        )
+    )
+    balances = up.sync(token="token", state_path=state_path)
+    assert [(str(b.date), str(b.amount.number)) for b in balances] == [
+        ("2024-01-02", "115.00"),
+        ("2024-01-03", "110.00"),
+        ("2024-01-04", "110.00"),
+        ("2024-01-05", "100.00"),
+        ("2024-01-06", "100.00"),
+    ]
+    assert json.loads(state_path.read_text())["account"] == {
+        "created_at": "2024-01-05T09:00:00+10:00",
+        "transaction_id": "3",
+        "synced_on": "2024-01-06",
+    }
+
+
+def test_sync_first_run(api, tmp_path):
+    """Tests first sync saves a high-water mark without fetching transactions."""
+    state_path = tmp_path / "up.json"
+    (balance,) = up.sync(token="token", state_path=state_path)
+    assert str(balance.date) == "2024-01-06"
+    assert "/api/v1/accounts/account/transactions" not in {
+        request.url.path for request in api
+    }
+    assert json.loads(state_path.read_text())["account"]["transaction_id"] is None
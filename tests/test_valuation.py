@@ -0,0 +1,71 @@
+import sqlite3
+from pathlib import Path
+
+from beancount import loader
+from beancount.scripts import sql
+
+from portfolio import tables, valuation
+
+DEMO = Path(__file__).parent.parent / "cdk" / "demo-function"
+
+
+def convert(entries: list) -> sqlite3.Connection:
+    """Returns connection to database converted from entries as bean-sql would."""
+    connection = sqlite3.connect(":memory:")
+    sql.setup_decimal_support()
+    for function in [sql.output_common, sql.BalanceWriter(), sql.PriceWriter()]:
+        function(connection, entries)
+    connection.executescript((DEMO / "target_allocation.sql").read_text())
+    return connection
+
+
+def dump(connection: sqlite3.Connection) -> list[list[tuple]]:
+    """Returns rows of valuation tables, including storage classes."""
+    return [
+        connection.execute(
+            f"select *, {', '.join(f'typeof({column})' for column in columns)} "
+            f"from {table} order by {order}"
+        ).fetchall()
+        for table, columns, order in [
+            ("normalised_balance_aud", ["price_aud", "value_number"], "date, account"),
+            ("latest_balance", ["price_aud", "value_number"], "account"),
+            ("change", ["change_amount"], "asset"),
+        ]
+    ]
+
+
+def test_write_matches_tables_sql():
+    """Tests valuation tables are identical to those materialised by tables.sql."""
+    entries, _, _ = loader.load_file(DEMO / "demo-portfolio.beancount")
+    expected = convert(entries)
+    tables.materialise(expected)
+    actual = convert(entries)
+    valuation.write(actual, entries)
+    assert dump(actual) == dump(expected)
+
+
+def test_write_matches_tables_sql_price_date():
+    """Tests dates with only a price entry are valued as by tables.sql."""
+    entries, _, _ = loader.load_string(
+        "2023-12-31 price USD 1.40 AUD\n"
+        "2024-01-01 open Assets:Cash\n"
+        "2024-01-01 balance Assets:Cash 50.00 USD\n"
+        "2024-01-01 price USD 1.50 AUD\n"
+        "2024-01-05 price USD 1.60 AUD\n"
+    )
+    expected = convert(entries)
+    tables.materialise(expected)
+    actual = convert(entries)
+    valuation.write(actual, entries)
+    assert dump(actual) == dump(expected)
+    assert [row[0] for row in valuation.value(entries)] == ["2024-01-01", "2024-01-05"]
+
+
+def test_value_without_prices():
+    """Tests balances are valued at face value when there are no prices."""
+    entries, _, _ = loader.load_string(
+        "2024-01-01 open Assets:Cash\n2024-01-01 balance Assets:Cash 1.50 AUD\n"
+    )
+    assert valuation.value(entries) == [
+        ("2024-01-01", "Assets:Cash", 1.5, "AUD", 1, 1.5, "AUD", "Cash", None)
+    ]